@@ -0,0 +1,152 @@
+"""静态文件与响应压缩。
+
+scripts/build_static.py 把 static/ 下的文件按内容哈希重命名（styles.css → styles.<哈希>.css），
+生成预压缩的 .gz（安装了 brotli 时还有 .br）并预渲染页面，结果写到 build/，文件名对照表为 build/manifest.json。
+服务时：
+- 带哈希的文件内容不会变化，返回 Cache-Control: immutable，浏览器不再重新请求；
+- 按请求的 Accept-Encoding 直接返回预压缩的文件（br 优先，其次 gzip），请求时不再压缩；
+- 没有构建时回退到 static/ 下的原文件（no-cache，浏览器按 ETag 重新验证）。
+其它响应（页面、JSON）超过 1 KB 时按请求 gzip 压缩；事件流逐条推送，不压缩。
+"""
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import re
+from functools import lru_cache
+from mimetypes import guess_type
+from pathlib import Path
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+try:
+    import brotli
+except ImportError:  # 可选依赖：没有时只生成 gzip
+    brotli = None
+
+SOURCE_DIR = Path("static")
+BUILD_DIR = Path(os.getenv("BUILD_DIR", "build"))
+MANIFEST_PATH = BUILD_DIR / "manifest.json"
+
+# (Accept-Encoding 中的名称, 预压缩文件后缀)，按优先顺序
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+COMPRESSIBLE = {".css", ".js", ".html", ".svg", ".json", ".txt", ".map"}
+FINGERPRINT_LENGTH = 10
+_FINGERPRINTED = re.compile(rf"\.[0-9a-f]{{{FINGERPRINT_LENGTH}}}\.[^./]+$")
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# 小于这个大小的响应压缩收益很小
+MINIMUM_COMPRESS_SIZE = 1024
+# 事件流：压缩会把多条事件缓冲在一起
+UNCOMPRESSED_PATHS = ("/api/stream/",)
+
+
+@lru_cache(maxsize=1)
+def manifest() -> dict[str, str]:
+    """原文件名 -> 带哈希的文件名；没有构建时为空"""
+    try:
+        return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def static_url(name: str) -> str:
+    """页面中引用静态文件的地址：构建后为带哈希的文件名"""
+    return f"/static/{manifest().get(name, name)}"
+
+
+def compress(data: bytes) -> dict[str, bytes]:
+    """各种编码的压缩结果（只保留比原文小的）"""
+    out = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        out["br"] = brotli.compress(data, quality=11)
+    return {k: v for k, v in out.items() if len(v) < len(data)}
+
+
+def accepted_encodings(header: str) -> set[str]:
+    """Accept-Encoding 中可以使用的编码（忽略 q=0）"""
+    out = set()
+    for part in header.split(","):
+        token, _, params = part.partition(";")
+        q = params.strip().replace(" ", "")
+        if q.startswith("q=") and not q[2:].strip("0."):
+            continue
+        if token.strip():
+            out.add(token.strip().lower())
+    return out
+
+
+def choose_encoding(header: str, available) -> Optional[str]:
+    accepted = accepted_encodings(header)
+    for name, _suffix in ENCODINGS:
+        if name in available and name in accepted:
+            return name
+    return None
+
+
+class StaticAssets(StaticFiles):
+    """先找 build/static（带哈希、预压缩），再找 static/"""
+
+    def __init__(self) -> None:
+        super().__init__(directory=SOURCE_DIR)
+        built = BUILD_DIR / "static"
+        if built.is_dir():
+            self.all_directories = [built, *self.all_directories]
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        full_path = str(full_path)
+        variants = {
+            name: f"{full_path}{suffix}"
+            for name, suffix in ENCODINGS
+            if os.path.isfile(f"{full_path}{suffix}")
+        }
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""), variants)
+        path = variants[encoding] if encoding else full_path
+        response = FileResponse(
+            path,
+            status_code=status_code,
+            stat_result=os.stat(path) if encoding else stat_result,
+            media_type=guess_type(full_path)[0] or "text/plain",
+        )
+        if encoding:
+            response.headers["content-encoding"] = encoding
+        if variants:
+            response.headers["vary"] = "Accept-Encoding"
+        fingerprinted = _FINGERPRINTED.search(os.path.basename(full_path))
+        response.headers["cache-control"] = IMMUTABLE if fingerprinted else REVALIDATE
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding gzip 压缩响应；已设置 Content-Encoding 的（预压缩文件）原样返回，事件流不压缩"""
+
+    def __init__(self, app, minimum_size: int = MINIMUM_COMPRESS_SIZE) -> None:
+        self.app = app
+        # 压缩级别 6：比默认的 9 省 CPU，体积相差很小
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=6)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] == "http"
+            and not scope["path"].startswith(UNCOMPRESSED_PATHS)
+            and "gzip" in accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        ):
+            await self.gzip(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
@@ -0,0 +1,243 @@
+"""批量写入：一次请求里混合新增 / 删除多种记录，在同一个事务中完成。
+
+先校验全部操作（任何一条无效则整批不写入），再按类型批量删除、批量插入（每张表一次 flush），
+最后统一维护派生数据：现货按币种排序后增量更新快照（乱序或有删除时排队后台重建，同一币种合并为一个任务），
+机器人 / 投入的日汇总每个 (币种, 天) / 天只重算一次，每类数据的版本号只加一次。
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ValidationError
+from sqlmodel import Session, SQLModel, select
+
+from .cache import BOTS, INVESTMENTS, SPOT, SPOT_REWRITES, bump_versions
+from .history import refresh_bot_rollup, refresh_investment_rollup
+from .importer import _format_validation_error
+from .jobs import enqueue_spot_rebuild, record_spot_trade_deferred
+from .models import (
+    DEFAULT_PORTFOLIO,
+    Bot,
+    ContractBot,
+    Investment,
+    InvestmentPair,
+    SpotTrade,
+    Symbol,
+)
+from .schemas import (
+    BatchOperation,
+    BotCreate,
+    ContractBotCreate,
+    InvestmentCreate,
+    InvestmentPairCreate,
+    SpotTradeCreate,
+    SymbolCreate,
+)
+from .services import spot_trade_values
+from .tradestore import trade_store
+
+
+@dataclass(frozen=True)
+class _Entity:
+    model: type[SQLModel]
+    create: type[BaseModel]
+    # 所属数据（版本号 / 推送主题），币种、机器人名称等不分组合的记录为 None
+    table: Optional[str] = None
+    topic: Optional[str] = None
+
+
+ENTITIES = {
+    "symbol": _Entity(Symbol, SymbolCreate),
+    "bot": _Entity(Bot, BotCreate),
+    "spot_trade": _Entity(SpotTrade, SpotTradeCreate, SPOT, "spot"),
+    "contract_bot": _Entity(ContractBot, ContractBotCreate, BOTS, "bots"),
+    "investment": _Entity(Investment, InvestmentCreate, INVESTMENTS, "investments"),
+    "investment_pair": _Entity(
+        InvestmentPair, InvestmentPairCreate, INVESTMENTS, "investments"
+    ),
+}
+
+
+@dataclass
+class BatchReport:
+    # 与操作一一对应：新增为新记录（币种 / 机器人名称已存在时为原记录）的 id，删除为被删除的 id
+    ids: list[Optional[int]] = field(default_factory=list)
+    jobs: list[int] = field(default_factory=list)
+    topics: set[str] = field(default_factory=set)
+
+
+def _invalid(index: int, message: str, status_code: int = 422) -> HTTPException:
+    return HTTPException(
+        status_code=status_code, detail=[{"index": index, "error": message}]
+    )
+
+
+def _validate(ops: list[BatchOperation]) -> list[Optional[BaseModel]]:
+    payloads: list[Optional[BaseModel]] = []
+    for i, op in enumerate(ops):
+        if op.op == "delete":
+            if op.id is None:
+                raise _invalid(i, "delete requires id")
+            payloads.append(None)
+            continue
+        if op.data is None:
+            raise _invalid(i, "create requires data")
+        try:
+            payloads.append(ENTITIES[op.type].create.model_validate(op.data))
+        except ValidationError as e:
+            raise _invalid(i, _format_validation_error(e))
+    return payloads
+
+
+def _new_row(kind: str, payload, portfolio_id: int) -> SQLModel:
+    """与各自的新增接口相同的默认值和规范化"""
+    if kind == "spot_trade":
+        return SpotTrade(portfolio_id=portfolio_id, **spot_trade_values(payload))
+    if kind == "contract_bot":
+        return ContractBot(
+            portfolio_id=portfolio_id,
+            symbol=payload.symbol.upper(),
+            profit=payload.profit,
+            closed_at=payload.closed_at or datetime.utcnow(),
+            note=payload.note,
+        )
+    if kind == "investment":
+        return Investment(
+            portfolio_id=portfolio_id,
+            currency=payload.currency.upper(),
+            amount=payload.amount,
+            invested_at=payload.invested_at or datetime.utcnow(),
+            note=payload.note,
+        )
+    return InvestmentPair(
+        portfolio_id=portfolio_id,
+        amount_usdt=payload.amount_usdt,
+        amount_myr=payload.amount_myr,
+        invested_at=payload.invested_at or datetime.utcnow(),
+        note=payload.note,
+    )
+
+
+def _named(session: Session, model, attr: str, names: set[str]) -> dict[str, int]:
+    """币种 / 机器人名称：已存在的直接返回，不存在的新建（一次查询 + 一次插入）"""
+    col = getattr(model, attr)
+    ids = dict(session.exec(select(col, model.id).where(col.in_(names))).all())
+    new = [model(**{attr: n}) for n in sorted(names - ids.keys())]
+    session.add_all(new)
+    session.flush()
+    ids.update({getattr(r, attr): r.id for r in new})
+    return ids
+
+
+def apply_batch(
+    session: Session,
+    ops: list[BatchOperation],
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> BatchReport:
+    """执行一批操作（不提交）；任何一条无效时抛出 HTTPException，调用方不提交即全部撤销"""
+    payloads = _validate(ops)
+    report = BatchReport(ids=[None] * len(ops))
+
+    # 币种 / 机器人名称
+    for kind, model, attr in (("symbol", Symbol, "symbol"), ("bot", Bot, "name")):
+        wanted = {
+            i: (p.symbol.upper() if kind == "symbol" else p.name).strip()
+            for i, (op, p) in enumerate(zip(ops, payloads))
+            if op.type == kind and op.op == "create"
+        }
+        if wanted:
+            ids = _named(session, model, attr, set(wanted.values()))
+            for i, name in wanted.items():
+                report.ids[i] = ids[name]
+
+    # 删除：每种类型一次查询
+    deleted: dict[str, list[SQLModel]] = {}
+    for kind, entity in ENTITIES.items():
+        wanted = {
+            i: op.id for i, op in enumerate(ops) if op.type == kind and op.op == "delete"
+        }
+        if not wanted:
+            continue
+        model = entity.model
+        rows = {
+            r.id: r
+            for r in session.exec(
+                select(model).where(model.id.in_(set(wanted.values())))
+            ).all()
+        }
+        for i, row_id in wanted.items():
+            row = rows.get(row_id)
+            if row is None or (
+                entity.table is not None and row.portfolio_id != portfolio_id
+            ):
+                raise _invalid(i, f"{kind} {row_id} not found", 404)
+            report.ids[i] = row_id
+        for row in rows.values():
+            session.delete(row)
+        deleted[kind] = list(rows.values())
+
+    # 新增：每张表一次 flush（批量 INSERT）
+    created: dict[str, list[SQLModel]] = {}
+    pending: list[tuple[int, SQLModel]] = []
+    for i, (op, payload) in enumerate(zip(ops, payloads)):
+        if op.op != "create" or ENTITIES[op.type].table is None:
+            continue
+        try:
+            row = _new_row(op.type, payload, portfolio_id)
+        except ValueError as e:
+            raise _invalid(i, str(e))
+        pending.append((i, row))
+        created.setdefault(op.type, []).append(row)
+    session.add_all(row for _, row in pending)
+    session.flush()
+    for i, row in pending:
+        report.ids[i] = row.id
+
+    # 派生数据
+    trades = sorted(
+        created.get("spot_trade", []),
+        key=lambda t: (t.traded_at.replace(tzinfo=None), t.id),
+    )
+    for row in deleted.get("spot_trade", []):
+        job = enqueue_spot_rebuild(
+            session, row.symbol, (row.traded_at, row.id), portfolio_id
+        )
+        report.jobs.append(job.id)
+    for trade in trades:
+        job = record_spot_trade_deferred(session, trade)
+        if job is not None:
+            report.jobs.append(job.id)
+
+    bots = (*deleted.get("contract_bot", []), *created.get("contract_bot", []))
+    bot_days = {(r.symbol, r.closed_at.date()): r.closed_at for r in bots}
+    for (symbol, _day), closed_at in bot_days.items():
+        refresh_bot_rollup(session, symbol, closed_at, portfolio_id)
+
+    invest_days = {
+        r.invested_at.date(): r.invested_at
+        for kind in ("investment", "investment_pair")
+        for r in (*deleted.get(kind, []), *created.get(kind, []))
+    }
+    for invested_at in invest_days.values():
+        refresh_investment_rollup(session, invested_at, portfolio_id)
+
+    touched = {
+        ENTITIES[kind]
+        for kind in (*deleted, *created)
+        if ENTITIES[kind].table is not None
+    }
+    tables = sorted({e.table for e in touched})
+    if deleted.get("spot_trade"):
+        tables.append(SPOT_REWRITES)
+    if tables:
+        bump_versions(session, *tables, portfolio_id=portfolio_id)
+    if SPOT in tables:
+        trade_store.stage(
+            session, portfolio_id, added=trades, removed=deleted.get("spot_trade", [])
+        )
+    report.topics = {e.topic for e in touched}
+    report.jobs = sorted(set(report.jobs))
+    return report
@@ -0,0 +1,165 @@
+"""汇总接口的缓存：以数据版本号为键，配合 ETag / If-None-Match 返回 304。
+
+版本号保存在数据库的 TableVersion 表中（而不是进程内存），
+所以多个 uvicorn worker 共用同一个数据库时，任一进程的写入都会让所有进程的缓存失效。
+每类数据除了全局版本号（跨组合汇总使用）外，每个组合还有自己的版本号 "表名:组合id"，
+写入某个组合只会让该组合和跨组合汇总的缓存失效；不分组合的重建（启动校验、清空脚本）加 "表名:*"，
+所有组合的缓存都失效。价格等不分组合的数据只有全局版本号。
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+from sqlalchemy import insert, update
+from sqlmodel import Session
+
+from .database import run_in_session
+from .encoding import dumps
+from .metrics import span
+from .models import TableVersion
+
+SPOT = "spottrade"
+BOTS = "contractbot"
+INVESTMENTS = "investment"
+PORTFOLIOS = "portfolio"
+PRICES = "price"
+# 删除或原地修改现货成交时与 SPOT 一起加一：只有新增可以按 id 增量追赶（见 tradestore.py），
+# 这个版本号变化时读取方整组重新加载
+SPOT_REWRITES = "spottrade_rewrite"
+
+# 不分组合的数据
+GLOBAL_TABLES = (PORTFOLIOS, PRICES)
+
+# 各汇总依赖的数据
+SUMMARY_TABLES = {
+    "spot": (SPOT, PRICES),
+    "bots": (BOTS,),
+    "overall": (SPOT, BOTS, INVESTMENTS, PRICES),
+    "history": (SPOT, BOTS, INVESTMENTS),
+    "portfolios": (SPOT, BOTS, INVESTMENTS, PORTFOLIOS),
+}
+
+MAX_ENTRIES = 256
+
+
+def _scoped(name: str, portfolio_id: Optional[int]) -> tuple[str, ...]:
+    """某个组合的汇总需要比对的版本号"""
+    if portfolio_id is None or name in GLOBAL_TABLES:
+        return (name,)
+    return (f"{name}:*", f"{name}:{portfolio_id}")
+
+
+def bump_versions(session, *names: str, portfolio_id: Optional[int] = None) -> None:
+    """在当前事务内把版本号加一（session 或 connection 均可）。
+
+    指定 portfolio_id 时加该组合和全局的版本号；不指定（比如启动时重建）则加全局和所有组合共用的版本号。
+    """
+    for name in names:
+        keys = [name]
+        if name not in GLOBAL_TABLES:
+            keys.append(f"{name}:{'*' if portfolio_id is None else portfolio_id}")
+        for key in keys:
+            res = session.execute(
+                update(TableVersion)
+                .where(TableVersion.name == key)
+                .values(version=TableVersion.version + 1)
+            )
+            if res.rowcount == 0:
+                session.execute(insert(TableVersion).values(name=key, version=1))
+
+
+def current_versions(
+    session, names: tuple[str, ...], portfolio_id: Optional[int] = None
+) -> tuple[int, ...]:
+    keys = [k for n in names for k in _scoped(n, portfolio_id)]
+    rows = dict(
+        session.execute(
+            TableVersion.__table__.select()
+            .with_only_columns(TableVersion.name, TableVersion.version)
+            .where(TableVersion.name.in_(keys))
+        ).all()
+    )
+    return tuple(rows.get(k, 0) for k in keys)
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = MAX_ENTRIES) -> None:
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+summary_cache = LRUCache()
+
+
+def _etag(key: Hashable, versions: tuple[int, ...]) -> str:
+    digest = hashlib.sha1(repr((key, versions)).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in (t.strip() for t in if_none_match.split(","))
+
+
+def _render(compute: Callable[[Session], object], session: Session) -> bytes:
+    with span("compute"):
+        result = compute(session)
+    with span("serialize"):
+        if isinstance(result, BaseModel):
+            result = result.model_dump(mode="json")
+        return dumps(result)
+
+
+async def cached_summary(
+    request: Request,
+    session,
+    summary: str,
+    params: tuple,
+    compute: Callable[[Session], object],
+    portfolio_id: Optional[int] = None,
+) -> Response:
+    """按 (汇总名, 组合, 参数, 版本号) 缓存序列化后的 JSON；客户端带着相同 ETag 请求时返回 304。
+
+    portfolio_id 为空表示跨组合的汇总，使用全局版本号。版本号在异步 session 上读取，
+    命中缓存或 304 时不离开事件循环；未命中时 compute(session) 和序列化在线程池中用同步 session 执行。
+    """
+    versions = await session.run_sync(
+        lambda s: current_versions(s, SUMMARY_TABLES[summary], portfolio_id)
+    )
+    key = (summary, portfolio_id, params)
+    etag = _etag(key, versions)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = summary_cache.get((key, versions))
+    if body is None:
+        body = await run_in_session(lambda s: _render(compute, s))
+        summary_cache.put((key, versions), body)
+    return Response(content=body, media_type="application/json", headers=headers)
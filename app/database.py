@@ -1,8 +1,11 @@
 from pathlib import Path
-from typing import Generator
+from typing import AsyncGenerator, Callable, Generator, TypeVar
+import asyncio
 import os
+import threading
 
-from sqlmodel import SQLModel, create_engine, Session
+from sqlalchemy import event
+from sqlmodel import create_engine, Session
 
 # Determine database URL from env or default to local SQLite
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -19,73 +22,158 @@ else:
 		DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
 	CONNECT_ARGS = {}
 
-engine = create_engine(DATABASE_URL, connect_args=CONNECT_ARGS)
+# Connection pool settings (mainly for Postgres; SQLite connections are cheap)
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") not in ("0", "false", "no")
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+if DATABASE_URL.startswith("sqlite"):
+	POOL_ARGS = {}
+else:
+	POOL_ARGS = {
+		"pool_size": POOL_SIZE,
+		"max_overflow": MAX_OVERFLOW,
+		"pool_pre_ping": POOL_PRE_PING,
+		"pool_recycle": POOL_RECYCLE,
+	}
+
+engine = create_engine(DATABASE_URL, connect_args=CONNECT_ARGS, **POOL_ARGS)
+
+# Opt-in SQLite tuning (SQLITE_TUNED=1): WAL lets readers run while a write is in
+# progress, synchronous=NORMAL is durable in WAL mode except on power loss
+SQLITE_TUNED = os.getenv("SQLITE_TUNED", "0").lower() in ("1", "true", "yes")
+SQLITE_PRAGMAS = (
+	"PRAGMA journal_mode=WAL",
+	"PRAGMA synchronous=NORMAL",
+	"PRAGMA busy_timeout=5000",
+	"PRAGMA mmap_size=268435456",
+	"PRAGMA cache_size=-65536",
+	"PRAGMA temp_store=MEMORY",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_conn, _record) -> None:
+	cur = dbapi_conn.cursor()
+	for pragma in SQLITE_PRAGMAS:
+		cur.execute(pragma)
+	cur.close()
+
+
+def _tune(sync_engine) -> None:
+	if SQLITE_TUNED and sync_engine.dialect.name == "sqlite":
+		event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+
+
+_tune(engine)
+
+
+def _async_url(url: str) -> str:
+	if url.startswith("sqlite:"):
+		return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+	if url.startswith("postgresql:"):
+		return url.replace("postgresql:", "postgresql+asyncpg:", 1)
+	return url
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Async engine for the read endpoints (aiosqlite locally, asyncpg on Postgres);
+# created on first use so the sync-only scripts don't need the async drivers
+_async_engine = None
+
+
+def get_async_engine():
+	global _async_engine
+	if _async_engine is None:
+		from sqlalchemy.ext.asyncio import create_async_engine
+
+		_async_engine = create_async_engine(
+			ASYNC_DATABASE_URL, connect_args=CONNECT_ARGS, **POOL_ARGS
+		)
+		_tune(_async_engine.sync_engine)
+	return _async_engine
 
 
 def init_db() -> None:
-	SQLModel.metadata.create_all(engine)
-	_run_migrations()
-
-
-def _run_migrations() -> None:
-	# lightweight migrations for SQLite/Postgres
-	with engine.connect() as conn:
-		# spottrade.fee_currency
-		try:
-			res = conn.exec_driver_sql("PRAGMA table_info('spottrade')")
-			cols = {row[1] for row in res.fetchall()}
-			if "fee_currency" not in cols:
-				conn.exec_driver_sql(
-					"ALTER TABLE spottrade ADD COLUMN fee_currency VARCHAR DEFAULT 'quote'"
-				)
-		except Exception:
-			try:
-				res = conn.exec_driver_sql(
-					"""
-						SELECT column_name FROM information_schema.columns
-						WHERE table_name = 'spottrade'
-					"""
-				)
-				cols = {r[0] for r in res.fetchall()}
-				if "fee_currency" not in cols:
-					conn.exec_driver_sql(
-						"ALTER TABLE spottrade ADD COLUMN fee_currency VARCHAR DEFAULT 'quote'"
-					)
-			except Exception:
-				pass
-
-		# contractbot.bot_name
-		try:
-			res = conn.exec_driver_sql("PRAGMA table_info('contractbot')")
-			cols = {row[1] for row in res.fetchall()}
-			if "bot_name" not in cols:
-				conn.exec_driver_sql(
-					"ALTER TABLE contractbot ADD COLUMN bot_name VARCHAR"
-				)
-		except Exception:
-			try:
-				res = conn.exec_driver_sql(
-					"""
-						SELECT column_name FROM information_schema.columns
-						WHERE table_name = 'contractbot'
-					"""
-				)
-				cols = {r[0] for r in res.fetchall()}
-				if "bot_name" not in cols:
-					conn.exec_driver_sql(
-						"ALTER TABLE contractbot ADD COLUMN bot_name VARCHAR"
-					)
-			except Exception:
-				pass
-
-		# ensure investmentpair table exists by attempting a simple select
-		try:
-			conn.exec_driver_sql("SELECT 1 FROM investmentpair LIMIT 1")
-		except Exception:
-			# create table via metadata
-			SQLModel.metadata.create_all(engine)
+	"""Bring the schema up to date; a single version check when it already is (see migrations.py)"""
+	from .migrations import ensure_schema
+
+	ensure_schema()
+
+
+# Fast start (FAST_START=1): skip database preparation at startup and run it on the
+# first request that needs the database, so the process can answer health checks
+# as soon as it is listening
+FAST_START = os.getenv("FAST_START", "0").lower() in ("1", "true", "yes")
+
+# Work done once before the database is first used (schema check, derived-data sync,
+# background workers); the app registers its own, scripts only need init_db
+_prepare: Callable[[], None] = init_db
+_ready = threading.Event()
+_ready_lock = threading.Lock()
+
+
+def on_first_use(fn: Callable[[], None]) -> Callable[[], None]:
+	"""Register the preparation step run by ensure_db_ready (usable as a decorator)"""
+	global _prepare
+	_prepare = fn
+	return fn
+
+
+def db_ready() -> bool:
+	return _ready.is_set()
+
+
+def ensure_db_ready(force: bool = False) -> None:
+	"""Run the preparation step once (again if force); concurrent callers wait for it,
+	a failure is retried by the next caller"""
+	if _ready.is_set() and not force:
+		return
+	with _ready_lock:
+		if force or not _ready.is_set():
+			_prepare()
+			_ready.set()
+
+
+async def wait_for_db() -> None:
+	"""Dependency for endpoints that reach the database without a session dependency"""
+	if not _ready.is_set():
+		await asyncio.to_thread(ensure_db_ready)
 
 
 def get_session() -> Generator[Session, None, None]:
+	ensure_db_ready()
 	with Session(engine) as session:
 		yield session
+
+
+T = TypeVar("T")
+
+
+async def run_in_session(fn: Callable[[Session], T]) -> T:
+	"""Run fn(session) with a sync session on the request threadpool: for reads whose
+	Python work (replay, paging, serialization) would otherwise block the event loop"""
+	from starlette.concurrency import run_in_threadpool
+
+	def call() -> T:
+		ensure_db_ready()
+		with Session(engine) as session:
+			return fn(session)
+
+	return await run_in_threadpool(call)
+
+
+async def get_async_session() -> AsyncGenerator:
+	from sqlmodel.ext.asyncio.session import AsyncSession
+
+	await wait_for_db()
+	async with AsyncSession(get_async_engine(), expire_on_commit=False) as session:
+		yield session
+
+
+async def dispose_async_engine() -> None:
+	global _async_engine
+	if _async_engine is not None:
+		await _async_engine.dispose()
+		_async_engine = None
@@ -0,0 +1,46 @@
+"""JSON 响应编码。
+
+默认用标准库 json，参数与 FastAPI 的 JSONResponse 相同，输出与按 response_model 序列化逐字节一致。
+设置 JSON_ENCODER=orjson 且安装了 orjson 时改用 orjson（快数倍）：解析后的结果相同，
+但输出不再逐字节一致，极大/极小浮点数的写法不同（json 为 1e-05，orjson 为 0.00001）。
+"""
+from __future__ import annotations
+
+import json
+import os
+from datetime import date, datetime
+from typing import Any, Optional
+
+from fastapi import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 是可选依赖
+    orjson = None
+
+USE_ORJSON = orjson is not None and os.getenv("JSON_ENCODER", "json").lower() == "orjson"
+
+
+def _default(obj: Any) -> str:
+    # 与 Pydantic / jsonable_encoder 对不带时区时间的输出一致
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj: Any) -> bytes:
+    if USE_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(
+        obj,
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+        default=_default,
+    ).encode("utf-8")
+
+
+def json_response(body: bytes, headers: Optional[dict] = None) -> Response:
+    """直接返回已编码的 JSON，跳过 response_model 的再次校验和序列化"""
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,261 @@
+"""汇总数据的 Server-Sent Events 推送。
+
+写接口在提交后调用 summary_feed.notify(..., portfolio_id=...)；后台任务合并短时间内的多次通知，
+只重新计算受影响的组合和汇总（订阅同一组合的所有订阅者共用一次计算），再把差异推送给该组合的订阅者。
+其它进程的写入（别的 worker、命令行导入、价格脚本）不会调用 notify：缓存的汇总记下计算时的数据版本号
+（与 cache.cached_summary 相同），有订阅者时定期比对，新订阅时也先比对再使用。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Iterable, Optional
+
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from .cache import SUMMARY_TABLES, current_versions
+from .database import engine
+from .models import DEFAULT_PORTFOLIO
+from .services import bots_profit_summary, overall_totals, spot_overall_summary
+
+# 每个写入主题会影响的汇总
+TOPIC_SECTIONS = {
+    "spot": ("spot", "overall"),
+    "bots": ("bots", "overall"),
+    "investments": ("overall",),
+    "prices": ("spot", "overall"),
+}
+SECTIONS = ("spot", "bots", "overall")
+
+QUEUE_SIZE = 16
+DEBOUNCE_SECONDS = 0.05
+KEEPALIVE_SECONDS = 15.0
+# 有订阅者时比对数据版本号的间隔；计算失败的汇总也在下一次比对时重试
+POLL_SECONDS = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+def _section_versions(session, portfolio_id: int, sections: Iterable[str]) -> dict:
+    return {
+        s: current_versions(session, SUMMARY_TABLES[s], portfolio_id) for s in sections
+    }
+
+
+def _read_versions(portfolio_ids: Iterable[int]) -> dict[int, dict]:
+    with Session(engine) as session:
+        return {pid: _section_versions(session, pid, SECTIONS) for pid in portfolio_ids}
+
+
+def _compute(portfolio_id: int, sections: set[str]) -> tuple[dict, dict]:
+    """返回 (各汇总的数据版本号, 汇总)"""
+    out = {}
+    with Session(engine) as session:
+        # 先读版本号：计算期间有新的写入时记下的版本号偏旧，下次比对会再算一次
+        versions = _section_versions(session, portfolio_id, sections)
+        if "spot" in sections:
+            out["spot"] = spot_overall_summary(
+                session, portfolio_id=portfolio_id
+            ).model_dump(mode="json")
+        if "bots" in sections:
+            out["bots"] = bots_profit_summary(
+                session, portfolio_id=portfolio_id
+            ).model_dump(mode="json")
+        if "overall" in sections:
+            out["overall"] = overall_totals(session, portfolio_id=portfolio_id)
+    return versions, out
+
+
+def _diff(old: dict, new: dict) -> dict:
+    """新旧汇总的差异；现货按币种给出变化（null 表示该币种已无持仓记录）"""
+    delta = {}
+    for name, value in new.items():
+        prev = old.get(name)
+        if value == prev:
+            continue
+        if name == "spot" and prev is not None:
+            before = {s["symbol"]: s for s in prev["symbols"]}
+            after = {s["symbol"]: s for s in value["symbols"]}
+            changed = {k: v for k, v in after.items() if before.get(k) != v}
+            changed.update({k: None for k in before.keys() - after.keys()})
+            delta[name] = {
+                "symbols": changed,
+                **{k: v for k, v in value.items() if k != "symbols"},
+            }
+        else:
+            delta[name] = value
+    return delta
+
+
+def _event(name: str, data: dict) -> str:
+    return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, portfolio_id: int) -> None:
+        self.portfolio_id = portfolio_id
+        self.queue: asyncio.Queue[Optional[dict]] = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.resync = False
+
+
+class SummaryFeed:
+    def __init__(self) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        # 组合 id -> 过期的汇总 / 最近一次的汇总 / 计算时各汇总的数据版本号
+        self._dirty: dict[int, set[str]] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._latest: dict[int, dict] = {}
+        self._versions: dict[int, dict] = {}
+        self._subscribers: set[_Subscriber] = set()
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._latest = {}
+        self._versions = {}
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._loop = None
+
+    def notify(self, *topics: str, portfolio_id: Optional[int] = DEFAULT_PORTFOLIO) -> None:
+        """标记某个组合（None 为所有组合，比如价格更新）的汇总已过期；可在任意线程调用（写接口运行在线程池里）"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._mark, topics, portfolio_id)
+
+    def _mark(self, topics: tuple[str, ...], portfolio_id: Optional[int]) -> None:
+        if portfolio_id is None:
+            pids = {sub.portfolio_id for sub in self._subscribers} | set(self._latest)
+        else:
+            pids = {portfolio_id}
+        for pid in pids:
+            dirty = self._dirty.setdefault(pid, set())
+            for t in topics:
+                dirty.update(TOPIC_SECTIONS[t])
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                await self._poll()
+                if not self._dirty:
+                    continue
+            else:
+                # 合并短时间内的连续写入，只算一次
+                await asyncio.sleep(DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, {}
+            watched = {sub.portfolio_id for sub in self._subscribers}
+            for pid, sections in dirty.items():
+                if pid not in watched:
+                    # 没有订阅者时只丢弃缓存，下次有人订阅再算
+                    self._latest.pop(pid, None)
+                    self._versions.pop(pid, None)
+                    continue
+                try:
+                    await self._refresh(pid, sections)
+                except Exception:
+                    # 一个组合出错不影响其它组合，也不能让后台任务退出；汇总保持过期，下次比对时重试
+                    logger.exception("summary feed: recomputing portfolio %s failed", pid)
+                    self._dirty.setdefault(pid, set()).update(sections)
+
+    async def _poll(self) -> None:
+        """比对订阅中各组合的数据版本号，标记其它进程写入后过期的汇总"""
+        watched = {sub.portfolio_id for sub in self._subscribers} & set(self._versions)
+        if not watched:
+            return
+        try:
+            current = await run_in_threadpool(_read_versions, watched)
+        except Exception:
+            logger.exception("summary feed: reading data versions failed")
+            return
+        for pid, versions in current.items():
+            seen = self._versions.get(pid, {})
+            stale = {s for s, v in versions.items() if seen.get(s) != v}
+            if stale:
+                self._dirty.setdefault(pid, set()).update(stale)
+
+    async def _refresh(self, portfolio_id: int, sections: set[str]) -> None:
+        """重新计算并把差异推送给该组合的订阅者"""
+        async with self._lock:
+            versions, new = await run_in_threadpool(_compute, portfolio_id, sections)
+            latest = self._latest.setdefault(portfolio_id, {})
+            delta = _diff(latest, new)
+            latest.update(new)
+            self._versions.setdefault(portfolio_id, {}).update(versions)
+        if delta:
+            self._publish(portfolio_id, delta)
+
+    def _publish(self, portfolio_id: int, delta: dict) -> None:
+        for sub in list(self._subscribers):
+            if sub.portfolio_id != portfolio_id or sub.resync:
+                continue
+            try:
+                sub.queue.put_nowait(delta)
+            except asyncio.QueueFull:
+                # 慢客户端：丢弃积压的增量，改为发送一次完整快照
+                while not sub.queue.empty():
+                    sub.queue.get_nowait()
+                sub.resync = True
+                sub.queue.put_nowait(None)
+
+    async def snapshot(self, portfolio_id: int = DEFAULT_PORTFOLIO) -> dict:
+        current = (await run_in_threadpool(_read_versions, (portfolio_id,)))[portfolio_id]
+        seen = self._versions.get(portfolio_id, {})
+        stale = {
+            s
+            for s in SECTIONS
+            if s not in self._latest.get(portfolio_id, {}) or seen.get(s) != current[s]
+        }
+        if stale:
+            # 同时把差异推送给已在订阅的客户端（缓存更新后 _run 不会再算出这次差异）
+            await self._refresh(portfolio_id, stale)
+        latest = self._latest[portfolio_id]
+        return {s: latest[s] for s in SECTIONS}
+
+    async def _snapshot_event(self, sub: _Subscriber) -> str:
+        data = await self.snapshot(sub.portfolio_id)
+        # 到这里为止推送的差异都已包含在快照中
+        while not sub.queue.empty():
+            sub.queue.get_nowait()
+        return _event("snapshot", data)
+
+    async def stream(self, portfolio_id: int = DEFAULT_PORTFOLIO) -> AsyncIterator[str]:
+        sub = _Subscriber(portfolio_id)
+        self._subscribers.add(sub)
+        try:
+            yield await self._snapshot_event(sub)
+            while True:
+                try:
+                    item = await asyncio.wait_for(
+                        sub.queue.get(), timeout=KEEPALIVE_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if item is None or sub.resync:
+                    sub.resync = False
+                    yield await self._snapshot_event(sub)
+                else:
+                    yield _event("delta", item)
+        finally:
+            self._subscribers.discard(sub)
+
+
+summary_feed = SummaryFeed()
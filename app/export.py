@@ -0,0 +1,233 @@
+"""流式导出（CSV / JSONL / Parquet）。
+
+导出在自己的连接上用 stream_results + yield_per 分块读取（Postgres 上是服务端游标），
+每读一块就编码并发送，内存占用与总行数无关。Parquet 需要安装 pyarrow。
+"""
+from __future__ import annotations
+
+import csv
+import io
+from datetime import date, datetime
+from typing import Iterable, Iterator, Optional, Sequence
+
+from fastapi import HTTPException, Query
+from sqlalchemy import Date, DateTime, Float, Integer, select
+from sqlmodel import Session, SQLModel
+
+from .database import engine
+from .encoding import dumps
+from .models import DEFAULT_PORTFOLIO, ContractBot, Investment, InvestmentPair, SpotTrade
+from .services import load_spot_states, load_spot_states_as_of
+
+CHUNK_SIZE = 5000
+FORMATS = ("csv", "jsonl", "parquet")
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# 导出名 -> (表, 时间列)
+TABLES = {
+    "spot_trades": (SpotTrade, "traded_at"),
+    "contract_bots": (ContractBot, "closed_at"),
+    "investments": (Investment, "invested_at"),
+    "investment_pairs": (InvestmentPair, "invested_at"),
+}
+
+# 持仓汇总导出的列：SymbolState 的字段及其派生值
+SUMMARY_COLUMNS = (
+    ("symbol", str),
+    ("quantity", float),
+    ("cost_basis_total", float),
+    ("average_cost", float),
+    ("realized_pnl", float),
+    ("last_trade_at", datetime),
+    ("last_buy_price", float),
+    ("total_gross_profit", float),
+    ("source_price", float),
+    ("cost_price", float),
+)
+
+
+def parquet_available() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def export_format(
+    format: str = Query(default="csv", description="csv、jsonl 或 parquet"),
+) -> str:
+    fmt = format.lower()
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv, jsonl or parquet")
+    if fmt == "parquet" and not parquet_available():
+        raise HTTPException(status_code=400, detail="parquet export requires pyarrow")
+    return fmt
+
+
+def _python_type(sql_type) -> type:
+    if isinstance(sql_type, DateTime):
+        return datetime
+    if isinstance(sql_type, Date):
+        return date
+    if isinstance(sql_type, Integer):
+        return int
+    if isinstance(sql_type, Float):
+        return float
+    return str
+
+
+def _table_columns(model: type[SQLModel]) -> list[tuple[str, type]]:
+    return [(c.name, _python_type(c.type)) for c in model.__table__.columns]
+
+
+# ---- 编码 ----
+
+
+def _csv_chunks(names: Sequence[str], chunks: Iterable[Sequence]) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    # BOM：Excel 打开中文备注不乱码；批量导入按 utf-8-sig 读取，可以直接导回
+    buf.write("\ufeff")
+    writer.writerow(names)
+    for rows in chunks:
+        writer.writerows(
+            [v.isoformat() if isinstance(v, (datetime, date)) else v for v in r]
+            for r in rows
+        )
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _jsonl_chunks(names: Sequence[str], chunks: Iterable[Sequence]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield b"".join(dumps(dict(zip(names, r))) + b"\n" for r in rows)
+
+
+class _Sink(io.RawIOBase):
+    """收集 ParquetWriter 写出的字节，每写完一块取走一次"""
+
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._parts.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _parquet_chunks(
+    columns: Sequence[tuple[str, type]], chunks: Iterable[Sequence]
+) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {
+        int: pa.int64(),
+        float: pa.float64(),
+        str: pa.string(),
+        datetime: pa.timestamp("us"),
+        date: pa.date32(),
+    }
+    schema = pa.schema([(name, arrow_types[t]) for name, t in columns])
+    sink = _Sink()
+    # 每块写成一个 row group，写完即发送；关闭时写入文件尾
+    with pq.ParquetWriter(pa.PythonFile(sink, mode="w"), schema) as writer:
+        for rows in chunks:
+            arrays = [
+                pa.array([r[i] for r in rows], type=field.type)
+                for i, field in enumerate(schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+def encode(
+    fmt: str, columns: Sequence[tuple[str, type]], chunks: Iterable[Sequence]
+) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    if fmt == "csv":
+        return _csv_chunks(names, chunks)
+    if fmt == "jsonl":
+        return _jsonl_chunks(names, chunks)
+    if fmt == "parquet":
+        return _parquet_chunks(columns, chunks)
+    raise ValueError(f"unsupported format: {fmt}")
+
+
+# ---- 数据 ----
+
+
+def _stream_rows(stmt, chunk_size: int) -> Iterator[list]:
+    # 生成器在响应发送期间运行，请求的 Session 此时已经关闭，所以使用独立连接
+    with engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=chunk_size
+        ).execute(stmt)
+        for part in result.partitions():
+            yield part
+
+
+def export_table(
+    name: str,
+    fmt: str,
+    symbol: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    chunk_size: int = CHUNK_SIZE,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> Iterator[bytes]:
+    """按时间正序导出某个组合在整张表中的所有列"""
+    model, time_field = TABLES[name]
+    time_col = getattr(model, time_field)
+    stmt = select(*model.__table__.columns).where(model.portfolio_id == portfolio_id)
+    if since is not None:
+        stmt = stmt.where(time_col >= since.replace(tzinfo=None))
+    if until is not None:
+        stmt = stmt.where(time_col < until.replace(tzinfo=None))
+    if symbol and hasattr(model, "symbol"):
+        stmt = stmt.where(model.symbol == symbol)
+    stmt = stmt.order_by(time_col, model.id)
+    return encode(fmt, _table_columns(model), _stream_rows(stmt, chunk_size))
+
+
+def export_spot_summary(
+    fmt: str, as_of: Optional[datetime] = None, portfolio_id: int = DEFAULT_PORTFOLIO
+) -> Iterator[bytes]:
+    """每个币种一行的持仓状态（币种数量很少，一次算完；在开始发送时才计算）"""
+    with Session(engine) as session:
+        if as_of is not None:
+            states = load_spot_states_as_of(session, as_of, portfolio_id=portfolio_id)
+        else:
+            states = load_spot_states(session, portfolio_id=portfolio_id)
+    rows = [
+        (
+            sym,
+            s.quantity,
+            s.cost_basis_total,
+            s.average_cost,
+            s.realized_pnl,
+            s.last_trade_at,
+            s.last_buy_price,
+            s.total_gross_profit,
+            s.source_price,
+            s.cost_price,
+        )
+        for sym, s in sorted(states.items())
+    ]
+    yield from encode(fmt, SUMMARY_COLUMNS, [rows])
@@ -0,0 +1,347 @@
+"""按日 / 周 / 月的盈亏与投入历史，读取写入时维护的日汇总表。
+
+现货日汇总在 services 中随快照一起维护；合约机器人和投入是可加的，
+写入或删除后直接对受影响的那一天重新 SUM。周、月由日汇总在内存中聚合。
+所有日汇总都按组合分开保存，查询只读一个组合。
+"""
+from __future__ import annotations
+
+import itertools
+from datetime import date, datetime, time, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func
+from sqlmodel import Session, select
+
+from .cache import BOTS, INVESTMENTS, bump_versions
+from .metrics import span
+from .models import (
+    DEFAULT_PORTFOLIO,
+    BotDailyRollup,
+    ContractBot,
+    Investment,
+    InvestmentDailyRollup,
+    InvestmentPair,
+    SpotDailyRollup,
+)
+from .schemas import (
+    BotsHistoryPoint,
+    InvestedHistoryPoint,
+    PnlHistory,
+    SpotHistoryPoint,
+    SpotSymbolHistory,
+    SpotTotalHistoryPoint,
+)
+
+BUCKETS = ("day", "week", "month")
+
+
+def _as_date(value) -> date:
+    # SQLite 的 date() 返回字符串，Postgres 返回 date
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _day_range(col, day: date) -> list:
+    start = datetime.combine(day, time.min)
+    return [col >= start, col < start + timedelta(days=1)]
+
+
+# ---- 合约机器人 ----
+
+
+def refresh_bot_rollup(
+    session: Session,
+    symbol: str,
+    closed_at: datetime,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> None:
+    """重新计算某组合某币种某一天的机器人利润（新增或删除记录后调用）"""
+    day = closed_at.date()
+    profit, count = session.exec(
+        select(func.coalesce(func.sum(ContractBot.profit), 0.0), func.count()).where(
+            ContractBot.portfolio_id == portfolio_id,
+            ContractBot.symbol == symbol,
+            *_day_range(ContractBot.closed_at, day),
+        )
+    ).one()
+    row = session.get(BotDailyRollup, (portfolio_id, symbol, day))
+    if not count:
+        if row is not None:
+            session.delete(row)
+        return
+    if row is None:
+        row = BotDailyRollup(portfolio_id=portfolio_id, symbol=symbol, day=day)
+        session.add(row)
+    row.profit, row.count = profit, count
+
+
+def rebuild_bot_rollups(session: Session) -> None:
+    session.exec(delete(BotDailyRollup))
+    day = func.date(ContractBot.closed_at)
+    rows = session.exec(
+        select(
+            ContractBot.portfolio_id,
+            ContractBot.symbol,
+            day,
+            func.sum(ContractBot.profit),
+            func.count(),
+        ).group_by(ContractBot.portfolio_id, ContractBot.symbol, day)
+    ).all()
+    for pid, symbol, d, profit, count in rows:
+        session.add(
+            BotDailyRollup(
+                portfolio_id=pid, symbol=symbol, day=_as_date(d), profit=profit, count=count
+            )
+        )
+
+
+# ---- 投入 ----
+
+
+def _investment_day_totals(
+    session: Session, portfolio_id: Optional[int] = None, day: Optional[date] = None
+) -> dict:
+    """{(组合, 日期): [USDT, MYR, 笔数]}；指定 portfolio_id / day 时只统计该组合 / 这一天"""
+    totals: dict[tuple[int, date], list] = {}
+
+    def add(pid, d, usdt, myr, count):
+        entry = totals.setdefault((pid, _as_date(d)), [0.0, 0.0, 0])
+        entry[0] += usdt
+        entry[1] += myr
+        entry[2] += count
+
+    inv_day = func.date(Investment.invested_at)
+    currency = func.upper(Investment.currency)
+    stmt = select(
+        Investment.portfolio_id, inv_day, currency, func.sum(Investment.amount), func.count()
+    )
+    if portfolio_id is not None:
+        stmt = stmt.where(Investment.portfolio_id == portfolio_id)
+    if day is not None:
+        stmt = stmt.where(*_day_range(Investment.invested_at, day))
+    stmt = stmt.group_by(Investment.portfolio_id, inv_day, currency)
+    for pid, d, cur, amount, count in session.exec(stmt).all():
+        add(pid, d, amount if cur == "USDT" else 0.0, amount if cur == "MYR" else 0.0, count)
+
+    pair_day = func.date(InvestmentPair.invested_at)
+    stmt = select(
+        InvestmentPair.portfolio_id,
+        pair_day,
+        func.sum(InvestmentPair.amount_usdt),
+        func.sum(InvestmentPair.amount_myr),
+        func.count(),
+    )
+    if portfolio_id is not None:
+        stmt = stmt.where(InvestmentPair.portfolio_id == portfolio_id)
+    if day is not None:
+        stmt = stmt.where(*_day_range(InvestmentPair.invested_at, day))
+    stmt = stmt.group_by(InvestmentPair.portfolio_id, pair_day)
+    for pid, d, usdt, myr, count in session.exec(stmt).all():
+        add(pid, d, usdt, myr, count)
+    return totals
+
+
+def refresh_investment_rollup(
+    session: Session, invested_at: datetime, portfolio_id: int = DEFAULT_PORTFOLIO
+) -> None:
+    """重新计算某组合某一天的投入（新增或删除投入 / 成对投入后调用）"""
+    key = (portfolio_id, invested_at.date())
+    usdt, myr, count = _investment_day_totals(session, *key).get(key, (0.0, 0.0, 0))
+    row = session.get(InvestmentDailyRollup, key)
+    if not count:
+        if row is not None:
+            session.delete(row)
+        return
+    if row is None:
+        row = InvestmentDailyRollup(portfolio_id=key[0], day=key[1])
+        session.add(row)
+    row.usdt, row.myr, row.count = usdt, myr, count
+
+
+def rebuild_investment_rollups(session: Session) -> None:
+    session.exec(delete(InvestmentDailyRollup))
+    for (pid, d), (usdt, myr, count) in _investment_day_totals(session).items():
+        session.add(
+            InvestmentDailyRollup(portfolio_id=pid, day=d, usdt=usdt, myr=myr, count=count)
+        )
+
+
+def sync_rollups(session: Session) -> None:
+    """启动时按记录条数校验机器人 / 投入日汇总，不一致时整体重建（现货见 sync_spot_snapshots）"""
+    bots = session.exec(select(func.count()).select_from(ContractBot)).one()
+    bot_rollup = session.exec(
+        select(func.coalesce(func.sum(BotDailyRollup.count), 0))
+    ).one()
+    invested = (
+        session.exec(select(func.count()).select_from(Investment)).one()
+        + session.exec(select(func.count()).select_from(InvestmentPair)).one()
+    )
+    invested_rollup = session.exec(
+        select(func.coalesce(func.sum(InvestmentDailyRollup.count), 0))
+    ).one()
+    changed = []
+    if bots != bot_rollup:
+        rebuild_bot_rollups(session)
+        changed.append(BOTS)
+    if invested != invested_rollup:
+        rebuild_investment_rollups(session)
+        changed.append(INVESTMENTS)
+    if changed:
+        bump_versions(session, *changed)
+        session.commit()
+
+
+# ---- 查询 ----
+
+
+def _period(day: date, bucket: str) -> date:
+    """所在周期的第一天（周从周一开始）"""
+    if bucket == "week":
+        return day - timedelta(days=day.weekday())
+    if bucket == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _spot_history(
+    session: Session, portfolio_id: int, bucket: str, symbol: Optional[str]
+) -> tuple[list[SpotSymbolHistory], list[SpotTotalHistoryPoint]]:
+    stmt = select(
+        SpotDailyRollup.symbol,
+        SpotDailyRollup.day,
+        SpotDailyRollup.quantity,
+        SpotDailyRollup.cost_basis_total,
+        SpotDailyRollup.realized_pnl,
+        SpotDailyRollup.trade_count,
+    ).where(SpotDailyRollup.portfolio_id == portfolio_id)
+    if symbol:
+        stmt = stmt.where(SpotDailyRollup.symbol == symbol)
+    with span("hydrate") as sp:
+        rows = session.exec(
+            stmt.order_by(SpotDailyRollup.symbol, SpotDailyRollup.day)
+        ).all()
+        sp.rows = len(rows)
+
+    series: list[SpotSymbolHistory] = []
+    for sym, sym_rows in itertools.groupby(rows, key=lambda r: r.symbol):
+        points = []
+        prev_realized = 0.0
+        for period, group in itertools.groupby(sym_rows, key=lambda r: _period(r.day, bucket)):
+            count = 0
+            for r in group:
+                count += r.trade_count
+            # 周期内最后一天的收盘状态
+            avg = r.cost_basis_total / r.quantity if r.quantity > 0 else 0.0
+            points.append(
+                SpotHistoryPoint(
+                    period=period,
+                    realized_pnl=r.realized_pnl - prev_realized,
+                    cumulative_realized_pnl=r.realized_pnl,
+                    quantity=r.quantity,
+                    average_cost=avg,
+                    position_cost_value=avg * r.quantity,
+                    trade_count=count,
+                )
+            )
+            prev_realized = r.realized_pnl
+        series.append(SpotSymbolHistory(symbol=sym, points=points))
+
+    # 全部币种合计：没有成交的周期沿用该币种上一次的状态
+    by_period: dict[date, list[tuple[str, SpotHistoryPoint]]] = {}
+    for s in series:
+        for p in s.points:
+            by_period.setdefault(p.period, []).append((s.symbol, p))
+    cumulative: dict[str, float] = {}
+    cost_value: dict[str, float] = {}
+    totals = []
+    for period in sorted(by_period):
+        realized = 0.0
+        for sym, p in by_period[period]:
+            realized += p.realized_pnl
+            cumulative[sym] = p.cumulative_realized_pnl
+            cost_value[sym] = p.position_cost_value
+        totals.append(
+            SpotTotalHistoryPoint(
+                period=period,
+                realized_pnl=realized,
+                cumulative_realized_pnl=sum(cumulative.values()),
+                position_cost_value=sum(cost_value.values()),
+            )
+        )
+    return series, totals
+
+
+def _bots_history(
+    session: Session, portfolio_id: int, bucket: str, symbol: Optional[str]
+) -> list[BotsHistoryPoint]:
+    stmt = select(
+        BotDailyRollup.day, func.sum(BotDailyRollup.profit), func.sum(BotDailyRollup.count)
+    ).where(BotDailyRollup.portfolio_id == portfolio_id)
+    if symbol:
+        stmt = stmt.where(BotDailyRollup.symbol == symbol)
+    rows = session.exec(
+        stmt.group_by(BotDailyRollup.day).order_by(BotDailyRollup.day)
+    ).all()
+    points = []
+    cumulative = 0.0
+    for period, group in itertools.groupby(rows, key=lambda r: _period(_as_date(r[0]), bucket)):
+        profit = 0.0
+        count = 0
+        for _, p, c in group:
+            profit += p
+            count += c
+        cumulative += profit
+        points.append(
+            BotsHistoryPoint(
+                period=period, profit=profit, cumulative_profit=cumulative, count=count
+            )
+        )
+    return points
+
+
+def _invested_history(
+    session: Session, portfolio_id: int, bucket: str
+) -> list[InvestedHistoryPoint]:
+    rows = session.exec(
+        select(InvestmentDailyRollup)
+        .where(InvestmentDailyRollup.portfolio_id == portfolio_id)
+        .order_by(InvestmentDailyRollup.day)
+    ).all()
+    points = []
+    cum_usdt = cum_myr = 0.0
+    for period, group in itertools.groupby(rows, key=lambda r: _period(r.day, bucket)):
+        usdt = myr = 0.0
+        for r in group:
+            usdt += r.usdt
+            myr += r.myr
+        cum_usdt += usdt
+        cum_myr += myr
+        points.append(
+            InvestedHistoryPoint(
+                period=period,
+                usdt=usdt,
+                myr=myr,
+                cumulative_usdt=cum_usdt,
+                cumulative_myr=cum_myr,
+            )
+        )
+    return points
+
+
+def pnl_history(
+    session: Session,
+    bucket: str = "day",
+    symbol: Optional[str] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> PnlHistory:
+    """symbol 只过滤现货和机器人，投入不分币种"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+    spot, spot_total = _spot_history(session, portfolio_id, bucket, symbol)
+    return PnlHistory(
+        bucket=bucket,
+        spot=spot,
+        spot_total=spot_total,
+        bots=_bots_history(session, portfolio_id, bucket, symbol),
+        invested=_invested_history(session, portfolio_id, bucket),
+    )
@@ -0,0 +1,185 @@
+"""现货成交批量导入（CSV / JSONL，逐行流式读取，分批写入）"""
+from __future__ import annotations
+
+import csv
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterable, Iterator, TextIO
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from .cache import SPOT, bump_versions
+from .jobs import enqueue_spot_rebuild
+from .models import DEFAULT_PORTFOLIO, SpotTrade
+from .schemas import SpotTradeCreate
+from .search import bulk_indexing
+from .services import rebuild_spot_snapshot, spot_trade_values
+
+BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 1000
+
+# SQLite 下直接交给驱动 executemany 的列（spot_trade_values 的结果加上 portfolio_id）
+_COLUMNS = (
+    "portfolio_id",
+    "symbol",
+    "side",
+    "quantity",
+    "price",
+    "fee",
+    "fee_currency",
+    "traded_at",
+    "note",
+)
+
+FORMATS = ("csv", "jsonl")
+
+
+@dataclass
+class ImportReport:
+    inserted: int = 0
+    failed: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+    jobs: list[int] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+def detect_format(filename: str | None) -> str | None:
+    if not filename:
+        return None
+    ext = filename.rsplit(".", 1)[-1].lower()
+    if ext in ("jsonl", "ndjson"):
+        return "jsonl"
+    if ext == "csv":
+        return "csv"
+    return None
+
+
+def iter_records(stream: TextIO, fmt: str) -> Iterator[tuple[int, dict | str]]:
+    """逐行产出 (行号, 记录)；无法解析的行产出错误信息字符串"""
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # 空单元格视为未填写，交给默认值逻辑处理
+            yield reader.line_num, {
+                k.strip(): (v.strip() or None) if isinstance(v, str) else v
+                for k, v in row.items()
+                if k
+            }
+    elif fmt == "jsonl":
+        for lineno, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield lineno, f"invalid json: {e.msg}"
+                continue
+            if not isinstance(rec, dict):
+                yield lineno, "expected a JSON object"
+                continue
+            yield lineno, rec
+    else:
+        raise ValueError(f"unsupported format: {fmt}")
+
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'row'}: {err['msg']}"
+        for err in e.errors()
+    )
+
+
+def _insert_batch(session: Session, batch: list[dict]) -> None:
+    table = SpotTrade.__table__
+    if session.get_bind().dialect.name != "sqlite":
+        session.execute(insert(table), batch)
+        return
+    # 跳过 SQLAlchemy 逐行的参数处理（约占插入耗时的三分之一）；
+    # 时间写成 SQLAlchemy 在 SQLite 中的存储格式（始终带 6 位微秒）
+    sql = (
+        f"INSERT INTO {table.name} ({', '.join(_COLUMNS)})"
+        f" VALUES ({', '.join('?' * len(_COLUMNS))})"
+    )
+    rows = [
+        (
+            v["portfolio_id"],
+            v["symbol"],
+            v["side"],
+            v["quantity"],
+            v["price"],
+            v["fee"],
+            v["fee_currency"],
+            v["traded_at"].isoformat(" ", "microseconds"),
+            v["note"],
+        )
+        for v in batch
+    ]
+    session.connection().exec_driver_sql(sql, rows)
+
+
+def import_spot_trades(
+    session: Session,
+    records: Iterable[tuple[int, dict | str]],
+    batch_size: int = BATCH_SIZE,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+    defer: bool = False,
+) -> ImportReport:
+    """校验并分批把成交插入 portfolio_id 组合；出错的行记入报告，不影响同批其它行。
+
+    每批使用一次 executemany 插入并提交，全部写完后按币种从最早的导入时间开始重建快照；
+    defer 为真时不在这里重建，而是按币种排队后台任务（任务 id 记入报告）。
+    """
+    report = ImportReport()
+    batch: list[dict] = []
+    earliest: dict[str, datetime] = {}
+
+    def flush() -> None:
+        if not batch:
+            return
+        with bulk_indexing(session, SpotTrade):
+            _insert_batch(session, batch)
+        session.commit()
+        report.inserted += len(batch)
+        batch.clear()
+
+    for lineno, rec in records:
+        if isinstance(rec, str):
+            report.add_error(lineno, rec)
+            continue
+        try:
+            values = spot_trade_values(SpotTradeCreate.model_validate(rec))
+        except ValidationError as e:
+            report.add_error(lineno, _format_validation_error(e))
+            continue
+        except ValueError as e:
+            report.add_error(lineno, str(e))
+            continue
+        traded_at = values["traded_at"] = values["traded_at"].replace(tzinfo=None)
+        values["portfolio_id"] = portfolio_id
+        sym = values["symbol"]
+        if sym not in earliest or traded_at < earliest[sym]:
+            earliest[sym] = traded_at
+        batch.append(values)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    for sym, traded_at in earliest.items():
+        if defer:
+            job = enqueue_spot_rebuild(session, sym, (traded_at, 0), portfolio_id)
+            report.jobs.append(job.id)
+        else:
+            rebuild_spot_snapshot(
+                session, sym, since=(traded_at, 0), portfolio_id=portfolio_id
+            )
+    if report.inserted:
+        bump_versions(session, SPOT, portfolio_id=portfolio_id)
+    session.commit()
+    return report
@@ -0,0 +1,353 @@
+"""后台任务队列：把重建现货快照这类耗时的工作移出请求路径。
+
+任务保存在数据库的 Job 表中，进程重启后继续执行（启动时把上次没跑完的 running 任务放回队列）。
+同一组合同一币种尚未开始的重建任务合并为一条，起点取最早受影响的成交，
+所以连续删除 / 导入很多笔只重建一次。每个进程有一个工作线程按 id 顺序领取任务，
+领取时检查同一币种没有正在运行的任务，多个进程共用一个数据库也不会同时重建同一个币种。
+写接口在提交后调用 job_worker.wake()；其它进程（比如导入脚本）写入的任务由定时轮询发现。
+
+运行中的任务带租约：记录执行者（WORKER_ID），执行期间每隔 LEASE_SECONDS / 3 刷新 heartbeat_at。
+只有超过 LEASE_SECONDS 未刷新的 running 任务（执行它的进程已退出或卡住）才会被放回队列，
+启动时和每次领取前检查；仍在执行的任务不受其它进程启动的影响。
+结束时确认租约仍属于自己才标记完成，租约已被收回时回滚，由重新领取的进程执行。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, exists, or_, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, select
+
+from .cache import SPOT, bump_versions
+from .database import engine
+from .events import summary_feed
+from .metrics import span
+from .models import DEFAULT_PORTFOLIO, Job, SpotSymbolSnapshot, SpotTrade
+from .services import rebuild_spot_snapshot, record_spot_trade
+from .tradestore import trade_store
+
+logger = logging.getLogger(__name__)
+
+SPOT_REBUILD = "spot_rebuild"
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+MAX_ATTEMPTS = 3
+POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+DEBOUNCE_SECONDS = 0.05
+# 完成 / 失败的任务保留多久（供 /api/jobs/{id} 查询）
+KEEP_HOURS = float(os.getenv("JOB_KEEP_HOURS", "24"))
+# 租期：running 任务超过这么久没有心跳就视为执行者已退出
+LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# 本进程的执行者标识
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _lease_cutoff() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+
+
+def _expired(job, cutoff: datetime):
+    """租约已过期的 running 任务（没有心跳的是租约功能之前留下的）"""
+    return and_(
+        job.status == RUNNING,
+        or_(job.heartbeat_at.is_(None), job.heartbeat_at < cutoff),
+    )
+
+
+def _queued(kind: str, portfolio_id: int, symbol: Optional[str], *statuses: str):
+    return (
+        Job.kind == kind,
+        Job.portfolio_id == portfolio_id,
+        Job.symbol == symbol,
+        Job.status.in_(statuses),
+    )
+
+
+def enqueue_spot_rebuild(
+    session: Session,
+    symbol: str,
+    since: Optional[tuple[datetime, int]] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> Job:
+    """排队重建某个组合中单个币种的快照（since 含义同 rebuild_spot_snapshot）；不提交。
+
+    已有尚未开始的同币种任务时合并进去，起点取两者中较早的一个。
+    """
+    if since is not None:
+        since = (since[0].replace(tzinfo=None), since[1])
+    job = session.exec(
+        select(Job).where(*_queued(SPOT_REBUILD, portfolio_id, symbol, PENDING)).limit(1)
+    ).first()
+    if job is None:
+        job = Job(kind=SPOT_REBUILD, portfolio_id=portfolio_id, symbol=symbol)
+        if since is not None:
+            job.since_at, job.since_id = since
+        session.add(job)
+    else:
+        if job.since_at is not None and (
+            since is None or since < (job.since_at, job.since_id)
+        ):
+            job.since_at, job.since_id = since if since is not None else (None, None)
+        job.merged += 1
+    session.flush()
+    return job
+
+
+def spot_rebuild_queued(
+    session: Session, symbol: str, portfolio_id: int = DEFAULT_PORTFOLIO
+) -> bool:
+    """该币种是否有排队或正在运行的重建任务（此时快照尚未更新）"""
+    return (
+        session.exec(
+            select(Job.id)
+            .where(*_queued(SPOT_REBUILD, portfolio_id, symbol, PENDING, RUNNING))
+            .limit(1)
+        ).first()
+        is not None
+    )
+
+
+def record_spot_trade_deferred(session: Session, trade: SpotTrade) -> Optional[Job]:
+    """新成交写入后更新快照：按时间顺序追加时直接增量更新（很快）；
+    乱序插入，或该币种已有排队 / 进行中的重建时，改为排队重建并返回任务。trade 需已 flush
+    """
+    pid = trade.portfolio_id
+    key = (trade.traded_at.replace(tzinfo=None), trade.id)
+    snap = session.get(SpotSymbolSnapshot, (pid, trade.symbol), with_for_update=True)
+    if (
+        snap is not None and key < (snap.last_trade_at, snap.last_trade_id)
+    ) or spot_rebuild_queued(session, trade.symbol, pid):
+        return enqueue_spot_rebuild(session, trade.symbol, key, pid)
+    record_spot_trade(session, trade)
+    return None
+
+
+def _claim(session: Session) -> Optional[Job]:
+    """领取最早的待处理任务；同一币种已有任务在运行（租约未过期）时跳过"""
+    reclaim_expired(session)
+    cutoff = _lease_cutoff()
+    busy = aliased(Job)
+    free = ~exists().where(
+        busy.status == RUNNING,
+        busy.heartbeat_at >= cutoff,
+        busy.kind == Job.kind,
+        busy.portfolio_id == Job.portfolio_id,
+        or_(busy.symbol == Job.symbol, and_(busy.symbol.is_(None), Job.symbol.is_(None))),
+    )
+    while True:
+        job_id = session.exec(
+            select(Job.id).where(Job.status == PENDING, free).order_by(Job.id).limit(1)
+        ).first()
+        if job_id is None:
+            return None
+        # 条件更新：其它进程先领走时影响行数为 0，换下一条
+        now = datetime.utcnow()
+        res = session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == PENDING, free)
+            .values(
+                status=RUNNING,
+                started_at=now,
+                heartbeat_at=now,
+                worker=WORKER_ID,
+                attempts=Job.attempts + 1,
+            )
+        )
+        session.commit()
+        if res.rowcount:
+            return session.get(Job, job_id)
+
+
+def _execute(session: Session, job: Job) -> None:
+    if job.kind == SPOT_REBUILD:
+        since = (job.since_at, job.since_id) if job.since_at is not None else None
+        with span("compute"):
+            rebuild_spot_snapshot(
+                session, job.symbol, since=since, portfolio_id=job.portfolio_id
+            )
+        bump_versions(session, SPOT, portfolio_id=job.portfolio_id)
+        # 成交没有变化，只让内存中的成交跟上版本号
+        trade_store.stage(session, job.portfolio_id)
+    else:
+        raise ValueError(f"unknown job kind: {job.kind}")
+
+
+def _finish(job: Job, status: str, error: Optional[str] = None) -> None:
+    job.status = status
+    job.error = error
+    job.finished_at = datetime.utcnow() if status in (DONE, FAILED) else None
+    job.worker = job.heartbeat_at = None
+
+
+class _Heartbeat:
+    """执行期间在独立线程中定期刷新租约"""
+
+    def __init__(self, job_id: int) -> None:
+        self.job_id = job_id
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="job-heartbeat", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(LEASE_SECONDS / 3):
+            try:
+                with Session(engine) as session:
+                    session.execute(
+                        update(Job)
+                        .where(Job.id == self.job_id, Job.status == RUNNING, Job.worker == WORKER_ID)
+                        .values(heartbeat_at=datetime.utcnow())
+                    )
+                    session.commit()
+            except Exception:
+                # 比如 SQLite 写锁被本任务的事务占用：下次再试
+                logger.debug("job %s heartbeat failed", self.job_id, exc_info=True)
+
+
+def _still_owned(session: Session, job_id: int) -> bool:
+    """结束前确认租约仍属于本进程；锁住任务行，提交前不会被收回"""
+    row = session.exec(
+        select(Job.status, Job.worker).where(Job.id == job_id).with_for_update()
+    ).first()
+    return row is not None and tuple(row) == (RUNNING, WORKER_ID)
+
+
+def run_next() -> Optional[Job]:
+    """在当前线程执行一个待处理任务；没有任务时返回 None"""
+    with Session(engine) as session:
+        job = _claim(session)
+        if job is None:
+            return None
+        job_id = job.id
+        try:
+            with _Heartbeat(job_id):
+                _execute(session, job)
+            if not _still_owned(session, job_id):
+                # 租约已过期并被收回：放弃结果，由重新领取的进程执行
+                session.rollback()
+                logger.warning("job %s lease lost, discarding result", job_id)
+                return session.get(Job, job_id)
+            _finish(job, DONE)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.exception("job %s failed", job_id)
+            if not _still_owned(session, job_id):
+                session.rollback()
+                return session.get(Job, job_id)
+            job = session.get(Job, job_id)
+            # 失败的任务重新排队，超过次数后标记为 failed（启动校验会发现快照不一致并重建）
+            _finish(
+                job,
+                PENDING if job.attempts < MAX_ATTEMPTS else FAILED,
+                f"{type(e).__name__}: {e}",
+            )
+            session.commit()
+            return job
+        if job.kind == SPOT_REBUILD:
+            summary_feed.notify("spot", portfolio_id=job.portfolio_id)
+        return job
+
+
+def run_pending() -> int:
+    """执行完所有待处理任务，返回执行的个数（脚本、测试中同步等待用）"""
+    count = 0
+    while run_next() is not None:
+        count += 1
+    return count
+
+
+def reclaim_expired(session: Session) -> int:
+    """把租约已过期的 running 任务放回队列（重建可以重复执行），返回个数。
+    仍在心跳的任务（包括其它进程正在执行的）不受影响"""
+    res = session.execute(
+        update(Job)
+        .where(_expired(Job, _lease_cutoff()))
+        .values(status=PENDING, started_at=None, heartbeat_at=None, worker=None)
+    )
+    session.commit()
+    return res.rowcount
+
+
+def resume_jobs(session: Session) -> int:
+    """启动时调用：上次进程退出时仍在运行、租约已过期的任务放回队列"""
+    return reclaim_expired(session)
+
+
+def prune_jobs(session: Session) -> None:
+    cutoff = datetime.utcnow() - timedelta(hours=KEEP_HOURS)
+    session.execute(
+        delete(Job).where(Job.status.in_((DONE, FAILED)), Job.finished_at < cutoff)
+    )
+    session.commit()
+
+
+class JobWorker:
+    """进程内的工作线程：被唤醒或每隔 POLL_SECONDS 秒检查一次队列"""
+
+    def __init__(self) -> None:
+        self._thread: Optional[threading.Thread] = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._pruned = 0.0
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        with Session(engine) as session:
+            resume_jobs(session)
+        self._stopping.clear()
+        self._wakeup.set()
+        self._thread = threading.Thread(target=self._run, name="job-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join(timeout)
+
+    def wake(self) -> None:
+        """有新任务提交后调用；可在任意线程调用"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(POLL_SECONDS)
+            # 合并短时间内的连续写入
+            time.sleep(DEBOUNCE_SECONDS)
+            self._wakeup.clear()
+            try:
+                while not self._stopping.is_set() and run_next() is not None:
+                    pass
+                if time.monotonic() - self._pruned > 3600:
+                    with Session(engine) as session:
+                        prune_jobs(session)
+                    self._pruned = time.monotonic()
+            except Exception:
+                # 数据库暂时不可用等情况：下次轮询再试
+                logger.exception("job worker error")
+
+
+job_worker = JobWorker()
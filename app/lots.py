@@ -0,0 +1,378 @@
+"""现货 FIFO / LIFO 成本计算（按买入批次匹配）。
+
+每笔买入形成一个批次（数量扣除 base 手续费，单位成本含手续费，与加权平均法的成本口径相同），
+卖出时按 FIFO（最早的批次）或 LIFO（最近的批次）依次扣减。批次按时间顺序放在双端队列里，
+两种方法都只从一端取、卖完即出队，所以每笔成交摊销 O(1)，大量部分成交也不会退化成 O(n²)。
+
+未卖完的批次和各币种的状态保存在 SpotLot / SpotLotState 中：按时间顺序追加的成交直接在数据库上
+匹配（按索引只读出被扣减的几个批次）；追加在末尾的批量导入从保存的批次接着匹配；
+乱序插入或删除时该币种从头重新匹配。
+数量、最近买价、总毛利与加权平均法相同，只有持仓成本和已实现盈亏不同；
+卖出超过持有数量的部分没有可匹配的批次，按零成本计算。
+"""
+from __future__ import annotations
+
+from collections import defaultdict, deque
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Iterator, Optional
+
+from sqlalchemy import and_, delete, insert, or_
+from sqlmodel import Session, select
+
+from .metrics import span
+from .models import DEFAULT_PORTFOLIO, SpotLot, SpotLotState, SpotTrade
+from .services import SPOT_TRADE_COLUMNS, SymbolState, TradeRows, locked_row
+from .tradestore import TRADE_STORE, trade_store
+
+METHODS = ("avg", "fifo", "lifo")
+LOT_METHODS = ("fifo", "lifo")
+
+# 在数据库上匹配时每次读取的批次数
+LOT_BATCH = 64
+
+_STATE_FIELDS = (
+    "quantity",
+    "cost_basis_total",
+    "realized_pnl",
+    "last_buy_price",
+    "total_gross_profit",
+)
+
+
+@dataclass
+class Lot:
+    trade_id: int
+    acquired_at: datetime
+    quantity: float
+    remaining: float
+    unit_cost: float
+
+
+def _buy_lot(t) -> tuple[float, float]:
+    """买入得到的 (数量, 总成本)，与 apply_spot_trade 的口径一致"""
+    fee = t.fee or 0.0
+    if (t.fee_currency or "quote").lower() == "base":
+        return max(t.quantity - fee, 0.0), t.quantity * t.price
+    return t.quantity, t.quantity * t.price + fee
+
+
+def _match(lots: Iterable, quantity: float) -> tuple[float, list]:
+    """按 lots 的顺序扣减 quantity，返回 (匹配到的成本, 已卖完的批次)"""
+    cost = 0.0
+    exhausted = []
+    for lot in lots:
+        if quantity <= 0:
+            break
+        if quantity >= lot.remaining:
+            cost += lot.remaining * lot.unit_cost
+            quantity -= lot.remaining
+            lot.remaining = 0.0
+            exhausted.append(lot)
+        else:
+            cost += quantity * lot.unit_cost
+            lot.remaining -= quantity
+            quantity = 0.0
+    return cost, exhausted
+
+
+class LotBook:
+    """内存中的批次队列（按买入时间顺序）"""
+
+    def __init__(self, method: str, lots: Iterable[Lot] = ()) -> None:
+        self.method = method
+        self.lots: deque[Lot] = deque(lots)
+
+    def add(self, t, quantity: float, unit_cost: float) -> None:
+        self.lots.append(Lot(t.id, t.traded_at, quantity, quantity, unit_cost))
+
+    def match(self, quantity: float) -> float:
+        lifo = self.method == "lifo"
+        cost, exhausted = _match(reversed(self.lots) if lifo else iter(self.lots), quantity)
+        for _ in exhausted:
+            if lifo:
+                self.lots.pop()
+            else:
+                self.lots.popleft()
+        return cost
+
+    def clear(self) -> None:
+        self.lots.clear()
+
+
+def _key_after(key: tuple[datetime, int]):
+    acquired_at, trade_id = key
+    return or_(
+        SpotLot.acquired_at > acquired_at,
+        and_(SpotLot.acquired_at == acquired_at, SpotLot.trade_id > trade_id),
+    )
+
+
+def _key_before(key: tuple[datetime, int]):
+    acquired_at, trade_id = key
+    return or_(
+        SpotLot.acquired_at < acquired_at,
+        and_(SpotLot.acquired_at == acquired_at, SpotLot.trade_id < trade_id),
+    )
+
+
+class _DbBook:
+    """直接在 SpotLot 表上匹配：按 ix_spotlot_order 顺序分批读取，只读到卖单够用为止"""
+
+    def __init__(self, session: Session, portfolio_id: int, symbol: str, method: str) -> None:
+        self.session = session
+        self.portfolio_id = portfolio_id
+        self.symbol = symbol
+        self.method = method
+
+    def _scope(self) -> tuple:
+        return (
+            SpotLot.portfolio_id == self.portfolio_id,
+            SpotLot.symbol == self.symbol,
+            SpotLot.method == self.method,
+        )
+
+    def add(self, t, quantity: float, unit_cost: float) -> None:
+        self.session.add(
+            SpotLot(
+                portfolio_id=self.portfolio_id,
+                symbol=self.symbol,
+                method=self.method,
+                trade_id=t.id,
+                acquired_at=t.traded_at,
+                quantity=quantity,
+                remaining=quantity,
+                unit_cost=unit_cost,
+            )
+        )
+
+    def _open_lots(self) -> Iterator[SpotLot]:
+        lifo = self.method == "lifo"
+        if lifo:
+            order = (SpotLot.acquired_at.desc(), SpotLot.trade_id.desc())
+        else:
+            order = (SpotLot.acquired_at, SpotLot.trade_id)
+        last = None
+        while True:
+            stmt = select(SpotLot).where(*self._scope())
+            if last is not None:
+                stmt = stmt.where(_key_before(last) if lifo else _key_after(last))
+            rows = self.session.exec(stmt.order_by(*order).limit(LOT_BATCH)).all()
+            yield from rows
+            if len(rows) < LOT_BATCH:
+                return
+            last = (rows[-1].acquired_at, rows[-1].trade_id)
+
+    def match(self, quantity: float) -> float:
+        cost, exhausted = _match(self._open_lots(), quantity)
+        for lot in exhausted:
+            self.session.delete(lot)
+        return cost
+
+    def clear(self) -> None:
+        self.session.exec(delete(SpotLot).where(*self._scope()))
+
+
+def apply_lot_trade(state: SymbolState, book, t) -> None:
+    """与 apply_spot_trade 相同，但卖出成本来自 book 中匹配到的批次"""
+    state.last_trade_at = t.traded_at
+    fee = t.fee or 0.0
+    side = t.side.upper()
+    if side == "BUY":
+        state.last_buy_price = t.price
+        quantity, cost = _buy_lot(t)
+        if quantity > 0:
+            state.quantity += quantity
+            state.cost_basis_total += cost
+            book.add(t, quantity, cost / quantity)
+    elif side == "SELL":
+        state.total_gross_profit += (t.price - state.last_buy_price) * t.quantity
+        matched = book.match(t.quantity)
+        state.realized_pnl += t.quantity * t.price - fee - matched
+        state.quantity -= t.quantity
+        if state.quantity < 0:
+            state.quantity = 0.0
+            state.cost_basis_total = 0.0
+            book.clear()
+        else:
+            state.cost_basis_total -= matched
+    else:
+        raise ValueError("Invalid side, expected BUY or SELL")
+
+
+def compute_lot_summary(
+    trades: Iterable, method: str, books: Optional[dict[str, LotBook]] = None
+) -> dict[str, SymbolState]:
+    """参考实现：按成交时间逐笔匹配。books 为各币种的批次队列（会被原地更新）"""
+    states: dict[str, SymbolState] = defaultdict(SymbolState)
+    books = {} if books is None else books
+    for t in sorted(trades, key=lambda x: x.traded_at):
+        book = books.get(t.symbol)
+        if book is None:
+            book = books[t.symbol] = LotBook(method)
+        apply_lot_trade(states[t.symbol], book, t)
+    return states
+
+
+# ---- 持久化 ----
+
+
+def _state_from_row(row: SpotLotState) -> SymbolState:
+    state = SymbolState(**{f: getattr(row, f) for f in _STATE_FIELDS})
+    state.last_trade_at = row.last_trade_at
+    return state
+
+
+def _store_state(row: SpotLotState, state: SymbolState, last, count: int) -> None:
+    for f in _STATE_FIELDS:
+        setattr(row, f, getattr(state, f))
+    row.last_trade_at = last.traded_at
+    row.last_trade_id = last.id
+    row.trade_count = count
+
+
+def record_lot_trade(session: Session, trade: SpotTrade) -> None:
+    """新成交写入后更新各方法的批次；trade 需已 flush（有 id）"""
+    pid, symbol = trade.portfolio_id, trade.symbol
+    key = (trade.traded_at.replace(tzinfo=None), trade.id)
+    for method in LOT_METHODS:
+        row = locked_row(session, SpotLotState, portfolio_id=pid, symbol=symbol, method=method)
+        if row.trade_count and key < (row.last_trade_at, row.last_trade_id):
+            rebuild_lots(session, symbol, portfolio_id=pid)
+            return
+        state = _state_from_row(row)
+        apply_lot_trade(state, _DbBook(session, pid, symbol, method), trade)
+        _store_state(row, state, trade, row.trade_count + 1)
+
+
+def rebuild_lots(
+    session: Session,
+    symbol: str,
+    since: Optional[tuple[datetime, int]] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+    trades: Optional[TradeRows] = None,
+) -> None:
+    """重新匹配某个组合中单个币种的批次。
+
+    since（受影响的第一笔成交的排序键）在已保存状态的最后一笔成交之后时，
+    从保存的批次接着匹配新成交；否则批次无法回退，从头重新匹配。
+    """
+    pid = portfolio_id
+    if trades is None:
+        trades = TradeRows(session, symbol, pid)
+    for method in LOT_METHODS:
+        scope = (
+            SpotLot.portfolio_id == pid,
+            SpotLot.symbol == symbol,
+            SpotLot.method == method,
+        )
+        row = session.get(SpotLotState, (pid, symbol, method))
+        start = None
+        if (
+            row is not None
+            and since is not None
+            and since > (row.last_trade_at, row.last_trade_id)
+        ):
+            lots = session.exec(
+                select(SpotLot).where(*scope).order_by(SpotLot.acquired_at, SpotLot.trade_id)
+            ).all()
+            book = LotBook(
+                method,
+                (
+                    Lot(l.trade_id, l.acquired_at, l.quantity, l.remaining, l.unit_cost)
+                    for l in lots
+                ),
+            )
+            state = _state_from_row(row)
+            count = row.trade_count
+            start = (row.last_trade_at, row.last_trade_id)
+        else:
+            book = LotBook(method)
+            state = SymbolState()
+            count = 0
+        session.exec(delete(SpotLot).where(*scope))
+
+        rows = trades.after(start)
+        if not rows and not count:
+            # 该币种已无成交
+            if row is not None:
+                session.delete(row)
+            continue
+        with span("replay") as sp:
+            for t in rows:
+                apply_lot_trade(state, book, t)
+            sp.rows = len(rows)
+        if book.lots:
+            session.execute(
+                insert(SpotLot.__table__),
+                [
+                    {
+                        "portfolio_id": pid,
+                        "symbol": symbol,
+                        "method": method,
+                        "trade_id": lot.trade_id,
+                        "acquired_at": lot.acquired_at,
+                        "quantity": lot.quantity,
+                        "remaining": lot.remaining,
+                        "unit_cost": lot.unit_cost,
+                    }
+                    for lot in book.lots
+                ],
+            )
+        if row is None:
+            row = SpotLotState(portfolio_id=pid, symbol=symbol, method=method)
+            session.add(row)
+        if rows:
+            _store_state(row, state, rows[-1], count + len(rows))
+
+
+def lot_state_counts(session: Session) -> dict[tuple[int, str, str], int]:
+    """{(组合, 币种, 方法): 已匹配的成交笔数}，启动时与成交笔数比对"""
+    return {
+        (r.portfolio_id, r.symbol, r.method): r.trade_count
+        for r in session.exec(select(SpotLotState)).all()
+    }
+
+
+def load_lot_states(
+    session: Session,
+    method: str,
+    symbol: Optional[str] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> dict[str, SymbolState]:
+    stmt = select(SpotLotState).where(
+        SpotLotState.portfolio_id == portfolio_id, SpotLotState.method == method
+    )
+    if symbol:
+        stmt = stmt.where(SpotLotState.symbol == symbol)
+    with span("hydrate") as sp:
+        rows = session.exec(stmt).all()
+        sp.rows = len(rows)
+    return {r.symbol: _state_from_row(r) for r in rows}
+
+
+def load_lot_states_as_of(
+    session: Session,
+    method: str,
+    as_of: datetime,
+    symbol: Optional[str] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> dict[str, SymbolState]:
+    """截至 as_of（含）的状态；批次无法回退，从头匹配 as_of 之前的成交"""
+    as_of = as_of.replace(tzinfo=None)
+    if TRADE_STORE:
+        rows = trade_store.trades(session, portfolio_id, symbol or None, until=as_of)
+    else:
+        stmt = select(*SPOT_TRADE_COLUMNS).where(
+            SpotTrade.portfolio_id == portfolio_id,
+            SpotTrade.traded_at <= as_of,
+        )
+        if symbol:
+            stmt = stmt.where(SpotTrade.symbol == symbol)
+        with span("hydrate") as sp:
+            rows = session.exec(stmt.order_by(SpotTrade.traded_at, SpotTrade.id)).all()
+            sp.rows = len(rows)
+    with span("replay") as sp:
+        states = compute_lot_summary(rows, method)
+        sp.rows = len(rows)
+    return states
@@ -1,21 +1,96 @@
-from datetime import datetime
-from typing import Optional
+import time
 
-from fastapi import FastAPI, Depends, Query, Request, HTTPException
-from fastapi.responses import HTMLResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from sqlmodel import select
+# 冷启动计时从导入本模块开始（大部分时间花在导入 fastapi / sqlmodel 上）
+_IMPORT_STARTED = time.perf_counter()
 
-from .database import init_db, get_session
-from .models import SpotTrade, ContractBot, Symbol, Bot, Investment, InvestmentPair
+from datetime import datetime
+from typing import Optional
+import io
+import logging
+
+from fastapi import (
+    FastAPI,
+    Depends,
+    File,
+    Query,
+    Request,
+    Response,
+    HTTPException,
+    UploadFile,
+)
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+from sqlmodel import Session, select
+
+from .assets import CompressionMiddleware, StaticAssets
+from .batch import apply_batch
+from .cache import (
+    BOTS,
+    INVESTMENTS,
+    PORTFOLIOS,
+    SPOT,
+    SPOT_REWRITES,
+    bump_versions,
+    cached_summary,
+)
+from .database import (
+    FAST_START,
+    db_ready,
+    dispose_async_engine,
+    engine,
+    ensure_db_ready,
+    get_async_session,
+    get_session,
+    init_db,
+    on_first_use,
+    run_in_session,
+    wait_for_db,
+)
+from .events import summary_feed
+from .export import MEDIA_TYPES, TABLES, export_format, export_spot_summary, export_table
+from .history import (
+    pnl_history,
+    refresh_bot_rollup,
+    refresh_investment_rollup,
+    sync_rollups,
+)
+from .importer import FORMATS, detect_format, import_spot_trades, iter_records
+from .jobs import enqueue_spot_rebuild, job_worker, record_spot_trade_deferred
+from .metrics import (
+    CONTENT_TYPE,
+    PROFILE_CONTROL,
+    TimedRoute,
+    TimingMiddleware,
+    profiler,
+    record_startup,
+    render_metrics,
+    span,
+    startup_report,
+)
+from .migrations import mark_synced, schema_lock, sync_pending
+from .models import (
+    SpotTrade,
+    ContractBot,
+    Symbol,
+    Bot,
+    Investment,
+    InvestmentPair,
+    Job,
+    Portfolio,
+    Price,
+    SpotLot,
+)
+from .pages import render_page
+from .pagination import PageParams, list_page, page_params
+from .portfolios import existing_portfolio, portfolio_param, portfolios_summary
+from .prices import set_prices
+from .search import SearchParams, search_params, search_records
 from .schemas import (
     SpotTradeCreate,
     SpotTradeRead,
     ContractBotCreate,
     ContractBotRead,
     SpotOverallSummary,
-    SpotSymbolSummary,
+    SpotLotRead,
     SymbolCreate,
     SymbolRead,
     BotCreate,
@@ -25,38 +100,131 @@ from .schemas import (
     InvestmentRead,
     InvestmentPairCreate,
     InvestmentPairRead,
+    JobRead,
+    BatchRequest,
+    BatchResult,
+    BulkImportError,
+    BulkImportResult,
+    PnlHistory,
+    PortfolioCreate,
+    PortfolioRead,
+    PortfoliosSummary,
+    PriceRead,
+    PriceUpdate,
+    SearchResult,
 )
-from .services import compute_spot_summary
+from .services import (
+    bots_profit_summary,
+    overall_totals,
+    spot_overall_summary,
+    spot_trade_values,
+    sync_spot_snapshots,
+)
+from .tradestore import TRADE_STORE, trade_page, trade_store
+
+_IMPORTED = time.perf_counter()
+# uvicorn 已为这个 logger 配置了输出
+logger = logging.getLogger("uvicorn.error")
 
 app = FastAPI(title="交易记录")
+app.router.route_class = TimedRoute
+app.add_middleware(CompressionMiddleware)
+# 最外层，计时包括压缩
+app.add_middleware(TimingMiddleware)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
-templates = Jinja2Templates(directory="templates")
+app.mount("/static", StaticAssets(), name="static")
+
+
+# 启动事件开始的时间；脚本直接调用接口（未经过启动事件）时为 None
+_startup_began = None
+
+
+@on_first_use
+def prepare_database():
+    """迁移检查、派生数据校验并启动后台任务；FAST_START=1 时推迟到第一个访问数据库的请求"""
+    t0 = time.perf_counter()
+    init_db()
+    # 派生数据只在结构升级后全量校验一次；已校验过时只读一次标记，不取锁。
+    # 多个 worker 同时启动时依次进入，后面的进程看到标记已更新后直接跳过
+    if sync_pending():
+        with schema_lock(), Session(engine) as session:
+            if sync_pending(session):
+                sync_spot_snapshots(session)
+                sync_rollups(session)
+                mark_synced(session)
+                session.commit()
+    if _startup_began is not None:
+        job_worker.start()
+    elapsed = time.perf_counter() - t0
+    record_startup("database", elapsed)
+    logger.info("database ready in %.3fs", elapsed)
 
 
 @app.on_event("startup")
 def on_startup():
-    init_db()
+    global _startup_began
+    _startup_began = time.perf_counter()
+    if not FAST_START:
+        ensure_db_ready(force=True)
+    elif db_ready():
+        job_worker.start()
+
+
+@app.on_event("shutdown")
+def stop_job_worker():
+    job_worker.stop()
+
+
+@app.on_event("startup")
+async def start_summary_feed():
+    summary_feed.start()
+
+
+@app.on_event("shutdown")
+async def stop_summary_feed():
+    await summary_feed.stop()
+    await dispose_async_engine()
 
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return render_page(request, "index.html")
 
 
 @app.get("/bots", response_class=HTMLResponse)
 async def bots(request: Request):
-    return templates.TemplateResponse("bots.html", {"request": request})
+    return render_page(request, "bots.html")
 
 
 @app.get("/assets", response_class=HTMLResponse)
 async def assets_page(request: Request):
-    return templates.TemplateResponse("assets.html", {"request": request})
+    return render_page(request, "assets.html")
 
 
 @app.get("/calc", response_class=HTMLResponse)
 async def calc_page(request: Request):
-    return templates.TemplateResponse("calculator.html", {"request": request})
+    return render_page(request, "calculator.html")
+
+
+# Portfolios
+@app.get("/api/portfolios", response_model=list[PortfolioRead])
+def list_portfolios(session=Depends(get_session)):
+    rows = session.exec(select(Portfolio).order_by(Portfolio.id.asc())).all()
+    return [PortfolioRead(id=r.id, name=r.name) for r in rows]
+
+
+@app.post("/api/portfolios", response_model=PortfolioRead)
+def create_portfolio(payload: PortfolioCreate, session=Depends(get_session)):
+    name = payload.name.strip()
+    exists = session.exec(select(Portfolio).where(Portfolio.name == name)).first()
+    if exists:
+        return PortfolioRead(id=exists.id, name=exists.name)
+    row = Portfolio(name=name)
+    session.add(row)
+    bump_versions(session, PORTFOLIOS)
+    session.commit()
+    session.refresh(row)
+    return PortfolioRead(id=row.id, name=row.name)
 
 
 # Symbols
@@ -101,45 +269,26 @@ def create_bot(payload: BotCreate, session=Depends(get_session)):
 
 # Spot trades
 @app.post("/api/spot_trades", response_model=SpotTradeRead)
-def create_spot_trade(payload: SpotTradeCreate, session=Depends(get_session)):
-    used_amount_mode = payload.amount_quote is not None and (
-        payload.quantity is None or payload.quantity == 0
-    )
-    quantity = payload.quantity
-    if used_amount_mode:
-        if payload.price <= 0:
-            raise ValueError("price must be > 0 when using amount_quote")
-        quantity = (payload.amount_quote or 0.0) / payload.price
-    if quantity is None or quantity <= 0:
-        raise ValueError("quantity must be positive")
-    if payload.fee is not None:
-        fee = payload.fee
-    else:
-        fee_rate = 0.001
-        if payload.side.upper() == "BUY":
-            if used_amount_mode:
-                gross_quote = quantity * payload.price
-                fee = gross_quote * fee_rate
-            else:
-                fee = quantity * fee_rate
-        else:
-            proceeds = quantity * payload.price
-            fee = proceeds * fee_rate
-    fee_currency = (
-        "quote" if (payload.side.upper() == "SELL" or used_amount_mode) else "base"
-    )
-    trade = SpotTrade(
-        symbol=payload.symbol.upper(),
-        side=payload.side.upper(),
-        quantity=quantity,
-        price=payload.price,
-        fee=fee,
-        fee_currency=fee_currency,
-        traded_at=payload.traded_at or datetime.utcnow(),
-        note=payload.note,
-    )
+def create_spot_trade(
+    payload: SpotTradeCreate,
+    response: Response,
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
+    trade = SpotTrade(portfolio_id=portfolio_id, **spot_trade_values(payload))
     session.add(trade)
+    session.flush()
+    with span("compute"):
+        job = record_spot_trade_deferred(session, trade)
+    bump_versions(session, SPOT, portfolio_id=portfolio_id)
+    trade_store.stage(session, portfolio_id, added=[trade])
     session.commit()
+    if job is None:
+        summary_feed.notify("spot", portfolio_id=portfolio_id)
+    else:
+        # 乱序插入：快照由后台任务重建，完成后推送
+        job_worker.wake()
+        response.headers["X-Job-Id"] = str(job.id)
     session.refresh(trade)
     return SpotTradeRead(
         id=trade.id,
@@ -154,52 +303,91 @@ def create_spot_trade(payload: SpotTradeCreate, session=Depends(get_session)):
     )
 
 
+@app.post("/api/spot_trades/bulk", response_model=BulkImportResult)
+def bulk_import_spot_trades(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(default=None, description="csv 或 jsonl，默认按文件扩展名判断"),
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
+    fmt = (format or detect_format(file.filename) or "").lower()
+    if fmt not in FORMATS:
+        raise HTTPException(status_code=400, detail="format must be csv or jsonl")
+    stream = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    report = import_spot_trades(
+        session, iter_records(stream, fmt), portfolio_id=portfolio_id, defer=True
+    )
+    if report.jobs:
+        job_worker.wake()
+    return BulkImportResult(
+        inserted=report.inserted,
+        failed=report.failed,
+        errors=[BulkImportError(line=ln, error=msg) for ln, msg in report.errors],
+        jobs=report.jobs,
+    )
+
+
 @app.get("/api/spot_trades", response_model=list[SpotTradeRead])
-def list_spot_trades(
-    symbol: Optional[str] = Query(default=None), session=Depends(get_session)
+async def list_spot_trades(
+    symbol: Optional[str] = Query(default=None),
+    page: PageParams = Depends(page_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
 ):
-    stmt = select(SpotTrade)
-    if symbol:
-        stmt = stmt.where(SpotTrade.symbol == symbol.upper())
-    stmt = stmt.order_by(SpotTrade.traded_at.desc())
-    rows = session.exec(stmt).all()
-    return [
-        SpotTradeRead(
-            id=r.id,
-            symbol=r.symbol,
-            side=r.side,
-            quantity=r.quantity,
-            price=r.price,
-            fee=r.fee,
-            fee_currency=r.fee_currency,
-            traded_at=r.traded_at,
-            note=r.note,
+    if TRADE_STORE:
+        # 分页在内存中进行（可能先追上其它进程的写入），放到线程池里，不占用事件循环
+        return await run_in_session(
+            lambda s: trade_page(s, page, portfolio_id, symbol.upper() if symbol else None)
         )
-        for r in rows
-    ]
+    where = (SpotTrade.portfolio_id == portfolio_id,)
+    if symbol:
+        where += (SpotTrade.symbol == symbol.upper(),)
+    return await list_page(
+        session, SpotTrade, SpotTradeRead, "traded_at", page, where=where
+    )
 
 
 @app.delete("/api/spot_trades/{trade_id}")
-def delete_spot_trade(trade_id: int, session=Depends(get_session)):
+def delete_spot_trade(
+    trade_id: int,
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_session),
+):
     row = session.get(SpotTrade, trade_id)
-    if not row:
+    if not row or row.portfolio_id != portfolio_id:
         raise HTTPException(status_code=404, detail="Trade not found")
+    symbol, key = row.symbol, (row.traded_at, row.id)
     session.delete(row)
+    session.flush()
+    # 快照由后台任务从被删除的成交处重建，完成后推送
+    job = enqueue_spot_rebuild(session, symbol, key, portfolio_id)
+    bump_versions(session, SPOT, SPOT_REWRITES, portfolio_id=portfolio_id)
+    trade_store.stage(session, portfolio_id, removed=[row])
     session.commit()
-    return {"ok": True}
+    job_worker.wake()
+    return {"ok": True, "job_id": job.id}
 
 
 # Contract bots
 @app.post("/api/contract_bots", response_model=ContractBotRead)
-def create_contract_bot(payload: ContractBotCreate, session=Depends(get_session)):
+def create_contract_bot(
+    payload: ContractBotCreate,
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
     row = ContractBot(
+        portfolio_id=portfolio_id,
         symbol=payload.symbol.upper(),
         profit=payload.profit,
         closed_at=payload.closed_at or datetime.utcnow(),
         note=payload.note,
     )
     session.add(row)
+    session.flush()
+    refresh_bot_rollup(session, row.symbol, row.closed_at, portfolio_id)
+    bump_versions(session, BOTS, portfolio_id=portfolio_id)
     session.commit()
+    summary_feed.notify("bots", portfolio_id=portfolio_id)
     session.refresh(row)
     return ContractBotRead(
         id=row.id,
@@ -211,91 +399,111 @@ def create_contract_bot(payload: ContractBotCreate, session=Depends(get_session)
 
 
 @app.get("/api/contract_bots", response_model=list[ContractBotRead])
-def list_contract_bots(session=Depends(get_session)):
-    rows = session.exec(
-        select(ContractBot).order_by(ContractBot.closed_at.desc())
-    ).all()
-    return [
-        ContractBotRead(
-            id=r.id,
-            symbol=r.symbol,
-            profit=r.profit,
-            closed_at=r.closed_at,
-            note=r.note,
-        )
-        for r in rows
-    ]
+async def list_contract_bots(
+    page: PageParams = Depends(page_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    where = (ContractBot.portfolio_id == portfolio_id,)
+    return await list_page(
+        session, ContractBot, ContractBotRead, "closed_at", page, where=where
+    )
 
 
 @app.delete("/api/contract_bots/{bot_id}")
-def delete_contract_bot(bot_id: int, session=Depends(get_session)):
+def delete_contract_bot(
+    bot_id: int,
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_session),
+):
     row = session.get(ContractBot, bot_id)
-    if not row:
+    if not row or row.portfolio_id != portfolio_id:
         raise HTTPException(status_code=404, detail="Bot record not found")
+    symbol, closed_at = row.symbol, row.closed_at
     session.delete(row)
+    session.flush()
+    refresh_bot_rollup(session, symbol, closed_at, portfolio_id)
+    bump_versions(session, BOTS, portfolio_id=portfolio_id)
     session.commit()
+    summary_feed.notify("bots", portfolio_id=portfolio_id)
     return {"ok": True}
 
 
 @app.get("/api/summary/spot", response_model=SpotOverallSummary)
-def summary_spot(
-    symbol: Optional[str] = Query(default=None), session=Depends(get_session)
+async def summary_spot(
+    request: Request,
+    symbol: Optional[str] = Query(default=None),
+    as_of: Optional[datetime] = Query(default=None, description="查询该时间（含）时的持仓状态"),
+    method: str = Query(default="avg", pattern="^(avg|fifo|lifo)$", description="成本计算方法：avg、fifo 或 lifo"),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
 ):
-    stmt = select(SpotTrade)
+    sym = symbol.upper() if symbol else None
+    return await cached_summary(
+        request,
+        session,
+        "spot",
+        (sym, as_of, method),
+        lambda s: spot_overall_summary(s, sym, as_of, portfolio_id, method),
+        portfolio_id,
+    )
+
+
+@app.get("/api/spot_lots", response_model=list[SpotLotRead])
+async def list_spot_lots(
+    method: str = Query(default="fifo", pattern="^(fifo|lifo)$", description="fifo 或 lifo"),
+    symbol: Optional[str] = Query(default=None),
+    page: PageParams = Depends(page_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    """按 FIFO / LIFO 匹配后尚未卖完的买入批次（买入时间倒序）"""
+    where = (SpotLot.portfolio_id == portfolio_id, SpotLot.method == method)
     if symbol:
-        stmt = stmt.where(SpotTrade.symbol == symbol.upper())
-    trades = session.exec(stmt).all()
-    states = compute_spot_summary(trades).items()
-    symbol_summaries: list[SpotSymbolSummary] = []
-    total_cost_value = 0.0
-    total_realized = 0.0
-    for sym, s in sorted(states, key=lambda kv: kv[0]):
-        cost_value = s.average_cost * s.quantity
-        symbol_summaries.append(
-            SpotSymbolSummary(
-                symbol=sym,
-                position_quantity=s.quantity,
-                average_cost=s.average_cost,
-                position_cost_value=cost_value,
-                realized_pnl=s.realized_pnl,
-                last_trade_at=s.last_trade_at,
-                last_buy_price=s.last_buy_price,
-                source_price=s.source_price,
-                total_gross_profit=s.total_gross_profit,
-                cost_price=s.cost_price,
-            )
-        )
-        total_cost_value += cost_value
-        total_realized += s.realized_pnl
-    return SpotOverallSummary(
-        symbols=symbol_summaries,
-        total_position_cost_value=total_cost_value,
-        total_realized_pnl=total_realized,
+        where += (SpotLot.symbol == symbol.upper(),)
+    return await list_page(
+        session, SpotLot, SpotLotRead, "acquired_at", page, where=where
     )
 
 
 @app.get("/api/summary/bots", response_model=BotsSummary)
-def bots_summary(session=Depends(get_session)):
-    rows = session.exec(select(ContractBot)).all()
-    total = sum(r.profit for r in rows)
-    by = {}
-    for r in rows:
-        by[r.symbol] = by.get(r.symbol, 0.0) + r.profit
-    by_list = sorted(by.items())
-    return BotsSummary(total_profit=total, by_symbol=by_list)
+async def bots_summary(
+    request: Request,
+    since: Optional[datetime] = Query(default=None, description="起始平仓时间（含）"),
+    until: Optional[datetime] = Query(default=None, description="结束平仓时间（不含）"),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    return await cached_summary(
+        request,
+        session,
+        "bots",
+        (since, until),
+        lambda s: bots_profit_summary(s, since, until, portfolio_id),
+        portfolio_id,
+    )
 
 
 # Investments (single currency entries)
 @app.post("/api/investments", response_model=InvestmentRead)
-def create_investment(payload: InvestmentCreate, session=Depends(get_session)):
+def create_investment(
+    payload: InvestmentCreate,
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
     row = Investment(
+        portfolio_id=portfolio_id,
         currency=payload.currency.upper(),
         amount=payload.amount,
         invested_at=payload.invested_at or datetime.utcnow(),
         note=payload.note,
     )
     session.add(row)
+    session.flush()
+    refresh_investment_rollup(session, row.invested_at, portfolio_id)
+    bump_versions(session, INVESTMENTS, portfolio_id=portfolio_id)
     session.commit()
+    summary_feed.notify("investments", portfolio_id=portfolio_id)
     session.refresh(row)
     return InvestmentRead(
         id=row.id,
@@ -307,33 +515,37 @@ def create_investment(payload: InvestmentCreate, session=Depends(get_session)):
 
 
 @app.get("/api/investments", response_model=list[InvestmentRead])
-def list_investments(session=Depends(get_session)):
-    rows = session.exec(
-        select(Investment).order_by(Investment.invested_at.desc())
-    ).all()
-    return [
-        InvestmentRead(
-            id=r.id,
-            currency=r.currency,
-            amount=r.amount,
-            invested_at=r.invested_at,
-            note=r.note,
-        )
-        for r in rows
-    ]
+async def list_investments(
+    page: PageParams = Depends(page_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    where = (Investment.portfolio_id == portfolio_id,)
+    return await list_page(
+        session, Investment, InvestmentRead, "invested_at", page, where=where
+    )
 
 
 # Investment Pairs
 @app.post("/api/investment_pairs", response_model=InvestmentPairRead)
-def create_investment_pair(payload: InvestmentPairCreate, session=Depends(get_session)):
+def create_investment_pair(
+    payload: InvestmentPairCreate,
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
     row = InvestmentPair(
+        portfolio_id=portfolio_id,
         amount_usdt=payload.amount_usdt,
         amount_myr=payload.amount_myr,
         invested_at=payload.invested_at or datetime.utcnow(),
         note=payload.note,
     )
     session.add(row)
+    session.flush()
+    refresh_investment_rollup(session, row.invested_at, portfolio_id)
+    bump_versions(session, INVESTMENTS, portfolio_id=portfolio_id)
     session.commit()
+    summary_feed.notify("investments", portfolio_id=portfolio_id)
     session.refresh(row)
     return InvestmentPairRead(
         id=row.id,
@@ -345,61 +557,229 @@ def create_investment_pair(payload: InvestmentPairCreate, session=Depends(get_se
 
 
 @app.get("/api/investment_pairs", response_model=list[InvestmentPairRead])
-def list_investment_pairs(session=Depends(get_session)):
-    rows = session.exec(
-        select(InvestmentPair).order_by(InvestmentPair.invested_at.desc())
-    ).all()
-    return [
-        InvestmentPairRead(
-            id=r.id,
-            amount_usdt=r.amount_usdt,
-            amount_myr=r.amount_myr,
-            invested_at=r.invested_at,
-            note=r.note,
-        )
-        for r in rows
-    ]
+async def list_investment_pairs(
+    page: PageParams = Depends(page_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    where = (InvestmentPair.portfolio_id == portfolio_id,)
+    return await list_page(
+        session, InvestmentPair, InvestmentPairRead, "invested_at", page, where=where
+    )
 
 
 @app.delete("/api/investment_pairs/{pair_id}")
-def delete_investment_pair(pair_id: int, session=Depends(get_session)):
+def delete_investment_pair(
+    pair_id: int,
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_session),
+):
     row = session.get(InvestmentPair, pair_id)
-    if not row:
+    if not row or row.portfolio_id != portfolio_id:
         raise HTTPException(status_code=404, detail="Investment pair not found")
+    invested_at = row.invested_at
     session.delete(row)
+    session.flush()
+    refresh_investment_rollup(session, invested_at, portfolio_id)
+    bump_versions(session, INVESTMENTS, portfolio_id=portfolio_id)
     session.commit()
+    summary_feed.notify("investments", portfolio_id=portfolio_id)
     return {"ok": True}
 
 
+# Batch writes
+@app.post("/api/batch", response_model=BatchResult)
+def batch_write(
+    payload: BatchRequest,
+    portfolio_id: int = Depends(existing_portfolio),
+    session=Depends(get_session),
+):
+    """一次提交多条新增 / 删除（币种、机器人名称、现货成交、合约机器人、投入、成对投入），全部成功或全部不写入"""
+    with span("compute"):
+        report = apply_batch(session, payload.operations, portfolio_id)
+    session.commit()
+    if report.topics:
+        summary_feed.notify(*sorted(report.topics), portfolio_id=portfolio_id)
+    if report.jobs:
+        job_worker.wake()
+    return BatchResult(ids=report.ids, jobs=report.jobs)
+
+
+# Search
+@app.get("/api/search", response_model=SearchResult)
+def search(
+    params: SearchParams = Depends(search_params),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_session),
+):
+    """按备注、币种、机器人名称全文搜索现货成交、合约机器人和投入记录，按相关度排序并给出按币种、方向的计数"""
+    return search_records(session, params, portfolio_id)
+
+
+# Background jobs
+@app.get("/api/jobs/{job_id}", response_model=JobRead)
+def get_job(job_id: int, session=Depends(get_session)):
+    """后台任务状态：pending、running、done 或 failed"""
+    row = session.get(Job, job_id)
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return JobRead.model_validate(row, from_attributes=True)
+
+
+# Prices
+@app.get("/api/prices", response_model=list[PriceRead])
+def list_prices(session=Depends(get_session)):
+    rows = session.exec(select(Price).order_by(Price.symbol.asc())).all()
+    return [PriceRead(symbol=r.symbol, price=r.price, updated_at=r.updated_at) for r in rows]
+
+
+@app.post("/api/prices")
+def update_prices(payload: list[PriceUpdate], session=Depends(get_session)):
+    """批量写入最新价格（行情源的替身），现货和总览汇总按这些价格计算市值与未实现盈亏"""
+    count = set_prices(
+        session, ((p.symbol.upper(), p.price, p.updated_at) for p in payload)
+    )
+    session.commit()
+    if count:
+        summary_feed.notify("prices", portfolio_id=None)
+    return {"updated": count}
+
+
+@app.get("/api/stream/summary", dependencies=[Depends(wait_for_db)])
+async def stream_summary(portfolio_id: int = Depends(portfolio_param)):
+    """推送某个组合的汇总：连接后先发送完整快照（event: snapshot），之后每次写入推送差异（event: delta）"""
+    return StreamingResponse(
+        summary_feed.stream(portfolio_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/summary/overall")
-def overall_summary(session=Depends(get_session)):
-    # spot realized pnl only (不把持仓成本计入总资产)
-    spot_rows = session.exec(select(SpotTrade)).all()
-    spot_states = compute_spot_summary(spot_rows)
-    total_realized_pnl = sum(s.realized_pnl for s in spot_states.values())
-
-    # bots profits (USDT侧)
-    bot_total = sum(r.profit for r in session.exec(select(ContractBot)).all())
-
-    # investments (single)
-    invests = session.exec(select(Investment)).all()
-    usdt_invest_single = sum(i.amount for i in invests if i.currency.upper() == "USDT")
-    myr_invest = sum(i.amount for i in invests if i.currency.upper() == "MYR")
-
-    # pairs
-    pairs = session.exec(select(InvestmentPair)).all()
-    pair_usdt = sum(p.amount_usdt for p in pairs)
-    pair_myr = sum(p.amount_myr for p in pairs)
-
-    # totals without conversion: 仅 总投入(USDT) + 机器人利润 + 现货已实现盈亏
-    invest_usdt_total = usdt_invest_single + pair_usdt
-    invest_myr_total = myr_invest + pair_myr
-    pair_usdt_total = invest_usdt_total + bot_total + total_realized_pnl
+async def overall_summary(
+    request: Request,
+    as_of: Optional[datetime] = Query(default=None, description="只统计该时间（含）之前的记录"),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    return await cached_summary(
+        request,
+        session,
+        "overall",
+        (as_of,),
+        lambda s: overall_totals(s, as_of, portfolio_id),
+        portfolio_id,
+    )
+
+
+@app.get("/api/summary/portfolios", response_model=PortfoliosSummary)
+async def summary_portfolios(request: Request, session=Depends(get_async_session)):
+    """跨组合汇总：每个组合的合计、各币种合并持仓和总计（由各组合的快照 / 日汇总相加）"""
+    return await cached_summary(request, session, "portfolios", (), portfolios_summary)
+
+
+@app.get("/api/history/pnl", response_model=PnlHistory)
+async def history_pnl(
+    request: Request,
+    bucket: str = Query(default="day", pattern="^(day|week|month)$", description="day、week 或 month"),
+    symbol: Optional[str] = Query(default=None, description="只看某个币种（现货和机器人）"),
+    portfolio_id: int = Depends(portfolio_param),
+    session=Depends(get_async_session),
+):
+    sym = symbol.upper() if symbol else None
+    return await cached_summary(
+        request,
+        session,
+        "history",
+        (bucket, sym),
+        lambda s: pnl_history(s, bucket, sym, portfolio_id),
+        portfolio_id,
+    )
+
+
+# Exports
+def _download(chunks, name: str, fmt: str) -> StreamingResponse:
+    filename = f"{name}-{datetime.utcnow():%Y%m%d}.{fmt}"
+    return StreamingResponse(
+        chunks,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/export/spot_summary", dependencies=[Depends(wait_for_db)])
+async def export_spot_summary_file(
+    fmt: str = Depends(export_format),
+    as_of: Optional[datetime] = Query(default=None, description="导出该时间（含）时的持仓状态"),
+    portfolio_id: int = Depends(portfolio_param),
+):
+    """每个币种的持仓状态（数量、成本、均价、已实现盈亏、源头价、成本价等）"""
+    return _download(export_spot_summary(fmt, as_of, portfolio_id), "spot_summary", fmt)
+
+
+@app.get("/api/export/{name}", dependencies=[Depends(wait_for_db)])
+async def export_records(
+    name: str,
+    fmt: str = Depends(export_format),
+    symbol: Optional[str] = Query(default=None, description="只导出某个币种（现货、机器人）"),
+    since: Optional[datetime] = Query(default=None, description="起始时间（含）"),
+    until: Optional[datetime] = Query(default=None, description="结束时间（不含）"),
+    portfolio_id: int = Depends(portfolio_param),
+):
+    """导出 spot_trades、contract_bots、investments 或 investment_pairs 的全部列，按时间正序"""
+    if name not in TABLES:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    sym = symbol.upper() if symbol else None
+    return _download(
+        export_table(name, fmt, sym, since, until, portfolio_id=portfolio_id), name, fmt
+    )
+
 
+# Health / metrics / profiling
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """存活检查：不访问数据库，进程开始监听即可响应；database 为 pending 表示尚未完成数据库准备（FAST_START）"""
     return {
-        "spot_realized_pnl": total_realized_pnl,
-        "bots_profit": bot_total,
-        "invest_usdt": invest_usdt_total,
-        "invest_myr": invest_myr_total,
-        "total_assets_pair": {"USDT": pair_usdt_total, "MYR": invest_myr_total},
+        "status": "ok",
+        "database": "ready" if db_ready() else "pending",
+        "startup": startup_report(),
     }
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus 格式的请求与分阶段耗时指标（当前进程）"""
+    return PlainTextResponse(render_metrics(), media_type=CONTENT_TYPE)
+
+
+@app.get("/api/debug/profile")
+async def profile_status():
+    return profiler.status()
+
+
+if PROFILE_CONTROL:
+
+    @app.post("/api/debug/profile")
+    async def configure_profile(
+        every: int = Query(..., ge=0, description="每 N 个请求采样一次，0 为关闭"),
+        limit: Optional[int] = Query(default=None, ge=1, description="最多采样次数，达到后自动关闭"),
+    ):
+        profiler.configure(every, limit)
+        return profiler.status()
+
+
+record_startup("imports", _IMPORTED - _IMPORT_STARTED)
+record_startup("app", time.perf_counter() - _IMPORTED)
+
+
+@app.on_event("startup")
+async def report_startup():
+    # 最后注册，在其它启动事件之后执行
+    now = time.perf_counter()
+    record_startup("startup", now - _startup_began)
+    record_startup("ready", now - _IMPORT_STARTED)
+    logger.info(
+        "startup timing: %s%s",
+        ", ".join(f"{k} {v:.3f}s" for k, v in startup_report().items()),
+        " (database deferred to first request)" if not db_ready() else "",
+    )
@@ -0,0 +1,419 @@
+"""请求耗时统计：分阶段计时、Prometheus 指标、Server-Timing 响应头和按需 cProfile 采样。
+
+阶段（span）：
+- db：SQL 语句执行（通过 SQLAlchemy 游标事件自动记录，次数即查询数）
+- hydrate：读取结果行并构造对象（记录行数）
+- compute：汇总计算、快照维护
+- replay：逐笔回放持仓（记录成交笔数）
+- serialize：Pydantic / JSON 序列化（包括 FastAPI 按 response_model 序列化返回值）
+- endpoint：接口函数本身
+
+阶段之间可以嵌套（endpoint 包含其余阶段，compute 可能包含 db），不能直接相加。
+指标保存在进程内存里，多 worker 部署时每个进程各自统计。
+另外记录一次冷启动各阶段的耗时（tradestore_startup_seconds，也由 /healthz 返回）。
+"""
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import cProfile
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "data/profiles"))
+PROFILE_EVERY = int(os.getenv("PROFILE_EVERY", "0"))
+# 运行中开关采样的 POST 接口只在设置了 PROFILE_CONTROL=1 时注册：采样消耗 CPU 并写文件
+PROFILE_CONTROL = os.getenv("PROFILE_CONTROL", "0").lower() in ("1", "true", "yes")
+# PROFILE_DIR 中最多保留的 .prof 文件数，超出时删除最旧的
+MAX_PROFILES = max(1, int(os.getenv("PROFILE_KEEP", "50")))
+
+
+class Span:
+    __slots__ = ("rows",)
+
+    def __init__(self) -> None:
+        self.rows: Optional[int] = None
+
+
+class RequestTiming:
+    """单个请求的各阶段耗时：name -> [秒, 次数, 行数]"""
+
+    def __init__(self, scope: dict) -> None:
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.spans: dict[str, list] = {}
+        self.endpoint_end: Optional[float] = None
+
+    @property
+    def route(self) -> str:
+        route = self.scope.get("route")
+        return getattr(route, "path_format", None) or "other"
+
+    def add(self, name: str, seconds: float, rows: Optional[int] = None) -> None:
+        entry = self.spans.get(name)
+        if entry is None:
+            entry = self.spans[name] = [0.0, 0, 0]
+        entry[0] += seconds
+        entry[1] += 1
+        if rows is not None:
+            entry[2] += rows
+
+    def server_timing(self) -> str:
+        parts = []
+        for name, (seconds, count, rows) in self.spans.items():
+            desc = f"{rows} rows" if rows else f"{count}x"
+            parts.append(f'{name};dur={seconds * 1000:.2f};desc="{desc}"')
+        total = time.perf_counter() - self.started
+        parts.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(parts)
+
+
+_current: contextvars.ContextVar[Optional[RequestTiming]] = contextvars.ContextVar(
+    "request_timing", default=None
+)
+
+
+@contextmanager
+def span(name: str) -> Iterator[Span]:
+    """记录一个阶段的耗时；可在块内设置 sp.rows 记录行数。不在请求内时不做任何事"""
+    sp = Span()
+    timing = _current.get()
+    if timing is None:
+        yield sp
+        return
+    t0 = time.perf_counter()
+    try:
+        yield sp
+    finally:
+        timing.add(name, time.perf_counter() - t0, sp.rows)
+
+
+# ---- SQL 执行计时（对所有引擎生效，包括异步引擎内部的同步引擎） ----
+
+
+# 开始时间记在本次执行的 context 上：语句出错时没有 after_cursor_execute，随 context 一起丢弃，
+# 不会残留在连接上被后面的查询取到
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current.get() is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timing = _current.get()
+    start = getattr(context, "_query_start", None)
+    if timing is not None and start is not None:
+        timing.add("db", time.perf_counter() - start)
+
+
+# ---- Prometheus 指标 ----
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]) -> None:
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self.buckets = buckets
+        # labels -> [各桶计数（不累计）..., +Inf 计数, 总和]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, entry in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lab = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{lab} {cumulative}")
+            lab = _labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{lab} {entry[-1]:.6f}")
+            lines.append(f"{self.name}_count{lab} {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...]) -> None:
+        self.name, self.help, self.labelnames = name, help, labelnames
+        self._values: dict[tuple, float] = {}
+
+    def set(self, labels: tuple, value: float) -> None:
+        self._values[labels] = value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {value:.6f}")
+        return lines
+
+
+_metrics_lock = threading.Lock()
+REQUEST_LATENCY = Histogram(
+    "tradestore_request_duration_seconds", "HTTP 请求耗时", ("method", "route")
+)
+REQUESTS = Counter(
+    "tradestore_requests_total", "HTTP 请求数", ("method", "route", "status")
+)
+SPAN_LATENCY = Histogram(
+    "tradestore_span_duration_seconds", "各阶段每个请求累计耗时", ("route", "span")
+)
+SPAN_CALLS = Counter(
+    "tradestore_span_calls_total", "各阶段执行次数（db 即 SQL 查询数）", ("route", "span")
+)
+SPAN_ROWS = Counter("tradestore_span_rows_total", "各阶段处理的行数", ("route", "span"))
+STARTUP_SECONDS = Gauge(
+    "tradestore_startup_seconds",
+    "冷启动各阶段耗时：imports（导入依赖）、app（注册路由）、startup（启动事件）、"
+    "ready（导入开始到可以响应请求）、database（数据库迁移检查与派生数据校验）",
+    ("phase",),
+)
+METRICS = (
+    REQUEST_LATENCY, REQUESTS, SPAN_LATENCY, SPAN_CALLS, SPAN_ROWS, STARTUP_SECONDS,
+)
+
+
+def _record(timing: RequestTiming, method: str, status: int) -> None:
+    route = timing.route
+    elapsed = time.perf_counter() - timing.started
+    with _metrics_lock:
+        REQUEST_LATENCY.observe((method, route), elapsed)
+        REQUESTS.inc((method, route, status))
+        for name, (seconds, count, rows) in timing.spans.items():
+            SPAN_LATENCY.observe((route, name), seconds)
+            SPAN_CALLS.inc((route, name), count)
+            if rows:
+                SPAN_ROWS.inc((route, name), rows)
+
+
+def record_startup(phase: str, seconds: float) -> None:
+    with _metrics_lock:
+        STARTUP_SECONDS.set((phase,), seconds)
+
+
+def startup_report() -> dict[str, float]:
+    """已记录的冷启动阶段耗时（秒）"""
+    with _metrics_lock:
+        return {labels[0]: round(v, 4) for labels, v in STARTUP_SECONDS._values.items()}
+
+
+def render_metrics() -> str:
+    with _metrics_lock:
+        lines = [line for m in METRICS for line in m.render()]
+    return "\n".join(lines) + "\n"
+
+
+class TimingMiddleware:
+    """为每个 HTTP 请求建立计时上下文，添加 Server-Timing 响应头并在结束时记录指标"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timing = RequestTiming(scope)
+        token = _current.set(timing)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.server_timing().encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            _record(timing, scope["method"], status)
+
+
+# ---- 按需 cProfile 采样 ----
+
+
+class Profiler:
+    """每 every 个请求对接口函数做一次 cProfile，结果写入 PROFILE_DIR/*.prof。
+
+    运行中通过 /api/debug/profile 开关（需 PROFILE_CONTROL=1），无需重启；every=0 为关闭。
+    同一时间只采样一个请求。异步接口在事件循环线程上采样，期间同线程上其它请求的工作也会计入。
+    """
+
+    def __init__(self, every: int = 0, directory: Path = PROFILE_DIR) -> None:
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._every = every
+        self._remaining: Optional[int] = None
+        self._seen = 0
+        self._active = False
+        self._written = 0
+
+    def configure(self, every: int, limit: Optional[int] = None) -> None:
+        """limit 为最多采样次数，达到后自动关闭"""
+        with self._lock:
+            self._every = every
+            self._remaining = limit if every else None
+            self._seen = 0
+
+    def start(self) -> Optional[cProfile.Profile]:
+        with self._lock:
+            if not self._every or self._active:
+                return None
+            self._seen += 1
+            if self._seen % self._every:
+                return None
+            self._active = True
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # 已有其它分析器在运行
+            with self._lock:
+                self._active = False
+            return None
+        return prof
+
+    def stop(self, prof: cProfile.Profile, route: str) -> None:
+        prof.disable()
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{self._written:05d}-{slug}.prof"
+            prof.dump_stats(self.directory / name)
+            self._prune()
+        finally:
+            with self._lock:
+                self._active = False
+                self._written += 1
+                if self._remaining is not None:
+                    self._remaining -= 1
+                    if self._remaining <= 0:
+                        self._every, self._remaining = 0, None
+
+    def _prune(self) -> None:
+        files = sorted(self.directory.glob("*.prof"))
+        for old in files[:-MAX_PROFILES]:
+            old.unlink(missing_ok=True)
+
+    def status(self) -> dict:
+        files = (
+            sorted(p.name for p in self.directory.glob("*.prof"))
+            if self.directory.is_dir()
+            else []
+        )
+        return {
+            "every": self._every,
+            "remaining": self._remaining,
+            "directory": str(self.directory),
+            "files": files,
+        }
+
+
+profiler = Profiler(PROFILE_EVERY)
+
+
+@contextmanager
+def _endpoint_span() -> Iterator[None]:
+    timing = _current.get()
+    prof = profiler.start() if timing is not None else None
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if prof is not None:
+            profiler.stop(prof, timing.route)
+        if timing is not None:
+            timing.endpoint_end = time.perf_counter()
+            timing.add("endpoint", timing.endpoint_end - t0)
+
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    if asyncio.iscoroutinefunction(endpoint):
+
+        @wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            with _endpoint_span():
+                return await endpoint(*args, **kwargs)
+
+    else:
+
+        @wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            with _endpoint_span():
+                return endpoint(*args, **kwargs)
+
+    return wrapper
+
+
+class TimedRoute(APIRoute):
+    """记录接口函数耗时（endpoint），以及其返回后 FastAPI 序列化响应的耗时（serialize）"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs) -> None:
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            timing = _current.get()
+            if timing is not None and timing.endpoint_end is not None:
+                timing.add("serialize", time.perf_counter() - timing.endpoint_end)
+            return response
+
+        return timed_handler
@@ -0,0 +1,280 @@
+"""数据库结构迁移。
+
+SchemaVersion 表记录已执行到第几步；结构已是最新时，启动只做一次版本检查，不再逐个探测表结构。
+需要迁移时先取得锁（SQLite 为数据库文件旁的 .lock 文件锁，Postgres 为 advisory lock），
+取得锁后再检查一次版本，所以多个 worker / 实例同时启动时只有一个进程执行 DDL，其它进程等它完成后直接跳过。
+
+也可以在启动服务前单独执行：
+
+    python -m app.migrations          # 迁移到最新版本
+    python -m app.migrations --check  # 只检查，不是最新版本时退出码为 1
+
+并设置 MIGRATE_ON_STARTUP=0，worker 启动时只检查版本，不是最新则拒绝启动。
+新增表或列时在 MIGRATIONS 末尾追加一步（不要修改已有的步骤）；每次迁移前先 create_all 建立新增的表，
+只新增表时这一步可以什么都不做。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from sqlalchemy import inspect, select, update
+from sqlalchemy.engine import Connection, Engine
+from sqlmodel import SQLModel
+
+from . import models  # noqa: F401  注册所有表
+from .database import engine
+from .models import SchemaVersion, TableVersion
+from .search import install_bulk_indexing, install_search_index
+
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1").lower() not in ("0", "false", "no")
+
+# Postgres advisory lock 的键（任意固定值，同一数据库的所有进程相同）
+ADVISORY_LOCK_KEY = 0x7472616465
+
+
+def _columns(conn: Connection, table: str) -> set[str]:
+    insp = inspect(conn)
+    if not insp.has_table(table):
+        return set()
+    return {c["name"] for c in insp.get_columns(table)}
+
+
+def _legacy_columns(conn: Connection) -> None:
+    """早期版本之后新增的列"""
+    if "fee_currency" not in _columns(conn, "spottrade"):
+        conn.exec_driver_sql(
+            "ALTER TABLE spottrade ADD COLUMN fee_currency VARCHAR DEFAULT 'quote'"
+        )
+    if "bot_name" not in _columns(conn, "contractbot"):
+        conn.exec_driver_sql("ALTER TABLE contractbot ADD COLUMN bot_name VARCHAR")
+
+
+# 原有数据的表直接加 portfolio_id 列（已有记录归入默认组合）
+PORTFOLIO_TABLES = ("spottrade", "contractbot", "investment", "investmentpair")
+# 主键改变的派生表：删除后由启动校验从原始记录重建
+DERIVED_TABLES = (
+    "spotsymbolsnapshot",
+    "spotsymbolcheckpoint",
+    "spotdailyrollup",
+    "botdailyrollup",
+    "investmentdailyrollup",
+)
+
+
+def _portfolios(conn: Connection) -> None:
+    """按组合拆分"""
+    for table in PORTFOLIO_TABLES:
+        if "portfolio_id" not in _columns(conn, table):
+            conn.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN portfolio_id INTEGER NOT NULL DEFAULT 1"
+            )
+    for table in DERIVED_TABLES:
+        cols = _columns(conn, table)
+        if cols and "portfolio_id" not in cols:
+            conn.exec_driver_sql(f"DROP TABLE {table}")
+    SQLModel.metadata.create_all(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO portfolio (name) SELECT 'default'"
+        " WHERE NOT EXISTS (SELECT 1 FROM portfolio)"
+    )
+
+
+# 列表 / 汇总查询都限定在一个组合内，复合索引以 portfolio_id 开头
+COMPOSITE_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS ix_spottrade_portfolio_symbol_traded_at_id"
+    " ON spottrade (portfolio_id, symbol, traded_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_spottrade_portfolio_traded_at_id"
+    " ON spottrade (portfolio_id, traded_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_contractbot_portfolio_closed_at_id"
+    " ON contractbot (portfolio_id, closed_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_contractbot_portfolio_bot_name_closed_at"
+    " ON contractbot (portfolio_id, bot_name, closed_at, profit)",
+    "CREATE INDEX IF NOT EXISTS ix_contractbot_portfolio_symbol_closed_at"
+    " ON contractbot (portfolio_id, symbol, closed_at, profit)",
+    "CREATE INDEX IF NOT EXISTS ix_investment_portfolio_invested_at_id"
+    " ON investment (portfolio_id, invested_at, id)",
+    "CREATE INDEX IF NOT EXISTS ix_investmentpair_portfolio_invested_at_id"
+    " ON investmentpair (portfolio_id, invested_at, id)",
+)
+
+# 被上面以 portfolio_id 开头的索引取代
+OBSOLETE_INDEXES = (
+    "ix_spottrade_symbol_traded_at_id",
+    "ix_contractbot_bot_name_closed_at",
+    "ix_contractbot_symbol_closed_at",
+)
+
+
+def _indexes(conn: Connection) -> None:
+    for name in OBSOLETE_INDEXES:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {name}")
+    for ddl in COMPOSITE_INDEXES:
+        conn.exec_driver_sql(ddl)
+
+
+def _job_leases(conn: Connection) -> None:
+    """后台任务的租约（执行者与心跳时间）"""
+    cols = _columns(conn, "job")
+    timestamp = "DATETIME" if conn.dialect.name == "sqlite" else "TIMESTAMP"
+    if "worker" not in cols:
+        conn.exec_driver_sql("ALTER TABLE job ADD COLUMN worker VARCHAR")
+    if "heartbeat_at" not in cols:
+        conn.exec_driver_sql(f"ALTER TABLE job ADD COLUMN heartbeat_at {timestamp}")
+
+
+# 按顺序执行；版本号 = 已执行的步数。每一步都可以在没有版本记录的旧数据库上重复执行
+MIGRATIONS: tuple[tuple[str, Callable[[Connection], None]], ...] = (
+    ("legacy columns", _legacy_columns),
+    ("portfolios", _portfolios),
+    ("composite indexes", _indexes),
+    ("full-text search", install_search_index),
+    ("job leases", _job_leases),
+    ("bulk search indexing", install_bulk_indexing),
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(bind: Engine = engine) -> int:
+    """数据库当前的结构版本；还没有版本表（新数据库或迁移功能之前的数据库）时为 0"""
+    with bind.connect() as conn:
+        if not inspect(conn).has_table(SchemaVersion.__tablename__):
+            return 0
+        return conn.execute(select(SchemaVersion.version)).scalar() or 0
+
+
+@contextmanager
+def _file_lock(path: str) -> Iterator[None]:
+    with open(path, "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后放弃，继续等
+                    continue
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextmanager
+def schema_lock(bind: Engine = engine) -> Iterator[None]:
+    """跨进程互斥：同一时间只有一个进程迁移（或执行启动校验）"""
+    if bind.dialect.name == "sqlite":
+        database = bind.url.database
+        if not database or database == ":memory:":
+            yield
+            return
+        with _file_lock(f"{database}.lock"):
+            yield
+    elif bind.dialect.name == "postgresql":
+        with bind.connect() as conn:
+            conn.exec_driver_sql(f"SELECT pg_advisory_lock({ADVISORY_LOCK_KEY})")
+            try:
+                yield
+            finally:
+                conn.exec_driver_sql(f"SELECT pg_advisory_unlock({ADVISORY_LOCK_KEY})")
+                conn.commit()
+    else:
+        yield
+
+
+# 启动校验（派生数据与原始记录比对，不一致的重建）完成时的结构版本，记在 TableVersion 中。
+# 写接口在同一事务内维护派生数据，只有结构升级（新的派生表随迁移步骤一起发布）后才需要再全量校验一次
+SYNC_MARKER = "schema:synced"
+
+
+def sync_pending(bind=engine) -> bool:
+    """派生数据是否还没有按当前结构版本校验过；bind 为 Engine 或 Session"""
+    stmt = select(TableVersion.version).where(TableVersion.name == SYNC_MARKER)
+    if isinstance(bind, Engine):
+        with bind.connect() as conn:
+            synced = conn.execute(stmt).scalar()
+    else:
+        synced = bind.execute(stmt).scalar()
+    return (synced or 0) < SCHEMA_VERSION
+
+
+def mark_synced(session) -> None:
+    """在校验的事务内记下已校验的结构版本"""
+    res = session.execute(
+        update(TableVersion)
+        .where(TableVersion.name == SYNC_MARKER)
+        .values(version=SCHEMA_VERSION)
+    )
+    if res.rowcount == 0:
+        session.execute(
+            TableVersion.__table__.insert().values(name=SYNC_MARKER, version=SCHEMA_VERSION)
+        )
+
+
+def _set_version(conn: Connection, version: int) -> None:
+    res = conn.execute(
+        update(SchemaVersion).where(SchemaVersion.id == 1).values(version=version)
+    )
+    if res.rowcount == 0:
+        conn.execute(SchemaVersion.__table__.insert().values(id=1, version=version))
+
+
+def migrate(bind: Engine = engine) -> int:
+    """迁移到最新版本，返回执行的步数（已是最新时为 0）"""
+    if current_version(bind) >= SCHEMA_VERSION:
+        return 0
+    with schema_lock(bind):
+        # 等锁期间可能已由其它进程完成
+        start = current_version(bind)
+        if start >= SCHEMA_VERSION:
+            return 0
+        SQLModel.metadata.create_all(bind)
+        for version, (_name, step) in enumerate(MIGRATIONS[start:], start=start + 1):
+            with bind.begin() as conn:
+                step(conn)
+                _set_version(conn, version)
+        return SCHEMA_VERSION - start
+
+
+def ensure_schema(bind: Engine = engine) -> None:
+    """服务启动时调用：MIGRATE_ON_STARTUP=0 时只检查版本，否则按需迁移"""
+    if MIGRATE_ON_STARTUP:
+        migrate(bind)
+        return
+    version = current_version(bind)
+    if version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"database schema is at version {version}, expected {SCHEMA_VERSION}; "
+            "run `python -m app.migrations` first"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="迁移数据库结构到最新版本")
+    parser.add_argument("--check", action="store_true", help="只检查，不是最新版本时退出码为 1")
+    args = parser.parse_args(argv)
+    if args.check:
+        version = current_version()
+        print(f"schema version {version} / {SCHEMA_VERSION}")
+        return 0 if version >= SCHEMA_VERSION else 1
+    applied = migrate()
+    print(f"applied {applied} migration(s), schema version {current_version()}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
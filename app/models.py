@@ -1,9 +1,21 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field
 
 
+# 未指定组合时使用的默认组合（升级前的数据都归入它）
+DEFAULT_PORTFOLIO = 1
+
+
+class Portfolio(SQLModel, table=True):
+    """子账户 / 投资组合；成交、机器人、投入记录都属于某个组合"""
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)
+
+
 class Symbol(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     symbol: str = Field(index=True, unique=True)
@@ -16,6 +28,11 @@ class Bot(SQLModel, table=True):
 
 class SpotTrade(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(
+        default=DEFAULT_PORTFOLIO,
+        sa_column_kwargs={"server_default": str(DEFAULT_PORTFOLIO)},
+        description="所属组合",
+    )
     symbol: str = Field(index=True, description="币种，比如 BTCUSDT 或 BTC")
     side: str = Field(description="BUY 或 SELL")
     quantity: float = Field(description="数量（正数）")
@@ -28,6 +45,11 @@ class SpotTrade(SQLModel, table=True):
 
 class ContractBot(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(
+        default=DEFAULT_PORTFOLIO,
+        sa_column_kwargs={"server_default": str(DEFAULT_PORTFOLIO)},
+        description="所属组合",
+    )
     bot_name: Optional[str] = Field(default=None, index=True, description="机器人名称")
     symbol: str = Field(index=True)
     profit: float = Field(description="该机器人本次总利润，正负皆可")
@@ -37,6 +59,11 @@ class ContractBot(SQLModel, table=True):
 
 class Investment(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(
+        default=DEFAULT_PORTFOLIO,
+        sa_column_kwargs={"server_default": str(DEFAULT_PORTFOLIO)},
+        description="所属组合",
+    )
     currency: str = Field(description="USDT 或 MYR")
     amount: float = Field(description="投入金额，正负皆可")
     invested_at: datetime = Field(default_factory=datetime.utcnow, index=True)
@@ -45,7 +72,185 @@ class Investment(SQLModel, table=True):
 
 class InvestmentPair(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(
+        default=DEFAULT_PORTFOLIO,
+        sa_column_kwargs={"server_default": str(DEFAULT_PORTFOLIO)},
+        description="所属组合",
+    )
     amount_usdt: float = Field(default=0.0)
     amount_myr: float = Field(default=0.0)
     invested_at: datetime = Field(default_factory=datetime.utcnow, index=True)
     note: Optional[str] = Field(default=None)
+
+
+class SpotSymbolSnapshot(SQLModel, table=True):
+    """每个组合每个币种的现货状态快照（按时间顺序回放到最后一笔成交后的结果）"""
+
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO, primary_key=True)
+    symbol: str = Field(primary_key=True)
+    quantity: float = Field(default=0.0)
+    cost_basis_total: float = Field(default=0.0)
+    realized_pnl: float = Field(default=0.0)
+    last_trade_at: Optional[datetime] = Field(default=None)
+    last_buy_price: float = Field(default=0.0)
+    total_gross_profit: float = Field(default=0.0)
+    last_trade_id: Optional[int] = Field(default=None)
+    trade_count: int = Field(default=0)
+
+
+class SpotSymbolCheckpoint(SQLModel, table=True):
+    """每 N 笔成交保存一次的状态，乱序插入/删除时从最近的检查点开始回放"""
+
+    __table_args__ = (
+        Index(
+            "ix_spotsymbolcheckpoint_point",
+            "portfolio_id",
+            "symbol",
+            "traded_at",
+            "trade_id",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO)
+    symbol: str
+    trade_count: int = Field(description="检查点包含的成交笔数")
+    traded_at: datetime = Field(description="检查点最后一笔成交的时间")
+    trade_id: int = Field(description="检查点最后一笔成交的 id")
+    quantity: float = Field(default=0.0)
+    cost_basis_total: float = Field(default=0.0)
+    realized_pnl: float = Field(default=0.0)
+    last_buy_price: float = Field(default=0.0)
+    total_gross_profit: float = Field(default=0.0)
+
+
+class SpotLot(SQLModel, table=True):
+    """FIFO / LIFO 计算中尚未卖完的买入批次（卖完即删除）"""
+
+    __table_args__ = (
+        Index(
+            "ix_spotlot_order",
+            "portfolio_id",
+            "symbol",
+            "method",
+            "acquired_at",
+            "trade_id",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO)
+    symbol: str
+    method: str = Field(description="fifo 或 lifo")
+    trade_id: int = Field(description="买入成交的 id")
+    acquired_at: datetime
+    quantity: float = Field(description="买入时的数量（扣除 base 手续费后）")
+    remaining: float = Field(description="尚未卖出的数量")
+    unit_cost: float = Field(description="单位成本（含手续费）")
+
+
+class SpotLotState(SQLModel, table=True):
+    """每个组合每个币种按 FIFO / LIFO 计算的状态，与 SpotSymbolSnapshot 对应"""
+
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO, primary_key=True)
+    symbol: str = Field(primary_key=True)
+    method: str = Field(primary_key=True)
+    quantity: float = Field(default=0.0)
+    cost_basis_total: float = Field(default=0.0)
+    realized_pnl: float = Field(default=0.0)
+    last_trade_at: Optional[datetime] = Field(default=None)
+    last_buy_price: float = Field(default=0.0)
+    total_gross_profit: float = Field(default=0.0)
+    last_trade_id: Optional[int] = Field(default=None)
+    trade_count: int = Field(default=0)
+
+
+class Price(SQLModel, table=True):
+    """各币种的最新价格（默认价格来源；可由行情脚本或 POST /api/prices 写入）"""
+
+    symbol: str = Field(primary_key=True)
+    price: float
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class Job(SQLModel, table=True):
+    """后台任务（目前是现货快照重建）；同一组合同一币种尚未开始的任务合并为一条"""
+
+    __table_args__ = (
+        Index("ix_job_queue", "status", "kind", "portfolio_id", "symbol"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(description="任务类型，比如 spot_rebuild")
+    status: str = Field(default="pending", description="pending、running、done 或 failed")
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO)
+    symbol: Optional[str] = Field(default=None)
+    since_at: Optional[datetime] = Field(
+        default=None, description="受影响的第一笔成交的时间；与 since_id 都为空表示从头重建"
+    )
+    since_id: Optional[int] = Field(default=None)
+    merged: int = Field(default=1, description="合并进来的失效通知次数")
+    attempts: int = Field(default=0)
+    error: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = Field(default=None)
+    finished_at: Optional[datetime] = Field(default=None)
+    worker: Optional[str] = Field(default=None, description="正在执行的工作进程（主机:进程号:随机后缀）")
+    heartbeat_at: Optional[datetime] = Field(
+        default=None, description="执行中定期刷新；超过租期未刷新的 running 任务视为进程已退出"
+    )
+
+
+class SchemaVersion(SQLModel, table=True):
+    """数据库结构版本（只有一行），见 migrations.py"""
+
+    id: int = Field(default=1, primary_key=True)
+    version: int = Field(default=0)
+
+
+class SearchIndexPause(SQLModel, table=True):
+    """批量插入期间暂停逐行同步全文索引（SQLite），见 search.bulk_indexing；只在插入事务内存在"""
+
+    table_name: str = Field(primary_key=True)
+
+
+class TableVersion(SQLModel, table=True):
+    """各类数据的写入版本号，写接口在同一事务内加一；多个进程共用同一个数据库时据此判断缓存是否过期"""
+
+    name: str = Field(primary_key=True)
+    version: int = Field(default=0)
+
+
+# ---- 按日汇总（历史曲线），写入时增量维护 ----
+
+
+class SpotDailyRollup(SQLModel, table=True):
+    """每个组合每个币种每天收盘时的持仓状态（只记录有成交的日期）"""
+
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO, primary_key=True)
+    symbol: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    quantity: float = Field(default=0.0)
+    cost_basis_total: float = Field(default=0.0)
+    realized_pnl: float = Field(default=0.0, description="截至当天的累计已实现盈亏")
+    trade_count: int = Field(default=0, description="当天成交笔数")
+
+
+class BotDailyRollup(SQLModel, table=True):
+    """每个组合每个币种每天的合约机器人利润"""
+
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO, primary_key=True)
+    symbol: str = Field(primary_key=True)
+    day: date = Field(primary_key=True)
+    profit: float = Field(default=0.0)
+    count: int = Field(default=0)
+
+
+class InvestmentDailyRollup(SQLModel, table=True):
+    """每个组合每天的投入金额（单币种投入 + 成对投入）"""
+
+    portfolio_id: int = Field(default=DEFAULT_PORTFOLIO, primary_key=True)
+    day: date = Field(primary_key=True)
+    usdt: float = Field(default=0.0)
+    myr: float = Field(default=0.0)
+    count: int = Field(default=0)
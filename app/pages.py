@@ -0,0 +1,85 @@
+"""页面（首页、机器人、资产、计算器）。
+
+模板不使用请求参数：优先使用 scripts/build_static.py 预渲染的页面（build/pages，含预压缩文件），
+没有构建或模板比构建结果新时渲染一次并缓存，压缩结果也一并缓存；模板文件修改后（修改时间变化）重新渲染。
+页面按 ETag 重新验证（引用的静态文件名带哈希，页面本身不能长期缓存）。
+Jinja2 在第一次渲染页面时才导入，不占用冷启动时间。
+"""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from .assets import BUILD_DIR, ENCODINGS, REVALIDATE, choose_encoding, compress, static_url
+
+TEMPLATE_DIR = Path("templates")
+PAGES_DIR = BUILD_DIR / "pages"
+
+
+@dataclass(frozen=True)
+class _Page:
+    etag: str
+    # 编码 -> 内容，None 为未压缩
+    variants: dict[Optional[str], bytes]
+
+
+def _page(body: bytes, encoded: dict[str, bytes]) -> _Page:
+    etag = '"' + hashlib.sha1(body).hexdigest()[:16] + '"'
+    return _Page(etag=etag, variants={None: body, **encoded})
+
+
+@lru_cache(maxsize=1)
+def _environment():
+    from jinja2 import Environment, FileSystemLoader
+
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=True)
+    env.globals["static_url"] = static_url
+    return env
+
+
+def render_template(name: str) -> bytes:
+    return _environment().get_template(name).render().encode()
+
+
+@lru_cache(maxsize=32)
+def _rendered(name: str, mtime: float) -> _Page:
+    body = render_template(name)
+    return _page(body, compress(body))
+
+
+@lru_cache(maxsize=32)
+def _built(name: str, mtime: float) -> _Page:
+    path = PAGES_DIR / name
+    encoded = {
+        enc: Path(f"{path}{suffix}").read_bytes()
+        for enc, suffix in ENCODINGS
+        if Path(f"{path}{suffix}").is_file()
+    }
+    return _page(path.read_bytes(), encoded)
+
+
+def _load(name: str) -> _Page:
+    mtime = (TEMPLATE_DIR / name).stat().st_mtime
+    built = PAGES_DIR / name
+    if built.is_file():
+        built_mtime = built.stat().st_mtime
+        if built_mtime >= mtime:
+            return _built(name, built_mtime)
+    return _rendered(name, mtime)
+
+
+def render_page(request: Request, name: str) -> Response:
+    page = _load(name)
+    headers = {"ETag": page.etag, "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == page.etag:
+        return Response(status_code=304, headers=headers)
+    encoding = choose_encoding(request.headers.get("accept-encoding", ""), page.variants)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(page.variants[encoding], media_type="text/html", headers=headers)
@@ -0,0 +1,125 @@
+"""列表接口的游标分页（按 (时间, id) 倒序）与字段投影"""
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, select
+from sqlmodel import SQLModel
+from starlette.concurrency import run_in_threadpool
+
+from .encoding import dumps, json_response
+from .metrics import span
+
+MAX_LIMIT = 1000
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+@dataclass
+class PageParams:
+    limit: Optional[int]
+    cursor: Optional[str]
+    since: Optional[datetime]
+    until: Optional[datetime]
+    fields: Optional[str]
+
+
+def page_params(
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_LIMIT, description="每页条数，不传则返回全部"),
+    cursor: Optional[str] = Query(default=None, description="上一页响应头 X-Next-Cursor 的值"),
+    since: Optional[datetime] = Query(default=None, description="起始时间（含）"),
+    until: Optional[datetime] = Query(default=None, description="结束时间（不含）"),
+    fields: Optional[str] = Query(default=None, description="只返回指定字段，逗号分隔"),
+) -> PageParams:
+    return PageParams(limit=limit, cursor=cursor, since=since, until=until, fields=fields)
+
+
+def encode_cursor(ts: datetime, row_id: int) -> str:
+    raw = f"{ts.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _naive(dt: datetime) -> datetime:
+    # 时间列存储时不带时区
+    return dt.replace(tzinfo=None)
+
+
+def requested_fields(read_model: type[BaseModel], page: PageParams) -> list[str]:
+    """返回的字段：fields 指定的（须是 read_model 的字段），否则为 read_model 的全部字段"""
+    names = list(read_model.model_fields)
+    if page.fields:
+        wanted = [f.strip() for f in page.fields.split(",") if f.strip()]
+        unknown = [f for f in wanted if f not in names]
+        if unknown:
+            raise HTTPException(
+                status_code=400, detail=f"unknown fields: {', '.join(unknown)}"
+            )
+        names = wanted
+    return names
+
+
+def _page_body(rows: list, names: list[str], time_field: str, page: PageParams) -> Response:
+    headers = {}
+    if page.limit is not None and len(rows) > page.limit:
+        rows = rows[: page.limit]
+        last = rows[-1]._mapping
+        headers[NEXT_CURSOR_HEADER] = encode_cursor(last[time_field], last["id"])
+
+    with span("serialize") as sp:
+        # 查询列以 names 开头，zip 截掉额外的游标列
+        body = dumps([dict(zip(names, r)) for r in rows])
+        sp.rows = len(rows)
+    return json_response(body, headers)
+
+
+async def list_page(
+    session,
+    model: type[SQLModel],
+    read_model: type[BaseModel],
+    time_field: str,
+    page: PageParams,
+    where: tuple = (),
+) -> Response:
+    """按 (time_field, id) 倒序分页读取 model，返回 JSON 响应。
+
+    只查询 read_model（或 fields 指定）的列，结果行直接编码为 JSON，
+    不构造 ORM / Pydantic 对象；输出与按 response_model 序列化 read_model 列表相同。
+    还有下一页时在响应头 X-Next-Cursor 中返回游标。
+    查询在异步 session 上执行，编码（不分页时可能很多行）在线程池中进行，不占用事件循环。
+    """
+    names = requested_fields(read_model, page)
+    time_col = getattr(model, time_field)
+    id_col = model.id
+    # 游标需要时间和 id，额外查出但不返回
+    select_names = names + [n for n in (time_field, "id") if n not in names]
+    stmt = select(*(getattr(model, n) for n in select_names)).where(*where)
+    if page.since is not None:
+        stmt = stmt.where(time_col >= _naive(page.since))
+    if page.until is not None:
+        stmt = stmt.where(time_col < _naive(page.until))
+    if page.cursor:
+        ts, row_id = decode_cursor(page.cursor)
+        stmt = stmt.where(
+            or_(time_col < ts, and_(time_col == ts, id_col < row_id))
+        )
+    stmt = stmt.order_by(time_col.desc(), id_col.desc())
+    if page.limit is not None:
+        stmt = stmt.limit(page.limit + 1)
+
+    with span("hydrate") as sp:
+        rows = (await session.execute(stmt)).all()
+        sp.rows = len(rows)
+    return await run_in_threadpool(_page_body, rows, names, time_field, page)
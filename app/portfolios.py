@@ -0,0 +1,132 @@
+"""组合（子账户）：请求参数、写入前的存在性校验，以及跨组合汇总。
+
+跨组合汇总只读取各组合已经维护好的结果（现货快照、机器人 / 投入日汇总），
+按 portfolio_id GROUP BY 后相加，不重新扫描成交记录；开销只与 组合数 × 币种数（天数）有关。
+"""
+from __future__ import annotations
+
+from fastapi import Depends, HTTPException, Query
+from sqlalchemy import case, func
+from sqlmodel import Session, select
+
+from .database import get_session
+from .models import (
+    DEFAULT_PORTFOLIO,
+    BotDailyRollup,
+    InvestmentDailyRollup,
+    Portfolio,
+    SpotSymbolSnapshot,
+)
+from .schemas import AggregateSymbol, AggregateTotals, PortfolioTotals, PortfoliosSummary
+
+
+def portfolio_param(
+    portfolio_id: int = Query(default=DEFAULT_PORTFOLIO, ge=1, description="组合 id，默认 1"),
+) -> int:
+    return portfolio_id
+
+
+def existing_portfolio(
+    portfolio_id: int = Depends(portfolio_param), session=Depends(get_session)
+) -> int:
+    """写接口使用：组合不存在时返回 404（读接口对不存在的组合返回空结果）"""
+    if session.get(Portfolio, portfolio_id) is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return portfolio_id
+
+
+# 与 spot_overall_summary 一致：没有持仓时持仓成本记为 0
+_COST_VALUE = func.sum(
+    case(
+        (SpotSymbolSnapshot.quantity > 0, SpotSymbolSnapshot.cost_basis_total),
+        else_=0.0,
+    )
+)
+
+
+def _totals(realized: float, cost_value: float, bots: float, usdt: float, myr: float) -> dict:
+    return {
+        "spot_realized_pnl": realized,
+        "spot_position_cost_value": cost_value,
+        "bots_profit": bots,
+        "invest_usdt": usdt,
+        "invest_myr": myr,
+        "total_assets_pair": {"USDT": usdt + bots + realized, "MYR": myr},
+    }
+
+
+def portfolios_summary(session: Session) -> PortfoliosSummary:
+    """每个组合的合计、各币种跨组合合并后的持仓，以及全部组合的总计"""
+    names = dict(session.exec(select(Portfolio.id, Portfolio.name)).all())
+    spot = {
+        pid: (realized, cost_value)
+        for pid, realized, cost_value in session.exec(
+            select(
+                SpotSymbolSnapshot.portfolio_id,
+                func.sum(SpotSymbolSnapshot.realized_pnl),
+                _COST_VALUE,
+            ).group_by(SpotSymbolSnapshot.portfolio_id)
+        ).all()
+    }
+    bots = dict(
+        session.exec(
+            select(BotDailyRollup.portfolio_id, func.sum(BotDailyRollup.profit))
+            .group_by(BotDailyRollup.portfolio_id)
+        ).all()
+    )
+    invested = {
+        pid: (usdt, myr)
+        for pid, usdt, myr in session.exec(
+            select(
+                InvestmentDailyRollup.portfolio_id,
+                func.sum(InvestmentDailyRollup.usdt),
+                func.sum(InvestmentDailyRollup.myr),
+            ).group_by(InvestmentDailyRollup.portfolio_id)
+        ).all()
+    }
+
+    portfolios = []
+    for pid in sorted(set(names) | set(spot) | set(bots) | set(invested)):
+        realized, cost_value = spot.get(pid, (0.0, 0.0))
+        usdt, myr = invested.get(pid, (0.0, 0.0))
+        portfolios.append(
+            PortfolioTotals(
+                portfolio_id=pid,
+                name=names.get(pid),
+                **_totals(realized, cost_value, bots.get(pid, 0.0), usdt, myr),
+            )
+        )
+
+    symbols = []
+    for sym, qty, cost_value, realized, count in session.exec(
+        select(
+            SpotSymbolSnapshot.symbol,
+            func.sum(SpotSymbolSnapshot.quantity),
+            _COST_VALUE,
+            func.sum(SpotSymbolSnapshot.realized_pnl),
+            func.count(),
+        )
+        .group_by(SpotSymbolSnapshot.symbol)
+        .order_by(SpotSymbolSnapshot.symbol)
+    ).all():
+        symbols.append(
+            AggregateSymbol(
+                symbol=sym,
+                position_quantity=qty,
+                average_cost=cost_value / qty if qty > 0 else 0.0,
+                position_cost_value=cost_value,
+                realized_pnl=realized,
+                portfolios=count,
+            )
+        )
+
+    totals = _totals(
+        sum(p.spot_realized_pnl for p in portfolios),
+        sum(p.spot_position_cost_value for p in portfolios),
+        sum(p.bots_profit for p in portfolios),
+        sum(p.invest_usdt for p in portfolios),
+        sum(p.invest_myr for p in portfolios),
+    )
+    return PortfoliosSummary(
+        portfolios=portfolios, symbols=symbols, totals=AggregateTotals(**totals)
+    )
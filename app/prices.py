@@ -0,0 +1,112 @@
+"""持仓估值用的价格来源。
+
+PriceSource 一次查询一批币种的价格；默认实现读取 Price 表（行情源的本地替身，
+由 POST /api/prices 或 scripts/load_prices.py 写入）。外层是进程内的 TTL 缓存：
+一次汇总只为缓存中没有或已过期的币种发一次批量查询，汇总耗时不随需要价格的币种数量增长。
+Price 表写入时 TableVersion 中的 price 加一，缓存发现版本变化即整体失效，多个进程之间不会读到旧价格。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Iterable, Optional, Protocol, Sequence
+
+from sqlmodel import Session, select
+
+from .cache import PRICES, bump_versions, current_versions
+from .models import Price
+
+PRICE_CACHE_TTL = float(os.getenv("PRICE_CACHE_TTL", "30"))
+
+
+class PriceSource(Protocol):
+    def get_prices(self, session: Session, symbols: Sequence[str]) -> dict[str, float]:
+        """返回 {币种: 价格}；没有价格的币种不在结果中"""
+        ...
+
+
+class TablePriceSource:
+    """从 Price 表读取，一次 IN 查询"""
+
+    def get_prices(self, session: Session, symbols: Sequence[str]) -> dict[str, float]:
+        if not symbols:
+            return {}
+        return dict(
+            session.exec(
+                select(Price.symbol, Price.price).where(Price.symbol.in_(symbols))
+            ).all()
+        )
+
+
+class PriceCache:
+    """给任意 PriceSource 加上按币种的 TTL 缓存（没有价格的结果同样缓存）"""
+
+    def __init__(self, source: PriceSource, ttl: float = PRICE_CACHE_TTL) -> None:
+        self.source = source
+        self.ttl = ttl
+        self._data: dict[str, tuple[Optional[float], float]] = {}
+        self._version: Optional[tuple[int, ...]] = None
+        self._lock = threading.Lock()
+
+    def get_prices(self, session: Session, symbols: Sequence[str]) -> dict[str, float]:
+        version = current_versions(session, (PRICES,))
+        now = time.monotonic()
+        out: dict[str, float] = {}
+        missing = []
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+            for sym in symbols:
+                entry = self._data.get(sym)
+                if entry is None or entry[1] <= now:
+                    missing.append(sym)
+                elif entry[0] is not None:
+                    out[sym] = entry[0]
+        if missing:
+            fetched = self.source.get_prices(session, missing)
+            expires = now + self.ttl
+            with self._lock:
+                for sym in missing:
+                    price = fetched.get(sym)
+                    self._data[sym] = (price, expires)
+                    if price is not None:
+                        out[sym] = price
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+_source = PriceCache(TablePriceSource())
+
+
+def set_price_source(source: PriceSource, ttl: float = PRICE_CACHE_TTL) -> None:
+    """替换价格来源（比如接入交易所行情）"""
+    global _source
+    _source = PriceCache(source, ttl)
+
+
+def get_prices(session: Session, symbols: Iterable[str]) -> dict[str, float]:
+    return _source.get_prices(session, list(symbols))
+
+
+def set_prices(
+    session: Session, items: Iterable[tuple[str, float, Optional[datetime]]]
+) -> int:
+    """写入（或更新）价格并把价格版本号加一；不提交"""
+    count = 0
+    for symbol, price, updated_at in items:
+        row = session.get(Price, symbol)
+        if row is None:
+            row = Price(symbol=symbol, price=price)
+            session.add(row)
+        row.price = price
+        row.updated_at = (updated_at or datetime.utcnow()).replace(tzinfo=None)
+        count += 1
+    if count:
+        bump_versions(session, PRICES)
+    return count
@@ -1,9 +1,18 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional
 
 from pydantic import BaseModel, Field, field_validator
 
 
+class PortfolioCreate(BaseModel):
+    name: str
+
+
+class PortfolioRead(BaseModel):
+    id: int
+    name: str
+
+
 class SymbolCreate(BaseModel):
     symbol: str
 
@@ -30,6 +39,9 @@ class SpotTradeCreate(BaseModel):
     price: float
     fee: Optional[float] = None
     fee_mode: Optional[str] = Field(default=None, description="maker 或 taker")
+    fee_currency: Optional[str] = Field(
+        default=None, description="base 或 quote；不填时按方向和录入方式推断（导出的文件带有此列）"
+    )
     traded_at: Optional[datetime] = None
     note: Optional[str] = None
 
@@ -41,6 +53,16 @@ class SpotTradeCreate(BaseModel):
             raise ValueError("side must be BUY or SELL")
         return vv
 
+    @field_validator("fee_currency")
+    @classmethod
+    def normalize_fee_currency(cls, v: Optional[str]) -> Optional[str]:
+        if v is None:
+            return v
+        vv = v.lower()
+        if vv not in {"base", "quote"}:
+            raise ValueError("fee_currency must be base or quote")
+        return vv
+
 
 class SpotTradeRead(BaseModel):
     id: int
@@ -72,6 +94,7 @@ class ContractBotRead(BaseModel):
 class BotsSummary(BaseModel):
     total_profit: float
     by_symbol: list[tuple[str, float]]
+    by_bot_name: list[tuple[Optional[str], float]] = []
 
 
 class SpotSymbolSummary(BaseModel):
@@ -85,12 +108,29 @@ class SpotSymbolSummary(BaseModel):
     source_price: float
     total_gross_profit: float
     cost_price: float
+    market_price: Optional[float] = None
+    market_value: Optional[float] = None
+    unrealized_pnl: Optional[float] = None
+
+
+class SpotLotRead(BaseModel):
+    id: int
+    symbol: str
+    trade_id: int
+    acquired_at: datetime
+    quantity: float
+    remaining: float
+    unit_cost: float
 
 
 class SpotOverallSummary(BaseModel):
     symbols: list[SpotSymbolSummary]
     total_position_cost_value: float
     total_realized_pnl: float
+    # 按当前价格估值；as_of 查询时为空
+    total_market_value: Optional[float] = None
+    total_unrealized_pnl: Optional[float] = None
+    unpriced_symbols: list[str] = Field(default=[], description="有持仓但没有价格、未计入市值的币种")
 
 
 class InvestmentCreate(BaseModel):
@@ -129,3 +169,157 @@ class InvestmentPairRead(BaseModel):
     amount_myr: float
     invested_at: datetime
     note: Optional[str]
+
+
+class PriceUpdate(BaseModel):
+    symbol: str
+    price: float = Field(..., gt=0)
+    updated_at: Optional[datetime] = None
+
+
+class PriceRead(BaseModel):
+    symbol: str
+    price: float
+    updated_at: datetime
+
+
+class BulkImportError(BaseModel):
+    line: int
+    error: str
+
+
+class BulkImportResult(BaseModel):
+    inserted: int
+    failed: int
+    errors: list[BulkImportError]
+    jobs: list[int] = Field(default=[], description="排队重建快照的后台任务 id")
+
+
+class JobRead(BaseModel):
+    id: int
+    kind: str
+    status: str
+    portfolio_id: int
+    symbol: Optional[str]
+    since_at: Optional[datetime]
+    merged: int
+    attempts: int
+    error: Optional[str]
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+
+class SpotHistoryPoint(BaseModel):
+    period: date
+    realized_pnl: float
+    cumulative_realized_pnl: float
+    quantity: float
+    average_cost: float
+    position_cost_value: float
+    trade_count: int
+
+
+class SpotSymbolHistory(BaseModel):
+    symbol: str
+    points: list[SpotHistoryPoint]
+
+
+class SpotTotalHistoryPoint(BaseModel):
+    period: date
+    realized_pnl: float
+    cumulative_realized_pnl: float
+    position_cost_value: float
+
+
+class BotsHistoryPoint(BaseModel):
+    period: date
+    profit: float
+    cumulative_profit: float
+    count: int
+
+
+class InvestedHistoryPoint(BaseModel):
+    period: date
+    usdt: float
+    myr: float
+    cumulative_usdt: float
+    cumulative_myr: float
+
+
+class PnlHistory(BaseModel):
+    bucket: str
+    spot: list[SpotSymbolHistory]
+    spot_total: list[SpotTotalHistoryPoint]
+    bots: list[BotsHistoryPoint]
+    invested: list[InvestedHistoryPoint]
+
+
+class AggregateTotals(BaseModel):
+    spot_realized_pnl: float
+    spot_position_cost_value: float
+    bots_profit: float
+    invest_usdt: float
+    invest_myr: float
+    total_assets_pair: dict[str, float]
+
+
+class PortfolioTotals(AggregateTotals):
+    portfolio_id: int
+    name: Optional[str]
+
+
+class AggregateSymbol(BaseModel):
+    symbol: str
+    position_quantity: float
+    average_cost: float
+    position_cost_value: float
+    realized_pnl: float
+    portfolios: int
+
+
+class PortfoliosSummary(BaseModel):
+    portfolios: list[PortfolioTotals]
+    symbols: list[AggregateSymbol]
+    totals: AggregateTotals
+
+
+class SearchHit(BaseModel):
+    kind: str = Field(description="spot、bot 或 investment")
+    id: int
+    symbol: Optional[str]
+    side: Optional[str]
+    bot_name: Optional[str]
+    note: Optional[str]
+    at: datetime
+    score: float = Field(description="相关度，越大越相关；没有关键词时为 0")
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class SearchResult(BaseModel):
+    total: int
+    hits: list[SearchHit]
+    facets: dict[str, list[FacetCount]]
+
+
+class BatchOperation(BaseModel):
+    op: str = Field(..., pattern="^(create|delete)$")
+    type: str = Field(
+        ...,
+        pattern="^(symbol|bot|spot_trade|contract_bot|investment|investment_pair)$",
+    )
+    data: Optional[dict] = Field(default=None, description="新增的内容，字段与各自的新增接口相同")
+    id: Optional[int] = Field(default=None, description="要删除的记录 id")
+
+
+class BatchRequest(BaseModel):
+    operations: list[BatchOperation] = Field(..., min_length=1, max_length=5000)
+
+
+class BatchResult(BaseModel):
+    ids: list[Optional[int]] = Field(description="与 operations 一一对应的记录 id")
+    jobs: list[int] = Field(default=[], description="排队重建快照的后台任务 id")
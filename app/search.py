@@ -0,0 +1,382 @@
+"""现货成交、合约机器人和投入记录的全文搜索（备注、币种、机器人名称）。
+
+SQLite 为每张表建一个 FTS5 外部内容表（trigram 分词，中文备注也能按任意连续三个字以上的片段匹配），
+由触发器在插入 / 修改 / 删除时同步；Postgres 为生成列 search_vector（tsvector）加 GIN 索引，
+按整词匹配。两者都由 migrations.py 中的一步建立，并为已有记录建立索引。
+
+结果按相关度排序（相关度相同按时间倒序），分页返回，并给出按币种、方向的计数：
+某一维度的计数不受该维度本身的筛选影响，方便切换选项。
+"""
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, Optional
+
+from fastapi import Query
+from sqlalchemy import (
+    column,
+    delete,
+    func,
+    insert,
+    literal,
+    literal_column,
+    null,
+    or_,
+    select,
+    table,
+    text,
+    union_all,
+)
+from sqlalchemy.engine import Connection
+from sqlmodel import Session
+
+from .metrics import span
+from .models import DEFAULT_PORTFOLIO, ContractBot, Investment, SearchIndexPause, SpotTrade
+from .schemas import FacetCount, SearchHit, SearchResult
+
+MAX_LIMIT = 200
+# trigram 分词：少于 3 个字的词无法使用索引，改为在原表上按子串匹配
+MIN_TERM_LENGTH = 3
+FACETS = ("symbol", "side")
+
+
+@dataclass(frozen=True)
+class _Source:
+    kind: str
+    model: type
+    time_field: str
+    # 被索引的文本列
+    columns: tuple[str, ...]
+
+    @property
+    def table_name(self) -> str:
+        return self.model.__tablename__
+
+    @property
+    def fts(self) -> str:
+        return f"{self.table_name}_fts"
+
+
+SOURCES = (
+    _Source("spot", SpotTrade, "traded_at", ("symbol", "note")),
+    _Source("bot", ContractBot, "closed_at", ("symbol", "bot_name", "note")),
+    _Source("investment", Investment, "invested_at", ("currency", "note")),
+)
+
+
+def _sqlite_ddl(src: _Source) -> list[str]:
+    cols = ", ".join(src.columns)
+    new = ", ".join(f"new.{c}" for c in src.columns)
+    old = ", ".join(f"old.{c}" for c in src.columns)
+    remove = (
+        f"INSERT INTO {src.fts} ({src.fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    )
+    add = f"INSERT INTO {src.fts} (rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {src.fts} USING fts5({cols},"
+        f" content='{src.table_name}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {src.fts}_ai AFTER INSERT ON {src.table_name}"
+        f" BEGIN {add} END",
+        f"CREATE TRIGGER IF NOT EXISTS {src.fts}_ad AFTER DELETE ON {src.table_name}"
+        f" BEGIN {remove} END",
+        f"CREATE TRIGGER IF NOT EXISTS {src.fts}_au AFTER UPDATE ON {src.table_name}"
+        f" BEGIN {remove} {add} END",
+        # 为已有记录建立索引
+        f"INSERT INTO {src.fts} ({src.fts}) VALUES ('rebuild')",
+    ]
+
+
+def _postgres_ddl(src: _Source) -> list[str]:
+    text = " || ' ' || ".join(f"coalesce({c}, '')" for c in src.columns)
+    return [
+        f"ALTER TABLE {src.table_name} ADD COLUMN IF NOT EXISTS search_vector tsvector"
+        f" GENERATED ALWAYS AS (to_tsvector('simple', {text})) STORED",
+        f"CREATE INDEX IF NOT EXISTS ix_{src.table_name}_search"
+        f" ON {src.table_name} USING gin (search_vector)",
+    ]
+
+
+def _pausable_insert_trigger(src: _Source) -> list[str]:
+    cols = ", ".join(src.columns)
+    new = ", ".join(f"new.{c}" for c in src.columns)
+    pause = SearchIndexPause.__tablename__
+    return [
+        f"DROP TRIGGER IF EXISTS {src.fts}_ai",
+        f"CREATE TRIGGER {src.fts}_ai AFTER INSERT ON {src.table_name}"
+        f" WHEN NOT EXISTS (SELECT 1 FROM {pause} WHERE table_name = '{src.table_name}')"
+        f" BEGIN INSERT INTO {src.fts} (rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def install_bulk_indexing(conn: Connection) -> None:
+    """插入触发器改为可暂停：SearchIndexPause 中有该表的记录时不逐行写全文索引（迁移时调用，可重复执行）"""
+    if conn.dialect.name != "sqlite":
+        return
+    for src in SOURCES:
+        for stmt in _pausable_insert_trigger(src):
+            conn.exec_driver_sql(stmt)
+
+
+@contextmanager
+def bulk_indexing(session: Session, model) -> Iterator[None]:
+    """在同一事务内批量插入 model 的记录时使用：暂停逐行写全文索引，结束时用一条 INSERT ... SELECT
+    为新插入的记录建立索引。trigram 分词逐行写入约占批量插入耗时的一半。
+
+    暂停标记和插入在同一事务中，提交前其它连接看不到；出错回滚时标记一并撤销。Postgres 不需要处理。
+    """
+    src = next(s for s in SOURCES if s.model is model)
+    pause = SearchIndexPause.__tablename__
+    if session.get_bind().dialect.name != "sqlite" or not session.execute(
+        text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+            " AND sql LIKE :pause"
+        ),
+        {"name": f"{src.fts}_ai", "pause": f"%{pause}%"},
+    ).first():
+        # 没有可暂停的触发器（未迁移的库或测试用 create_all 建的库）时照常插入
+        yield
+        return
+    t = model.__table__
+    session.execute(insert(SearchIndexPause).values(table_name=src.table_name))
+    start = session.execute(select(func.max(t.c.id))).scalar() or 0
+    yield
+    fts = table(src.fts, column("rowid"), *(column(c) for c in src.columns))
+    session.execute(
+        insert(fts).from_select(
+            ["rowid", *src.columns],
+            select(t.c.id, *(t.c[c] for c in src.columns)).where(t.c.id > start),
+        )
+    )
+    session.execute(
+        delete(SearchIndexPause).where(SearchIndexPause.table_name == src.table_name)
+    )
+
+
+def install_search_index(conn: Connection) -> None:
+    """建立全文索引及同步触发器（迁移时调用，可重复执行）"""
+    dialect = conn.dialect.name
+    for src in SOURCES:
+        if dialect == "sqlite":
+            ddl = _sqlite_ddl(src)
+        elif dialect == "postgresql":
+            ddl = _postgres_ddl(src)
+        else:
+            continue
+        for stmt in ddl:
+            conn.exec_driver_sql(stmt)
+
+
+@dataclass
+class SearchParams:
+    q: Optional[str]
+    symbol: Optional[str]
+    side: Optional[str]
+    bot_name: Optional[str]
+    since: Optional[datetime]
+    until: Optional[datetime]
+    limit: int
+    offset: int
+
+
+def search_params(
+    q: Optional[str] = Query(default=None, description="关键词，空格分隔的多个词需同时出现；不传则只按条件筛选"),
+    symbol: Optional[str] = Query(default=None),
+    side: Optional[str] = Query(default=None, pattern="^(BUY|SELL|buy|sell)$", description="只搜索现货成交"),
+    bot_name: Optional[str] = Query(default=None, description="只搜索合约机器人"),
+    since: Optional[datetime] = Query(default=None, alias="from", description="起始时间（含）"),
+    until: Optional[datetime] = Query(default=None, alias="to", description="结束时间（不含）"),
+    limit: int = Query(default=50, ge=1, le=MAX_LIMIT),
+    offset: int = Query(default=0, ge=0),
+) -> SearchParams:
+    return SearchParams(
+        q=q.strip() if q else None,
+        symbol=symbol.upper() if symbol else None,
+        side=side.upper() if side else None,
+        bot_name=bot_name,
+        since=since.replace(tzinfo=None) if since else None,
+        until=until.replace(tzinfo=None) if until else None,
+        limit=limit,
+        offset=offset,
+    )
+
+
+def _fts_phrase(term: str) -> str:
+    # 每个词作为一个短语，避免用户输入被当作 FTS5 查询语法
+    return '"' + term.replace('"', '""') + '"'
+
+
+def _source_select(
+    src: _Source,
+    params: SearchParams,
+    dialect: str,
+    portfolio_id: int,
+    skip: Optional[str] = None,
+    ranked: bool = True,
+):
+    """单个来源满足条件的记录；skip 为计算该维度计数时忽略的筛选，ranked 为假时只取计数需要的列。
+    来源不适用于筛选条件时返回 None
+    """
+    t = src.model.__table__
+    has = set(t.c.keys())
+    if params.side and skip != "side" and "side" not in has:
+        return None
+    if params.bot_name and "bot_name" not in has:
+        return None
+    if params.symbol and skip != "symbol" and "symbol" not in has:
+        return None
+
+    terms = params.q.split() if params.q else []
+    indexed = [w for w in terms if len(w) >= MIN_TERM_LENGTH]
+    use_fts = dialect == "sqlite" and bool(indexed)
+
+    def filter_col(name: str):
+        if use_fts:
+            # 一元 + 让 SQLite 不使用原表上的索引，从全文索引的匹配结果出发按主键回表；
+            # 否则查询计划会按 portfolio_id 索引扫描整个组合再逐行 MATCH
+            return literal_column(f"+{src.table_name}.{name}", type_=t.c[name].type)
+        return t.c[name]
+
+    at = filter_col(src.time_field)
+    where = [filter_col("portfolio_id") == portfolio_id]
+    if params.symbol and skip != "symbol":
+        where.append(filter_col("symbol") == params.symbol)
+    if params.side and skip != "side":
+        where.append(filter_col("side") == params.side)
+    if params.bot_name:
+        where.append(filter_col("bot_name") == params.bot_name)
+    if params.since is not None:
+        where.append(at >= params.since)
+    if params.until is not None:
+        where.append(at < params.until)
+
+    score = literal(0.0)
+    source = t
+    if terms and dialect == "postgresql":
+        vector = literal_column(f"{src.table_name}.search_vector")
+        query = func.plainto_tsquery("simple", params.q)
+        where.append(vector.op("@@")(query))
+        score = func.ts_rank(vector, query)
+    elif terms:
+        for w in terms:
+            if len(w) < MIN_TERM_LENGTH:
+                where.append(or_(*(t.c[c].contains(w, autoescape=True) for c in src.columns)))
+        if use_fts:
+            fts = table(src.fts, column("rowid"))
+            source = t.join(fts, fts.c.rowid == t.c.id)
+            where.append(
+                literal_column(src.fts).op("MATCH")(" ".join(map(_fts_phrase, indexed)))
+            )
+            # bm25 越小越相关
+            score = -literal_column(f"bm25({src.fts})")
+
+    def col(name: str):
+        return t.c[name] if name in has else null()
+
+    if not ranked:
+        return (
+            select(*(col(f).label(f) for f in FACETS)).select_from(source).where(*where)
+        )
+    return (
+        select(
+            literal(src.kind).label("kind"),
+            t.c.id.label("id"),
+            col("symbol").label("symbol"),
+            col("side").label("side"),
+            col("bot_name").label("bot_name"),
+            t.c.note.label("note"),
+            t.c[src.time_field].label("at"),
+            score.label("score"),
+        )
+        .select_from(source)
+        .where(*where)
+    )
+
+
+def _union(
+    params: SearchParams,
+    dialect: str,
+    portfolio_id: int,
+    skip: Optional[str] = None,
+    ranked: bool = True,
+):
+    parts = [
+        s
+        for s in (
+            _source_select(src, params, dialect, portfolio_id, skip, ranked)
+            for src in SOURCES
+        )
+        if s is not None
+    ]
+    if not parts:
+        return None
+    return union_all(*parts).subquery()
+
+
+def _group_counts(
+    session: Session,
+    params: SearchParams,
+    dialect: str,
+    portfolio_id: int,
+    skip: Optional[str] = None,
+) -> list[tuple]:
+    """满足条件的记录按 (symbol, side) 分组的条数"""
+    sub = _union(params, dialect, portfolio_id, skip, ranked=False)
+    if sub is None:
+        return []
+    return session.execute(
+        select(*(sub.c[f] for f in FACETS), func.count()).group_by(
+            *(sub.c[f] for f in FACETS)
+        )
+    ).all()
+
+
+def search_records(
+    session: Session, params: SearchParams, portfolio_id: int = DEFAULT_PORTFOLIO
+) -> SearchResult:
+    dialect = session.get_bind().dialect.name
+    matched = _union(params, dialect, portfolio_id)
+    if matched is None:
+        return SearchResult(total=0, hits=[], facets={f: [] for f in FACETS})
+
+    with span("hydrate") as sp:
+        rows = session.exec(
+            select(matched)
+            .order_by(
+                matched.c.score.desc(),
+                matched.c.at.desc(),
+                matched.c.kind,
+                matched.c.id.desc(),
+            )
+            .limit(params.limit)
+            .offset(params.offset)
+        ).all()
+        sp.rows = len(rows)
+
+    # 总数和各维度计数由一次分组查询得到；某一维度本身有筛选时，该维度忽略这个筛选另查一次
+    with span("hydrate") as sp:
+        counts = _group_counts(session, params, dialect, portfolio_id)
+        facets = {}
+        for pos, name in enumerate(FACETS):
+            groups = (
+                _group_counts(session, params, dialect, portfolio_id, skip=name)
+                if getattr(params, name)
+                else counts
+            )
+            tally = Counter()
+            for row in groups:
+                if row[pos] is not None:
+                    tally[row[pos]] += row[-1]
+            facets[name] = [
+                FacetCount(value=value, count=count)
+                for value, count in sorted(tally.items(), key=lambda kv: (-kv[1], kv[0]))
+            ]
+        sp.rows = len(counts)
+
+    return SearchResult(
+        total=sum(row[-1] for row in counts),
+        hits=[SearchHit(**row._mapping) for row in rows],
+        facets=facets,
+    )
@@ -1,10 +1,36 @@
 from __future__ import annotations
 
+import bisect
+import itertools
+import os
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Iterable
+from datetime import date, datetime, time
+from typing import Iterable, Optional
 
-from .models import SpotTrade
+from sqlalchemy import and_, delete, func, not_, or_
+from sqlmodel import Session, select
+
+from .cache import SPOT, bump_versions
+from .metrics import span
+from .prices import get_prices
+from .tradestore import TRADE_STORE, trade_store
+from .models import (
+    DEFAULT_PORTFOLIO,
+    ContractBot,
+    Investment,
+    InvestmentPair,
+    SpotDailyRollup,
+    SpotSymbolCheckpoint,
+    SpotSymbolSnapshot,
+    SpotTrade,
+)
+from .schemas import (
+    BotsSummary,
+    SpotOverallSummary,
+    SpotSymbolSummary,
+    SpotTradeCreate,
+)
 
 
 @dataclass
@@ -35,48 +61,783 @@ class SymbolState:
         return (self.source_price - self.total_gross_profit) / self.quantity
 
 
-def compute_spot_summary(trades: Iterable[SpotTrade]):
-    states: dict[str, SymbolState] = defaultdict(SymbolState)
-    for t in sorted(trades, key=lambda x: x.traded_at):
-        state = states[t.symbol]
-        state.last_trade_at = t.traded_at
-        fee = t.fee or 0.0
-        fee_currency = (t.fee_currency or "quote").lower()
-        if t.side.upper() == "BUY":
-            # 记录最近的买价
-            state.last_buy_price = t.price
-
-            if fee_currency == "base":
-                # fee reduces received base quantity
-                net_qty = t.quantity - fee
-                if net_qty < 0:
-                    net_qty = 0.0
-                total_quote = t.quantity * t.price  # quote spent ignoring base-fee
-                state.quantity += net_qty
-                state.cost_basis_total += total_quote
-            else:
-                # fee in quote increases spent amount
-                total_quote = t.quantity * t.price + fee
-                state.quantity += t.quantity
-                state.cost_basis_total += total_quote
-        elif t.side.upper() == "SELL":
-            # 毛利率 = (当前的卖价 - 最近的买价) × 当前的卖量
-            gross_profit = (t.price - state.last_buy_price) * t.quantity
-            state.total_gross_profit += gross_profit
-
-            avg = state.average_cost
-            proceeds = t.quantity * t.price
-            # fees on sell assumed in quote (even if base specified, treat as quote impact)
-            proceeds -= fee
-            realized = proceeds - avg * t.quantity
-            state.realized_pnl += realized
-            state.quantity -= t.quantity
-            if state.quantity < 0:
-                state.quantity = 0.0
-                state.cost_basis_total = 0.0
-            else:
-                state.cost_basis_total -= avg * t.quantity
+def apply_spot_trade(state: SymbolState, t: SpotTrade) -> None:
+    state.last_trade_at = t.traded_at
+    fee = t.fee or 0.0
+    fee_currency = (t.fee_currency or "quote").lower()
+    if t.side.upper() == "BUY":
+        # 记录最近的买价
+        state.last_buy_price = t.price
+
+        if fee_currency == "base":
+            # fee reduces received base quantity
+            net_qty = t.quantity - fee
+            if net_qty < 0:
+                net_qty = 0.0
+            total_quote = t.quantity * t.price  # quote spent ignoring base-fee
+            state.quantity += net_qty
+            state.cost_basis_total += total_quote
+        else:
+            # fee in quote increases spent amount
+            total_quote = t.quantity * t.price + fee
+            state.quantity += t.quantity
+            state.cost_basis_total += total_quote
+    elif t.side.upper() == "SELL":
+        # 毛利率 = (当前的卖价 - 最近的买价) × 当前的卖量
+        gross_profit = (t.price - state.last_buy_price) * t.quantity
+        state.total_gross_profit += gross_profit
+
+        avg = state.average_cost
+        proceeds = t.quantity * t.price
+        # fees on sell assumed in quote (even if base specified, treat as quote impact)
+        proceeds -= fee
+        realized = proceeds - avg * t.quantity
+        state.realized_pnl += realized
+        state.quantity -= t.quantity
+        if state.quantity < 0:
+            state.quantity = 0.0
+            state.cost_basis_total = 0.0
         else:
-            raise ValueError("Invalid side, expected BUY or SELL")
+            state.cost_basis_total -= avg * t.quantity
+    else:
+        raise ValueError("Invalid side, expected BUY or SELL")
 
+
+DEFAULT_FEE_RATE = 0.001
+
+
+def spot_trade_values(payload: SpotTradeCreate) -> dict:
+    """按录入规则补全数量/手续费，返回 SpotTrade 的列值"""
+    used_amount_mode = payload.amount_quote is not None and (
+        payload.quantity is None or payload.quantity == 0
+    )
+    quantity = payload.quantity
+    if used_amount_mode:
+        if payload.price <= 0:
+            raise ValueError("price must be > 0 when using amount_quote")
+        quantity = (payload.amount_quote or 0.0) / payload.price
+    if quantity is None or quantity <= 0:
+        raise ValueError("quantity must be positive")
+    # 明确给出时照用（比如重新导入导出的文件），否则卖出和按金额买入为 quote，按数量买入为 base
+    fee_currency = payload.fee_currency or (
+        "quote" if (payload.side.upper() == "SELL" or used_amount_mode) else "base"
+    )
+    if payload.fee is not None:
+        fee = payload.fee
+    elif fee_currency == "quote":
+        # 按成交额计
+        fee = quantity * payload.price * DEFAULT_FEE_RATE
+    else:
+        fee = quantity * DEFAULT_FEE_RATE
+    return {
+        "symbol": payload.symbol.upper(),
+        "side": payload.side.upper(),
+        "quantity": quantity,
+        "price": payload.price,
+        "fee": fee,
+        "fee_currency": fee_currency,
+        "traded_at": payload.traded_at or datetime.utcnow(),
+        "note": payload.note,
+    }
+
+
+def compute_spot_summary(
+    trades: Iterable[SpotTrade], states: Optional[dict[str, SymbolState]] = None
+):
+    """参考实现：按成交时间逐笔回放。states 为回放起点（会被原地更新）"""
+    states = defaultdict(SymbolState, states or {})
+    for t in sorted(trades, key=lambda x: x.traded_at):
+        apply_spot_trade(states[t.symbol], t)
     return states
+
+
+# 回放引擎：python 为上面的参考实现，numpy 见 vectorized.py（需要安装 numpy）
+SPOT_ENGINE = os.getenv("SPOT_ENGINE", "python").lower()
+
+# numpy 引擎按位置取前 7 列
+SPOT_TRADE_COLUMNS = (
+    SpotTrade.symbol,
+    SpotTrade.side,
+    SpotTrade.quantity,
+    SpotTrade.price,
+    SpotTrade.fee,
+    SpotTrade.fee_currency,
+    SpotTrade.traded_at,
+    SpotTrade.id,
+)
+
+
+def replay_spot_trades(
+    rows: list, states: Optional[dict[str, SymbolState]] = None
+) -> dict[str, SymbolState]:
+    """用配置的引擎回放 select(*SPOT_TRADE_COLUMNS) 的结果行"""
+    if SPOT_ENGINE == "numpy":
+        from .vectorized import compute_spot_summary_numpy
+
+        return compute_spot_summary_numpy(rows, states)
+    return compute_spot_summary(rows, states)
+
+
+# ---- 持久化快照 ----
+# 快照保存每个币种回放到最后一笔成交后的状态，按时间顺序追加的成交直接在快照上 O(1) 更新；
+# 乱序插入或删除时，只对该币种从最近的检查点开始重新回放。
+
+# 每个币种每 K 笔成交保存一个检查点；乱序写入和按时间点查询（as_of）最多回放约 K 笔
+CHECKPOINT_INTERVAL = int(os.getenv("SPOT_CHECKPOINT_INTERVAL", "500"))
+
+_STATE_FIELDS = (
+    "quantity",
+    "cost_basis_total",
+    "realized_pnl",
+    "last_buy_price",
+    "total_gross_profit",
+)
+
+
+def _state_from_row(row) -> SymbolState:
+    state = SymbolState(**{f: getattr(row, f) for f in _STATE_FIELDS})
+    state.last_trade_at = getattr(row, "last_trade_at", None) or getattr(
+        row, "traded_at", None
+    )
+    return state
+
+
+def _sort_key(t: SpotTrade) -> tuple[datetime, int]:
+    # 数据库存储时会丢弃时区（保留字面时间），比较前与其保持一致
+    return (t.traded_at.replace(tzinfo=None), t.id)
+
+
+def _after(key: tuple[datetime, int]):
+    """成交排序键 (traded_at, id) 严格大于 key 的条件"""
+    traded_at, trade_id = key
+    return or_(
+        SpotTrade.traded_at > traded_at,
+        and_(SpotTrade.traded_at == traded_at, SpotTrade.id > trade_id),
+    )
+
+
+def _row_key(row) -> tuple[datetime, int]:
+    return (row.traded_at, row.id)
+
+
+class TradeRows:
+    """某个组合单个币种按 (traded_at, id) 排序的成交行（select(*SPOT_TRADE_COLUMNS)）。
+
+    一次重建中快照、日汇总和 FIFO / LIFO 批次各自从不同位置开始回放；共用一个 TradeRows 时
+    起点落在已读取的范围内直接切片，只有要求更早的起点时才重新读取。
+    """
+
+    def __init__(self, session: Session, symbol: str, portfolio_id: int) -> None:
+        self.session = session
+        self.symbol = symbol
+        self.portfolio_id = portfolio_id
+        self._rows: Optional[list] = None
+        # 已读取范围的起点（不含），None 表示从第一笔开始
+        self._start: Optional[tuple[datetime, int]] = None
+
+    def after(self, key: Optional[tuple[datetime, int]] = None) -> list:
+        """排序键严格大于 key 的成交；key 为 None 时返回全部"""
+        if self._rows is None or (
+            self._start is not None and (key is None or key < self._start)
+        ):
+            stmt = select(*SPOT_TRADE_COLUMNS).where(
+                SpotTrade.portfolio_id == self.portfolio_id, SpotTrade.symbol == self.symbol
+            )
+            if key is not None:
+                stmt = stmt.where(_after(key))
+            with span("hydrate") as sp:
+                self._rows = self.session.exec(
+                    stmt.order_by(SpotTrade.traded_at, SpotTrade.id)
+                ).all()
+                sp.rows = len(self._rows)
+            self._start = key
+            return self._rows
+        if key is None or key == self._start:
+            return self._rows
+        return self._rows[bisect.bisect_right(self._rows, key, key=_row_key) :]
+
+
+def _checkpoint_before(key: tuple[datetime, int]):
+    traded_at, trade_id = key
+    return or_(
+        SpotSymbolCheckpoint.traded_at < traded_at,
+        and_(
+            SpotSymbolCheckpoint.traded_at == traded_at,
+            SpotSymbolCheckpoint.trade_id < trade_id,
+        ),
+    )
+
+
+def _make_checkpoint(
+    portfolio_id: int, symbol: str, count: int, t: SpotTrade, state: SymbolState
+) -> SpotSymbolCheckpoint:
+    return SpotSymbolCheckpoint(
+        portfolio_id=portfolio_id,
+        symbol=symbol,
+        trade_count=count,
+        traded_at=t.traded_at,
+        trade_id=t.id,
+        **{f: getattr(state, f) for f in _STATE_FIELDS},
+    )
+
+
+def _store_snapshot(
+    snap: SpotSymbolSnapshot, state: SymbolState, last: SpotTrade, count: int
+) -> None:
+    for f in _STATE_FIELDS:
+        setattr(snap, f, getattr(state, f))
+    snap.last_trade_at = last.traded_at
+    snap.last_trade_id = last.id
+    snap.trade_count = count
+
+
+def locked_row(session: Session, model, **key):
+    """取得 key 对应的行并锁住（SELECT ... FOR UPDATE），不存在时先插入一行默认值。
+
+    先插入（已存在时什么都不做）再加锁：同一个新币种的两笔并发成交不会都去插入而违反主键，
+    后到的事务在锁上等待，前一个提交后读到它写入的内容。SQLite 不支持 FOR UPDATE，
+    写锁本身已经串行化写事务。新插入的行 trade_count 为 0。
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        insert = None
+    if insert is not None:
+        session.execute(insert(model).values(**key).on_conflict_do_nothing())
+    row = session.get(model, key, with_for_update=True, populate_existing=True)
+    if row is None:
+        row = model(**key)
+        session.add(row)
+    return row
+
+
+def record_spot_trade(session: Session, trade: SpotTrade) -> None:
+    """新成交写入后更新快照；trade 需已 flush（有 id）"""
+    pid = trade.portfolio_id
+    # 锁住快照行：同一币种并发追加时后到的事务等前一个提交后再读，不会基于同一个快照各算一次。
+    # 日汇总、批次状态都在这把锁之后更新
+    snap = locked_row(session, SpotSymbolSnapshot, portfolio_id=pid, symbol=trade.symbol)
+    key = _sort_key(trade)
+    if snap.trade_count and key < (snap.last_trade_at, snap.last_trade_id):
+        # 乱序插入：从该成交之前最近的检查点重新回放
+        rebuild_spot_snapshot(session, trade.symbol, since=key, portfolio_id=pid)
+        return
+    state = _state_from_row(snap)
+    apply_spot_trade(state, trade)
+    count = snap.trade_count + 1
+    _store_snapshot(snap, state, trade, count)
+    if count % CHECKPOINT_INTERVAL == 0:
+        session.add(_make_checkpoint(pid, trade.symbol, count, trade, state))
+    _record_spot_rollup(session, trade, state)
+
+    from .lots import record_lot_trade
+
+    record_lot_trade(session, trade)
+
+
+def rebuild_spot_snapshot(
+    session: Session,
+    symbol: str,
+    since: Optional[tuple[datetime, int]] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> None:
+    """重新计算某个组合中单个币种的快照。
+
+    since 为受影响的第一笔成交的排序键 (traded_at, id)，在它之前的检查点仍然有效，
+    之后的检查点会被删除并在回放时重新生成；不传则从头回放。日汇总同样从受影响的那一天起重建，
+    FIFO / LIFO 批次见 lots.rebuild_lots。三者共用一次读取的成交行。
+    """
+    from .lots import rebuild_lots
+
+    pid = portfolio_id
+    since_day = since[0].date() if since else None
+    cp = None
+    in_scope = (
+        SpotSymbolCheckpoint.portfolio_id == pid,
+        SpotSymbolCheckpoint.symbol == symbol,
+    )
+    stale = delete(SpotSymbolCheckpoint).where(*in_scope)
+    if since is not None:
+        cp = session.exec(
+            select(SpotSymbolCheckpoint)
+            .where(*in_scope, _checkpoint_before(since))
+            .order_by(
+                SpotSymbolCheckpoint.traded_at.desc(),
+                SpotSymbolCheckpoint.trade_id.desc(),
+            )
+            .limit(1)
+        ).first()
+        stale = stale.where(not_(_checkpoint_before(since)))
+    session.exec(stale)
+
+    trades = TradeRows(session, symbol, pid)
+    start = (cp.traded_at, cp.trade_id) if cp is not None else None
+    if start is not None:
+        # 先按最早的起点读取（检查点或日汇总的重建日），批次通常从这之后开始
+        trades.after(min(start, _day_start(since_day)))
+    rebuild_spot_rollup(session, symbol, since_day, pid, trades)
+    rebuild_lots(session, symbol, since, pid, trades)
+
+    rows = trades.after(start)
+    if cp is not None:
+        state = _state_from_row(cp)
+        count = cp.trade_count
+    else:
+        state = SymbolState()
+        count = 0
+    # 按检查点间隔分段回放，每段结束时保存检查点
+    last = None
+    pos = 0
+    while pos < len(rows):
+        chunk = rows[pos : pos + CHECKPOINT_INTERVAL - count % CHECKPOINT_INTERVAL]
+        with span("replay") as sp:
+            state = replay_spot_trades(chunk, {symbol: state})[symbol]
+            sp.rows = len(chunk)
+        pos += len(chunk)
+        count += len(chunk)
+        last = chunk[-1]
+        if count % CHECKPOINT_INTERVAL == 0:
+            session.add(_make_checkpoint(pid, symbol, count, last, state))
+
+    snap = session.get(SpotSymbolSnapshot, (pid, symbol))
+    if last is None and cp is None:
+        # 该币种已无成交
+        if snap is not None:
+            session.delete(snap)
+        return
+    if snap is None:
+        snap = SpotSymbolSnapshot(portfolio_id=pid, symbol=symbol)
+        session.add(snap)
+    if last is None:
+        # 检查点之后没有成交，快照即检查点本身
+        for f in _STATE_FIELDS:
+            setattr(snap, f, getattr(state, f))
+        snap.last_trade_at = cp.traded_at
+        snap.last_trade_id = cp.trade_id
+        snap.trade_count = count
+    else:
+        _store_snapshot(snap, state, last, count)
+
+
+# ---- 按日汇总 ----
+# 每个组合每个币种每天一行，保存当天最后一笔成交后的数量、成本和累计已实现盈亏；
+# 数量/成本/已实现盈亏的递推只依赖这三个值，所以可以从前一天的收盘状态接着回放。
+
+
+def _store_rollup(row: SpotDailyRollup, state: SymbolState) -> None:
+    row.quantity = state.quantity
+    row.cost_basis_total = state.cost_basis_total
+    row.realized_pnl = state.realized_pnl
+
+
+def _record_spot_rollup(session: Session, trade: SpotTrade, state: SymbolState) -> None:
+    """按时间顺序追加的成交：更新（或新建）当天的日汇总"""
+    key = (trade.portfolio_id, trade.symbol, trade.traded_at.date())
+    row = session.get(SpotDailyRollup, key)
+    if row is None:
+        row = SpotDailyRollup(portfolio_id=key[0], symbol=key[1], day=key[2])
+        session.add(row)
+    _store_rollup(row, state)
+    row.trade_count += 1
+
+
+def _day_start(day: date) -> tuple[datetime, int]:
+    # id 从 1 开始，排序键大于 (当天零点, 0) 即当天及之后的成交
+    return (datetime.combine(day, time.min), 0)
+
+
+def rebuild_spot_rollup(
+    session: Session,
+    symbol: str,
+    since_day: Optional[date] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+    trades: Optional[TradeRows] = None,
+) -> None:
+    """从 since_day 起重新生成单个币种的日汇总，之前的日汇总保持不变并作为回放起点"""
+    state = SymbolState()
+    in_scope = (
+        SpotDailyRollup.portfolio_id == portfolio_id,
+        SpotDailyRollup.symbol == symbol,
+    )
+    stale = delete(SpotDailyRollup).where(*in_scope)
+    if trades is None:
+        trades = TradeRows(session, symbol, portfolio_id)
+    if since_day is not None:
+        prev = session.exec(
+            select(SpotDailyRollup)
+            .where(*in_scope, SpotDailyRollup.day < since_day)
+            .order_by(SpotDailyRollup.day.desc())
+            .limit(1)
+        ).first()
+        if prev is not None:
+            state.quantity = prev.quantity
+            state.cost_basis_total = prev.cost_basis_total
+            state.realized_pnl = prev.realized_pnl
+        stale = stale.where(SpotDailyRollup.day >= since_day)
+    session.exec(stale)
+
+    rows = trades.after(_day_start(since_day) if since_day is not None else None)
+    with span("replay") as sp:
+        for day, trades in itertools.groupby(rows, key=lambda t: t.traded_at.date()):
+            count = 0
+            for t in trades:
+                apply_spot_trade(state, t)
+                count += 1
+            row = SpotDailyRollup(
+                portfolio_id=portfolio_id, symbol=symbol, day=day, trade_count=count
+            )
+            _store_rollup(row, state)
+            session.add(row)
+        sp.rows = len(rows)
+
+
+def sync_spot_snapshots(session: Session) -> None:
+    """启动时校验快照、日汇总、FIFO / LIFO 批次与成交笔数是否一致，不一致的 (组合, 币种) 从头重建"""
+    from .lots import LOT_METHODS, lot_state_counts, rebuild_lots
+
+    counts = {
+        (pid, sym): n
+        for pid, sym, n in session.exec(
+            select(SpotTrade.portfolio_id, SpotTrade.symbol, func.count()).group_by(
+                SpotTrade.portfolio_id, SpotTrade.symbol
+            )
+        ).all()
+    }
+    snaps = {
+        (s.portfolio_id, s.symbol): s
+        for s in session.exec(select(SpotSymbolSnapshot)).all()
+    }
+    rollups = {
+        (pid, sym): n
+        for pid, sym, n in session.exec(
+            select(
+                SpotDailyRollup.portfolio_id,
+                SpotDailyRollup.symbol,
+                func.sum(SpotDailyRollup.trade_count),
+            ).group_by(SpotDailyRollup.portfolio_id, SpotDailyRollup.symbol)
+        ).all()
+    }
+    lots = lot_state_counts(session)
+    changed = False
+    for key in set(counts) | set(snaps) | set(rollups) | {k[:2] for k in lots}:
+        pid, sym = key
+        snap = snaps.get(key)
+        count = counts.get(key, 0)
+        if snap is None or snap.trade_count != count:
+            # 同时重建日汇总和批次
+            rebuild_spot_snapshot(session, sym, portfolio_id=pid)
+            changed = True
+            continue
+        # 升级后首次启动：日汇总 / 批次表是新建的
+        if rollups.get(key, 0) != count:
+            rebuild_spot_rollup(session, sym, portfolio_id=pid)
+            changed = True
+        if any(lots.get((pid, sym, m), 0) != count for m in LOT_METHODS):
+            rebuild_lots(session, sym, portfolio_id=pid)
+            changed = True
+    if changed:
+        bump_versions(session, SPOT)
+        session.commit()
+
+
+def load_spot_states(
+    session: Session,
+    symbol: Optional[str] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> dict[str, SymbolState]:
+    stmt = select(SpotSymbolSnapshot).where(
+        SpotSymbolSnapshot.portfolio_id == portfolio_id
+    )
+    if symbol:
+        stmt = stmt.where(SpotSymbolSnapshot.symbol == symbol)
+    with span("hydrate") as sp:
+        rows = session.exec(stmt).all()
+        sp.rows = len(rows)
+    return {s.symbol: _state_from_row(s) for s in rows}
+
+
+def load_spot_states_as_of(
+    session: Session,
+    as_of: datetime,
+    symbol: Optional[str] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> dict[str, SymbolState]:
+    """截至 as_of（含）的各币种状态：从 as_of 之前最近的检查点开始，只回放之后的成交
+    （启用 TRADE_STORE 时从内存中的列式存储读取，见 tradestore.py）"""
+    as_of = as_of.replace(tzinfo=None)
+    pid = portfolio_id
+    stmt = select(SpotSymbolSnapshot).where(SpotSymbolSnapshot.portfolio_id == pid)
+    if symbol:
+        stmt = stmt.where(SpotSymbolSnapshot.symbol == symbol)
+    states: dict[str, SymbolState] = {}
+    for snap in session.exec(stmt).all():
+        if snap.last_trade_at is not None and snap.last_trade_at <= as_of:
+            # 最后一笔成交也在 as_of 之前，快照就是答案
+            states[snap.symbol] = _state_from_row(snap)
+            continue
+        cp = session.exec(
+            select(SpotSymbolCheckpoint)
+            .where(
+                SpotSymbolCheckpoint.portfolio_id == pid,
+                SpotSymbolCheckpoint.symbol == snap.symbol,
+                SpotSymbolCheckpoint.traded_at <= as_of,
+            )
+            .order_by(
+                SpotSymbolCheckpoint.traded_at.desc(),
+                SpotSymbolCheckpoint.trade_id.desc(),
+            )
+            .limit(1)
+        ).first()
+        after = (cp.traded_at, cp.trade_id) if cp is not None else None
+        if TRADE_STORE:
+            rows = trade_store.trades(session, pid, snap.symbol, until=as_of, after=after)
+        else:
+            tail = select(*SPOT_TRADE_COLUMNS).where(
+                SpotTrade.portfolio_id == pid,
+                SpotTrade.symbol == snap.symbol,
+                SpotTrade.traded_at <= as_of,
+            )
+            if after is not None:
+                tail = tail.where(_after(after))
+            with span("hydrate") as sp:
+                rows = session.exec(tail.order_by(SpotTrade.traded_at, SpotTrade.id)).all()
+                sp.rows = len(rows)
+        if cp is None and not rows:
+            # as_of 时还没有这个币种的成交
+            continue
+        state = _state_from_row(cp) if cp is not None else SymbolState()
+        with span("replay") as sp:
+            states[snap.symbol] = replay_spot_trades(rows, {snap.symbol: state})[snap.symbol]
+            sp.rows = len(rows)
+    return states
+
+
+def spot_overall_summary(
+    session: Session,
+    symbol: Optional[str] = None,
+    as_of: Optional[datetime] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+    method: str = "avg",
+) -> SpotOverallSummary:
+    """method：avg 为移动加权平均，fifo / lifo 见 lots.py"""
+    if method != "avg":
+        from .lots import load_lot_states, load_lot_states_as_of
+
+        if as_of is not None:
+            states = load_lot_states_as_of(session, method, as_of, symbol, portfolio_id).items()
+        else:
+            states = load_lot_states(session, method, symbol, portfolio_id).items()
+    elif as_of is not None:
+        states = load_spot_states_as_of(session, as_of, symbol, portfolio_id).items()
+    else:
+        states = load_spot_states(session, symbol, portfolio_id).items()
+    # 按当前价格估值；as_of 查询没有当时的价格，不估值
+    prices = _held_prices(session, dict(states)) if as_of is None else None
+    symbol_summaries: list[SpotSymbolSummary] = []
+    total_cost_value = 0.0
+    total_realized = 0.0
+    total_market_value = total_unrealized = 0.0 if prices is not None else None
+    unpriced = []
+    for sym, s in sorted(states, key=lambda kv: kv[0]):
+        cost_value = s.average_cost * s.quantity
+        market_price = market_value = unrealized = None
+        if prices is not None:
+            if s.quantity <= 0:
+                market_value = unrealized = 0.0
+            elif sym in prices:
+                market_price = prices[sym]
+                market_value = s.quantity * market_price
+                unrealized = market_value - cost_value
+                total_market_value += market_value
+                total_unrealized += unrealized
+            else:
+                unpriced.append(sym)
+        symbol_summaries.append(
+            SpotSymbolSummary(
+                symbol=sym,
+                position_quantity=s.quantity,
+                average_cost=s.average_cost,
+                position_cost_value=cost_value,
+                realized_pnl=s.realized_pnl,
+                last_trade_at=s.last_trade_at,
+                last_buy_price=s.last_buy_price,
+                source_price=s.source_price,
+                total_gross_profit=s.total_gross_profit,
+                cost_price=s.cost_price,
+                market_price=market_price,
+                market_value=market_value,
+                unrealized_pnl=unrealized,
+            )
+        )
+        total_cost_value += cost_value
+        total_realized += s.realized_pnl
+    return SpotOverallSummary(
+        symbols=symbol_summaries,
+        total_position_cost_value=total_cost_value,
+        total_realized_pnl=total_realized,
+        total_market_value=total_market_value,
+        total_unrealized_pnl=total_unrealized,
+        unpriced_symbols=unpriced,
+    )
+
+
+def _held_prices(session: Session, states: dict[str, SymbolState]) -> dict[str, float]:
+    """有持仓的币种的当前价格，一次批量查询"""
+    return get_prices(session, [sym for sym, s in states.items() if s.quantity > 0])
+
+
+def _market_totals(
+    session: Session, states: dict[str, SymbolState]
+) -> tuple[float, float]:
+    """有价格的持仓的 (市值, 未实现盈亏)"""
+    prices = _held_prices(session, states)
+    market_value = unrealized = 0.0
+    for sym, price in prices.items():
+        s = states[sym]
+        value = s.quantity * price
+        market_value += value
+        unrealized += value - s.average_cost * s.quantity
+    return market_value, unrealized
+
+
+# ---- 合约机器人 / 投入汇总：在数据库里 SUM ... GROUP BY，只传回分组结果 ----
+
+
+def _time_range(col, since: Optional[datetime], until: Optional[datetime]) -> list:
+    conds = []
+    if since is not None:
+        conds.append(col >= since.replace(tzinfo=None))
+    if until is not None:
+        conds.append(col < until.replace(tzinfo=None))
+    return conds
+
+
+_BOT_PROFIT = func.coalesce(func.sum(ContractBot.profit), 0.0)
+
+
+def bots_profit_total(
+    session: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> float:
+    where = [
+        ContractBot.portfolio_id == portfolio_id,
+        *_time_range(ContractBot.closed_at, since, until),
+    ]
+    return session.exec(select(_BOT_PROFIT).where(*where)).one()
+
+
+def bots_profit_summary(
+    session: Session,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> BotsSummary:
+    where = [
+        ContractBot.portfolio_id == portfolio_id,
+        *_time_range(ContractBot.closed_at, since, until),
+    ]
+    profit = _BOT_PROFIT
+    total = bots_profit_total(session, since, until, portfolio_id)
+    by_symbol = session.exec(
+        select(ContractBot.symbol, profit)
+        .where(*where)
+        .group_by(ContractBot.symbol)
+        .order_by(ContractBot.symbol)
+    ).all()
+    by_bot_name = session.exec(
+        select(ContractBot.bot_name, profit)
+        .where(*where)
+        .group_by(ContractBot.bot_name)
+        .order_by(ContractBot.bot_name)
+    ).all()
+    return BotsSummary(
+        total_profit=total,
+        by_symbol=[tuple(r) for r in by_symbol],
+        by_bot_name=[tuple(r) for r in by_bot_name],
+    )
+
+
+def _as_of(col, as_of: Optional[datetime]) -> list:
+    return [] if as_of is None else [col <= as_of.replace(tzinfo=None)]
+
+
+def invested_totals(
+    session: Session,
+    as_of: Optional[datetime] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> tuple[float, float]:
+    """总投入 (USDT, MYR)：单币种投入 + 成对投入"""
+    by_currency = dict(
+        session.exec(
+            select(func.upper(Investment.currency), func.sum(Investment.amount))
+            .where(
+                Investment.portfolio_id == portfolio_id,
+                *_as_of(Investment.invested_at, as_of),
+            )
+            .group_by(func.upper(Investment.currency))
+        ).all()
+    )
+    pair_usdt, pair_myr = session.exec(
+        select(
+            func.coalesce(func.sum(InvestmentPair.amount_usdt), 0.0),
+            func.coalesce(func.sum(InvestmentPair.amount_myr), 0.0),
+        ).where(
+            InvestmentPair.portfolio_id == portfolio_id,
+            *_as_of(InvestmentPair.invested_at, as_of),
+        )
+    ).one()
+    return (
+        by_currency.get("USDT", 0.0) + pair_usdt,
+        by_currency.get("MYR", 0.0) + pair_myr,
+    )
+
+
+def overall_totals(
+    session: Session,
+    as_of: Optional[datetime] = None,
+    portfolio_id: int = DEFAULT_PORTFOLIO,
+) -> dict:
+    """as_of 不为空时只统计该时间（含）之前的记录"""
+    # spot realized pnl only (不把持仓成本计入总资产)
+    if as_of is not None:
+        spot_states = load_spot_states_as_of(session, as_of, portfolio_id=portfolio_id)
+    else:
+        spot_states = load_spot_states(session, portfolio_id=portfolio_id)
+    total_realized_pnl = sum(s.realized_pnl for s in spot_states.values())
+    # 持仓按当前价格估值（as_of 查询不估值）
+    if as_of is None:
+        market_value, unrealized = _market_totals(session, spot_states)
+    else:
+        market_value = unrealized = None
+
+    # bots profits (USDT侧)
+    if as_of is not None:
+        bot_total = session.exec(
+            select(_BOT_PROFIT).where(
+                ContractBot.portfolio_id == portfolio_id,
+                *_as_of(ContractBot.closed_at, as_of),
+            )
+        ).one()
+    else:
+        bot_total = bots_profit_total(session, portfolio_id=portfolio_id)
+
+    # investments (single + pairs)
+    invest_usdt_total, invest_myr_total = invested_totals(session, as_of, portfolio_id)
+
+    # totals without conversion: 仅 总投入(USDT) + 机器人利润 + 现货已实现盈亏
+    pair_usdt_total = invest_usdt_total + bot_total + total_realized_pnl
+
+    return {
+        "spot_realized_pnl": total_realized_pnl,
+        "spot_market_value": market_value,
+        "spot_unrealized_pnl": unrealized,
+        "bots_profit": bot_total,
+        "invest_usdt": invest_usdt_total,
+        "invest_myr": invest_myr_total,
+        "total_assets_pair": {"USDT": pair_usdt_total, "MYR": invest_myr_total},
+    }
@@ -0,0 +1,116 @@
+"""现货持仓计算的 NumPy 实现。
+
+输入为按 SPOT_TRADE_COLUMNS 顺序排列的列元组（直接来自 select 的结果行），
+结果与 services.compute_spot_summary 逐位一致：
+- 币种/方向/手续费币种按唯一值归一化一次，而不是每笔成交都 upper()/lower()
+- 排序、分组、买入/卖出的数量与金额、最近买价、毛利率均用数组运算完成
+- 移动加权成本依赖上一笔的均价（卖出清仓时还会归零），只能按顺序递推，
+  这一步在预先算好的浮点列表上做最少的标量运算
+"""
+from __future__ import annotations
+
+import itertools
+import operator
+from collections import defaultdict
+from typing import Iterable, Optional, Sequence
+
+import numpy as np
+
+from .services import SymbolState
+
+
+def _intern(values: Sequence, normalize) -> tuple[list, np.ndarray]:
+    """对唯一值做一次归一化，返回 (归一化后的唯一值, 每行对应的编号)"""
+    uniq = list(dict.fromkeys(values))
+    index = {v: i for i, v in enumerate(uniq)}
+    code = np.fromiter(map(index.__getitem__, values), dtype=np.intp, count=len(values))
+    return [normalize(v) for v in uniq], code
+
+
+def _is_sorted(values: Sequence) -> bool:
+    return all(map(operator.le, values, itertools.islice(values, 1, None)))
+
+
+def compute_spot_summary_numpy(
+    rows: Iterable[Sequence], states: Optional[dict[str, SymbolState]] = None
+) -> dict[str, SymbolState]:
+    states = defaultdict(SymbolState, states or {})
+    rows = rows if isinstance(rows, list) else list(rows)
+    if not rows:
+        return states
+    symbol, side, quantity, price, fee, fee_currency, traded_at = list(zip(*rows))[:7]
+
+    sym_names, sym_code = _intern(symbol, str)
+    side_names, side_code = _intern(side, str.upper)
+    if any(s not in ("BUY", "SELL") for s in side_names):
+        raise ValueError("Invalid side, expected BUY or SELL")
+    fc_names, fc_code = _intern(fee_currency, lambda c: (c or "quote").lower())
+
+    # 先按币种、再按成交时间排序（稳定排序，同一时间保持输入顺序）；
+    # 从数据库按时间顺序读出的数据只需按币种稳定排序
+    if _is_sorted(traded_at):
+        order = np.argsort(sym_code, kind="stable")
+    else:
+        by_time = np.array(sorted(range(len(rows)), key=traded_at.__getitem__))
+        order = by_time[np.argsort(sym_code[by_time], kind="stable")]
+    sym_code = sym_code[order]
+    is_buy = np.array([s == "BUY" for s in side_names])[side_code[order]]
+    is_base = np.array([c == "base" for c in fc_names])[fc_code[order]]
+    q = np.array(quantity, dtype=float)[order]
+    p = np.array(price, dtype=float)[order]
+    f = np.array(fee, dtype=float)[order]
+    f[np.isnan(f)] = 0.0
+
+    qp = q * p
+    base_buy = is_buy & is_base
+    net_qty = q - f
+    # 买入：手续费为 base 时减少到手数量，为 quote 时计入成本
+    buy_qty = np.where(base_buy, np.where(net_qty < 0, 0.0, net_qty), q)
+    buy_cost = np.where(base_buy, qp, qp + f)
+    # 卖出：手续费一律按 quote 扣减
+    proceeds = qp - f
+
+    bounds = np.flatnonzero(np.diff(sym_code)) + 1
+    starts = np.concatenate(([0], bounds)).tolist()
+    ends = np.concatenate((bounds, [len(order)])).tolist()
+    for start, end in zip(starts, ends):
+        state = states[sym_names[sym_code[start]]]
+        g_buy = is_buy[start:end]
+        g_q = q[start:end]
+        g_p = p[start:end]
+
+        # 最近买价：买入位置的下标向前填充
+        idx = np.where(g_buy, np.arange(end - start), -1)
+        last = np.maximum.accumulate(idx)
+        lbp = np.where(last >= 0, g_p[np.maximum(last, 0)], state.last_buy_price)
+        # 毛利率 = (卖价 - 最近买价) × 卖量，按顺序累加
+        gross = ((g_p - lbp) * g_q)[~g_buy]
+        if len(gross):
+            state.total_gross_profit = float(
+                np.cumsum(np.concatenate(([state.total_gross_profit], gross)))[-1]
+            )
+        state.last_buy_price = float(lbp[-1])
+        state.last_trade_at = traded_at[order[end - 1]]
+
+        qty, cost, realized = state.quantity, state.cost_basis_total, state.realized_pnl
+        for buy, bq, bc, sq, pr in zip(
+            g_buy.tolist(),
+            buy_qty[start:end].tolist(),
+            buy_cost[start:end].tolist(),
+            g_q.tolist(),
+            proceeds[start:end].tolist(),
+        ):
+            if buy:
+                qty += bq
+                cost += bc
+            else:
+                avg = cost / qty if qty > 0 else 0.0
+                realized += pr - avg * sq
+                qty -= sq
+                if qty < 0:
+                    qty = 0.0
+                    cost = 0.0
+                else:
+                    cost -= avg * sq
+        state.quantity, state.cost_basis_total, state.realized_pnl = qty, cost, realized
+    return states
@@ -0,0 +1,62 @@
+"""对比两次基准结果：python benchmarks/compare.py base.json new.json [--threshold 1.2]
+
+按 median_ms（每行开销项为 per_row_us）计算 新/旧 比值，超过阈值的项标记为 SLOWER，并以退出码 1 结束，便于在 CI 中使用。
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+
+def _load(path: str) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def _metric(entry: dict) -> float | None:
+    if "median_ms" in entry:
+        return entry["median_ms"]
+    if "seconds" in entry:
+        return entry["seconds"] * 1000
+    if "per_row_us" in entry:
+        # 按微秒显示，比值同样适用
+        return entry["per_row_us"]
+    return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="对比两次基准结果")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.2, help="判定变慢的比值")
+    args = parser.parse_args()
+
+    base, new = _load(args.base), _load(args.new)
+    print(f"base: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    slower = 0
+    for size, results in new["results"].items():
+        old_results = base["results"].get(size, {})
+        print(f"\n== {size} trades ==")
+        print(f"{'benchmark':<48}{'base ms':>12}{'new ms':>12}{'ratio':>8}")
+        for name, entry in results.items():
+            cur = _metric(entry)
+            prev = _metric(old_results[name]) if name in old_results else None
+            if cur is None:
+                continue
+            if prev is None:
+                print(f"{name:<48}{'-':>12}{cur:>12.3f}{'new':>8}")
+                continue
+            ratio = cur / prev if prev else float("inf")
+            flag = ""
+            if ratio > args.threshold:
+                flag = "  SLOWER"
+                slower += 1
+            elif ratio < 1 / args.threshold:
+                flag = "  faster"
+            print(f"{name:<48}{prev:>12.3f}{cur:>12.3f}{ratio:>8.2f}{flag}")
+    sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""性能基准：生成合成数据，分别计时服务函数和 HTTP 接口，结果写成 JSON。
+
+用法：
+    python benchmarks/run.py                      # 1k / 100k / 1M 行
+    python benchmarks/run.py --sizes 1000,20000   # 自定义规模
+    python benchmarks/compare.py old.json new.json
+
+每个规模在独立子进程里使用临时 SQLite 数据库运行（app.database 在导入时读取 DATABASE_URL），
+SPOT_ENGINE / SQLITE_TUNED 等环境变量会原样传给子进程。
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+DEFAULT_SIZES = "1000,100000,1000000"
+# 超过该行数时跳过不分页的全量列表接口
+FULL_LIST_MAX = 100_000
+ENV_KEYS = ("SPOT_ENGINE", "SQLITE_TUNED")
+
+
+def _timeit(fn, repeat: int, budget: float = 2.0) -> dict:
+    """至少跑一次；单次很快时重复 repeat 次，总耗时不超过 budget 秒"""
+    runs = []
+    started = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - t0) * 1000)
+        if len(runs) >= repeat or time.perf_counter() - started > budget:
+            break
+    return {
+        "min_ms": round(min(runs), 3),
+        "median_ms": round(statistics.median(runs), 3),
+        "runs": len(runs),
+    }
+
+
+def _load(size: int, n_symbols: int) -> dict:
+    from sqlalchemy import insert
+    from sqlmodel import Session
+
+    from app.database import engine
+    from app.importer import import_spot_trades
+    from app.jobs import run_pending
+    from app.models import ContractBot, Investment
+    from benchmarks import generator
+
+    out = {}
+    with Session(engine) as session:
+        # 写入与重建分开计时：导入时重建排队，随后由 run_pending 逐个币种执行
+        # （与 POST /api/spot_trades/bulk 相同，接口返回后由后台任务重建）
+        records = list(enumerate(generator.spot_trades(n_symbols, size), start=1))
+        t0 = time.perf_counter()
+        report = import_spot_trades(session, records, defer=True)
+        elapsed = time.perf_counter() - t0
+        out["load.import_spot_trades"] = {
+            "seconds": round(elapsed, 3),
+            "rows": report.inserted,
+            "rows_per_s": round(report.inserted / elapsed),
+        }
+        del records
+        t0 = time.perf_counter()
+        run_pending()
+        elapsed = time.perf_counter() - t0
+        out["load.rebuild_snapshots"] = {
+            "seconds": round(elapsed, 3),
+            "rows": report.inserted,
+            "rows_per_s": round(report.inserted / elapsed),
+        }
+        n_bots = max(size // 10, 1)
+        session.execute(
+            insert(ContractBot.__table__),
+            list(generator.contract_bots(n_symbols, n_bots)),
+        )
+        session.execute(
+            insert(Investment.__table__), list(generator.investments(max(size // 100, 1)))
+        )
+        session.commit()
+    return out
+
+
+def _bench_services(repeat: int) -> dict:
+    from sqlmodel import Session, select
+
+    from app import services
+    from app.database import engine
+    from app.models import SpotTrade
+
+    out = {}
+    with Session(engine) as session:
+        symbols = session.exec(select(SpotTrade.symbol).distinct()).all()
+
+        def load_orm():
+            return session.exec(select(SpotTrade)).all()
+
+        out["service.load_trades_orm"] = _timeit(load_orm, repeat)
+        orm_rows = load_orm()
+        out["service.compute_spot_summary"] = _timeit(
+            lambda: services.compute_spot_summary(orm_rows), repeat
+        )
+        session.expunge_all()
+
+        col_rows = session.exec(
+            select(*services.SPOT_TRADE_COLUMNS).order_by(SpotTrade.traded_at, SpotTrade.id)
+        ).all()
+        out["service.replay_columns_python"] = _timeit(
+            lambda: services.compute_spot_summary(col_rows), repeat
+        )
+        try:
+            from app.vectorized import compute_spot_summary_numpy
+        except ImportError:
+            pass
+        else:
+            out["service.replay_columns_numpy"] = _timeit(
+                lambda: compute_spot_summary_numpy(col_rows), repeat
+            )
+        del col_rows
+
+        def rebuild_all():
+            for sym in symbols:
+                services.rebuild_spot_snapshot(session, sym)
+            session.flush()
+            session.rollback()
+
+        out["service.rebuild_all_snapshots"] = _timeit(rebuild_all, repeat)
+        out["service.spot_overall_summary"] = _timeit(
+            lambda: services.spot_overall_summary(session), repeat
+        )
+        out["service.bots_profit_summary"] = _timeit(
+            lambda: services.bots_profit_summary(session), repeat
+        )
+        out["service.overall_totals"] = _timeit(
+            lambda: services.overall_totals(session), repeat
+        )
+    return out
+
+
+def _bench_endpoints(size: int, repeat: int) -> dict:
+    from fastapi.testclient import TestClient
+
+    from app.cache import summary_cache
+    from app.main import app
+
+    out = {}
+    with TestClient(app) as client:
+
+        def get(url, **kw):
+            res = client.get(url, **kw)
+            assert res.status_code in (200, 304), (url, res.status_code)
+            return res
+
+        def uncached(url):
+            def run():
+                summary_cache.clear()
+                get(url)
+
+            return run
+
+        for name, url in (
+            ("summary_spot", "/api/summary/spot"),
+            ("summary_spot_symbol", "/api/summary/spot?symbol=SYM000USDT"),
+            ("summary_bots", "/api/summary/bots"),
+            ("summary_overall", "/api/summary/overall"),
+        ):
+            out[f"endpoint.{name}"] = _timeit(uncached(url), repeat)
+            get(url)
+            out[f"endpoint.{name}.cached"] = _timeit(lambda: get(url), repeat)
+            etag = get(url).headers["etag"]
+            out[f"endpoint.{name}.not_modified"] = _timeit(
+                lambda: get(url, headers={"If-None-Match": etag}), repeat
+            )
+
+        out["endpoint.spot_trades_page100"] = _timeit(
+            lambda: get("/api/spot_trades?limit=100"), repeat
+        )
+        out["endpoint.spot_trades_page1000"] = _timeit(
+            lambda: get("/api/spot_trades?limit=1000"), repeat
+        )
+        # 每行的边际开销：两种页大小的耗时差 / 行数差
+        rows = min(size, 1000) - min(size, 100)
+        if rows > 0:
+            delta = (
+                out["endpoint.spot_trades_page1000"]["min_ms"]
+                - out["endpoint.spot_trades_page100"]["min_ms"]
+            )
+            out["endpoint.spot_trades.per_row"] = {"per_row_us": round(delta * 1000 / rows, 3)}
+        out["endpoint.spot_trades_symbol_page100"] = _timeit(
+            lambda: get("/api/spot_trades?symbol=SYM000USDT&limit=100"), repeat
+        )
+        out["endpoint.contract_bots_page100"] = _timeit(
+            lambda: get("/api/contract_bots?limit=100"), repeat
+        )
+        if size <= FULL_LIST_MAX:
+            out["endpoint.spot_trades_full"] = _timeit(
+                lambda: get("/api/spot_trades"), repeat
+            )
+    return out
+
+
+def worker(size: int, n_symbols: int, repeat: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="tradestore-bench-")
+    os.environ["DATABASE_URL"] = f"sqlite:///{Path(tmp, 'bench.db').as_posix()}"
+    os.chdir(PROJECT_ROOT)  # 模板和静态文件按相对路径挂载
+
+    import app.models  # noqa: F401  (注册数据表)
+    from app.database import init_db
+
+    init_db()
+    results = _load(size, n_symbols)
+    results.update(_bench_services(repeat))
+    results.update(_bench_endpoints(size, repeat))
+    return results
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJECT_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="TradeStore 性能基准")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="逗号分隔的成交笔数")
+    parser.add_argument("--symbols", type=int, default=20, help="币种数量")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="结果文件，默认 benchmarks/results/<commit>.json")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        json.dump(worker(args.worker, args.symbols, args.repeat), sys.stdout)
+        return
+
+    commit = _git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "symbols": args.symbols,
+            "env": {k: os.environ[k] for k in ENV_KEYS if k in os.environ},
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"running {size} trades ...", file=sys.stderr)
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--worker",
+                str(size),
+                "--symbols",
+                str(args.symbols),
+                "--repeat",
+                str(args.repeat),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            sys.stderr.write(proc.stderr)
+            raise SystemExit(f"benchmark for {size} trades failed")
+        report["results"][str(size)] = json.loads(proc.stdout)
+
+    output = Path(
+        args.output or PROJECT_ROOT / "benchmarks" / "results" / f"{commit or 'local'}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"wrote {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
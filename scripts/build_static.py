@@ -0,0 +1,68 @@
+from pathlib import Path
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+# Ensure project root is on sys.path so "app" can be imported when run from anywhere
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from app import assets, pages
+from app.assets import COMPRESSIBLE, ENCODINGS, FINGERPRINT_LENGTH, compress
+
+
+def _write(path: Path, data: bytes) -> list[str]:
+    """写入文件及其预压缩版本，返回各版本的大小说明"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    sizes = [f"{len(data)}"]
+    if path.suffix in COMPRESSIBLE:
+        encoded = compress(data)
+        for name, suffix in ENCODINGS:
+            if name in encoded:
+                Path(f"{path}{suffix}").write_bytes(encoded[name])
+                sizes.append(f"{name} {len(encoded[name])}")
+    return sizes
+
+
+def fingerprinted(rel: Path, data: bytes) -> Path:
+    digest = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+    return rel.with_name(f"{rel.stem}.{digest}{rel.suffix}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="构建静态资源：文件名加内容哈希、预压缩（gzip / brotli）、预渲染页面"
+    )
+    parser.add_argument("--out", help="输出目录（服务端由 BUILD_DIR 指定），默认为项目根目录下的 build")
+    args = parser.parse_args()
+
+    out = Path(args.out).resolve() if args.out else PROJECT_ROOT / assets.BUILD_DIR
+    # static/、templates/ 相对项目根目录
+    os.chdir(PROJECT_ROOT)
+    assets.BUILD_DIR = out
+    assets.MANIFEST_PATH = out / "manifest.json"
+    pages.PAGES_DIR = out / "pages"
+    for sub in ("static", "pages"):
+        shutil.rmtree(out / sub, ignore_errors=True)
+    if assets.brotli is None:
+        print("brotli not installed, writing gzip only (pip install brotli)")
+
+    mapping = {}
+    for src in sorted(p for p in assets.SOURCE_DIR.rglob("*") if p.is_file()):
+        rel = src.relative_to(assets.SOURCE_DIR)
+        data = src.read_bytes()
+        target = fingerprinted(rel, data)
+        sizes = _write(out / "static" / target, data)
+        mapping[rel.as_posix()] = target.as_posix()
+        print(f"static/{rel.as_posix()} -> {target.as_posix()} ({', '.join(sizes)})")
+    assets.MANIFEST_PATH.write_text(json.dumps(mapping, indent=2) + "\n", encoding="utf-8")
+    assets.manifest.cache_clear()
+
+    for template in sorted(pages.TEMPLATE_DIR.glob("*.html")):
+        sizes = _write(pages.PAGES_DIR / template.name, pages.render_template(template.name))
+        print(f"pages/{template.name} ({', '.join(sizes)})")
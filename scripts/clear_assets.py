@@ -6,10 +6,15 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 
+from app.cache import INVESTMENTS, bump_versions
 from app.database import engine
 
+TABLES = ("investment", "investmentpair", "investmentdailyrollup")
+
 if __name__ == "__main__":
     with engine.begin() as conn:
-        conn.exec_driver_sql("DELETE FROM investment")
-        conn.exec_driver_sql("DELETE FROM investmentpair")
-    print("Cleared tables: investment, investmentpair")
+        for table in TABLES:
+            conn.exec_driver_sql(f"DELETE FROM {table}")
+        bump_versions(conn, INVESTMENTS)
+    print(f"Cleared tables: {', '.join(TABLES)}")
+    print(f"Bumped table versions: {INVESTMENTS} (cached summaries are recomputed)")
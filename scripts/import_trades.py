@@ -0,0 +1,53 @@
+from pathlib import Path
+import argparse
+import sys
+import time
+
+# Ensure project root is on sys.path so "app" can be imported when run from anywhere
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from sqlmodel import Session
+
+from app.database import engine, init_db
+from app.importer import BATCH_SIZE, FORMATS, detect_format, import_spot_trades, iter_records
+from app.models import DEFAULT_PORTFOLIO, Portfolio
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量导入现货成交（CSV / JSONL）")
+    parser.add_argument("path", help="文件路径，- 表示从标准输入读取")
+    parser.add_argument("--format", choices=FORMATS, help="默认按文件扩展名判断")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--portfolio", type=int, default=DEFAULT_PORTFOLIO, help="导入到哪个组合（id）")
+    args = parser.parse_args()
+
+    fmt = args.format or detect_format(args.path)
+    if fmt is None:
+        parser.error("cannot detect format, use --format csv|jsonl")
+
+    init_db()
+    with Session(engine) as session:
+        if session.get(Portfolio, args.portfolio) is None:
+            parser.error(f"portfolio {args.portfolio} does not exist")
+    started = time.perf_counter()
+    if args.path == "-":
+        stream = sys.stdin
+    else:
+        stream = open(args.path, encoding="utf-8-sig", newline="")
+    with stream, Session(engine) as session:
+        report = import_spot_trades(
+            session,
+            iter_records(stream, fmt),
+            batch_size=args.batch_size,
+            portfolio_id=args.portfolio,
+        )
+    elapsed = time.perf_counter() - started
+
+    for line, error in report.errors:
+        print(f"line {line}: {error}", file=sys.stderr)
+    rate = report.inserted / elapsed if elapsed > 0 else 0.0
+    print(
+        f"Imported {report.inserted} trades, {report.failed} failed "
+        f"in {elapsed:.2f}s ({rate:.0f} trades/s)"
+    )
@@ -0,0 +1,36 @@
+from pathlib import Path
+import argparse
+import csv
+import sys
+from datetime import datetime
+
+# Ensure project root is on sys.path so "app" can be imported when run from anywhere
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from sqlmodel import Session
+
+from app.database import engine, init_db
+from app.prices import set_prices
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 CSV 写入最新价格（列：symbol,price[,updated_at]）")
+    parser.add_argument("path", help="文件路径，- 表示从标准输入读取")
+    args = parser.parse_args()
+
+    init_db()
+    stream = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8-sig", newline="")
+    with stream:
+        items = [
+            (
+                row["symbol"].strip().upper(),
+                float(row["price"]),
+                datetime.fromisoformat(row["updated_at"]) if row.get("updated_at") else None,
+            )
+            for row in csv.DictReader(stream)
+        ]
+    with Session(engine) as session:
+        count = set_prices(session, items)
+        session.commit()
+    print(f"Updated {count} prices")
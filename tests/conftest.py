@@ -0,0 +1,38 @@
+from pathlib import Path
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 测试使用临时数据库，不碰 data/trades.db；需在导入 app 之前设置
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from sqlmodel import Session, SQLModel, create_engine
+
+from app import models  # noqa: F401  注册全部表
+
+
+@pytest.fixture
+def session(tmp_path):
+    """每个测试一个全新的 SQLite 数据库"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        yield s
+    engine.dispose()
+
+
+@pytest.fixture
+def app_session():
+    """使用应用自身的 engine（上面指向的临时数据库），供内部自行开连接的代码（导出、后台任务）使用"""
+    from app.database import engine
+
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as s:
+        yield s
+    SQLModel.metadata.drop_all(engine)
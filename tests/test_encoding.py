@@ -0,0 +1,36 @@
+"""直接编码的响应与 FastAPI 按 response_model 序列化的输出逐字节一致"""
+from datetime import datetime, timedelta
+
+from fastapi.responses import JSONResponse
+
+from app.encoding import dumps
+from app.models import SpotTrade
+from app.services import record_spot_trade, spot_overall_summary
+
+START = datetime(2024, 5, 1, 8, 0, 0, 250000)
+
+# 极小 / 极大的数量和价格：json 写成 1e-05、1e+16 这类科学计数法
+TRADES = [
+    ("DUST", "BUY", 0.00001, 0.000003),
+    ("DUST", "BUY", 12345678.9, 0.0000071),
+    ("DUST", "SELL", 0.00002, 0.000009),
+    ("BIG", "BUY", 3.0, 2.5e15),
+    ("BIG", "SELL", 1.0, 3.75e16),
+]
+
+
+def test_summary_bytes_match_json_response(session):
+    for i, (symbol, side, quantity, price) in enumerate(TRADES):
+        trade = SpotTrade(
+            symbol=symbol, side=side, quantity=quantity, price=price, fee=0.0,
+            fee_currency="quote", traded_at=START + timedelta(minutes=i),
+        )
+        session.add(trade)
+        session.flush()
+        record_spot_trade(session, trade)
+    session.commit()
+
+    payload = spot_overall_summary(session).model_dump(mode="json")
+    body = dumps(payload)
+    assert b"e-" in body and b"e+" in body
+    assert body == JSONResponse(payload).body
@@ -0,0 +1,101 @@
+"""汇总推送：其它进程的写入（不调用 notify）也能被发现；计算出错时后台任务继续运行"""
+import asyncio
+from datetime import datetime
+
+from sqlmodel import Session
+
+from app import events
+from app.cache import SPOT, bump_versions
+from app.database import engine
+from app.events import SummaryFeed
+from app.models import SpotTrade
+from app.services import record_spot_trade
+
+
+def _write_elsewhere(quantity: float) -> None:
+    """模拟另一个进程写入：只写数据库并加版本号，不通知本进程的 summary_feed"""
+    with Session(engine) as session:
+        trade = SpotTrade(
+            symbol="BTC", side="BUY", quantity=quantity, price=100, fee=0,
+            fee_currency="quote", traded_at=datetime(2024, 1, 1, 0, 0, int(quantity)),
+        )
+        session.add(trade)
+        session.flush()
+        record_spot_trade(session, trade)
+        bump_versions(session, SPOT, portfolio_id=1)
+        session.commit()
+
+
+def _quantity(summary: dict) -> float:
+    return sum(s["position_quantity"] for s in summary["spot"]["symbols"])
+
+
+async def _next_event(stream) -> str:
+    while True:
+        chunk = await asyncio.wait_for(stream.__anext__(), timeout=5)
+        if not chunk.startswith(":"):
+            return chunk
+
+
+def test_snapshot_sees_writes_from_other_processes(app_session):
+    async def run():
+        feed = SummaryFeed()
+        feed.start()
+        try:
+            assert _quantity(await feed.snapshot(1)) == 0
+            _write_elsewhere(1)
+            assert _quantity(await feed.snapshot(1)) == 1
+        finally:
+            await feed.stop()
+
+    asyncio.run(run())
+
+
+def test_subscribers_get_deltas_for_writes_from_other_processes(app_session, monkeypatch):
+    monkeypatch.setattr(events, "POLL_SECONDS", 0.05)
+
+    async def run():
+        feed = SummaryFeed()
+        feed.start()
+        stream = feed.stream(1)
+        try:
+            assert (await _next_event(stream)).startswith("event: snapshot")
+            _write_elsewhere(2)
+            event = await _next_event(stream)
+            assert event.startswith("event: delta") and "BTC" in event
+        finally:
+            await stream.aclose()
+            await feed.stop()
+
+    asyncio.run(run())
+
+
+def test_compute_error_does_not_stop_the_feed(app_session, monkeypatch):
+    monkeypatch.setattr(events, "POLL_SECONDS", 0.05)
+    compute = events._compute
+    failures = []
+
+    def flaky(portfolio_id, sections):
+        if not failures:
+            failures.append(portfolio_id)
+            raise RuntimeError("database unavailable")
+        return compute(portfolio_id, sections)
+
+    async def run():
+        feed = SummaryFeed()
+        feed.start()
+        stream = feed.stream(1)
+        try:
+            await _next_event(stream)
+            monkeypatch.setattr(events, "_compute", flaky)
+            _write_elsewhere(3)
+            feed.notify("spot", portfolio_id=1)
+            # 第一次计算失败，保持过期并在下一次比对时重试成功
+            event = await _next_event(stream)
+            assert event.startswith("event: delta")
+            assert failures == [1] and not feed._task.done()
+        finally:
+            await stream.aclose()
+            await feed.stop()
+
+    asyncio.run(run())
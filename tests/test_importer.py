@@ -0,0 +1,64 @@
+"""批量导入在迁移过的库上（有全文索引触发器）写入的记录同样能被搜索到"""
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlmodel import Session, create_engine, select
+
+from app.importer import import_spot_trades
+from app.migrations import migrate
+from app.models import SearchIndexPause, SpotTrade
+
+
+def _check_index(session) -> None:
+    # 与原表逐行比对；触发器没有暂停时同一行被索引两次也会报错
+    session.execute(
+        text("INSERT INTO spottrade_fts (spottrade_fts, rank) VALUES ('integrity-check', 1)")
+    )
+
+
+def _matches(session, term: str) -> list[int]:
+    return sorted(
+        session.execute(
+            text("SELECT rowid FROM spottrade_fts WHERE spottrade_fts MATCH :q"),
+            {"q": f'"{term}"'},
+        ).scalars()
+    )
+
+
+def test_bulk_import_indexes_new_rows_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(engine)
+    with Session(engine) as session:
+        session.add(
+            SpotTrade(
+                symbol="BTC", side="BUY", quantity=1, price=100, fee=0,
+                fee_currency="quote", traded_at=datetime(2024, 1, 1), note="逐行写入",
+            )
+        )
+        session.commit()
+        records = [
+            (i, {"symbol": "eth", "side": "BUY", "quantity": 1, "price": 10 + i,
+                 "traded_at": f"2024-01-02T00:00:{i:02d}", "note": f"批量导入 {i}"})
+            for i in range(1, 8)
+        ]
+        report = import_spot_trades(session, records, batch_size=3)
+        assert report.inserted == 7 and not report.errors
+
+        ids = sorted(session.exec(select(SpotTrade.id).where(SpotTrade.symbol == "ETH")).all())
+        assert _matches(session, "批量导入") == ids
+        assert len(_matches(session, "ETH")) == 7
+        assert session.exec(select(SearchIndexPause)).all() == []
+        _check_index(session)
+
+        # 导入结束后逐行同步照常工作
+        session.add(
+            SpotTrade(
+                symbol="SOL", side="BUY", quantity=1, price=5, fee=0,
+                fee_currency="quote", traded_at=datetime(2024, 1, 3), note="之后写入",
+            )
+        )
+        session.commit()
+        assert len(_matches(session, "之后写入")) == 1
+        assert len(_matches(session, "逐行写入")) == 1
+        _check_index(session)
+    engine.dispose()
@@ -0,0 +1,73 @@
+"""后台任务的租约：只收回心跳过期的 running 任务"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+from app import jobs
+from app.jobs import PENDING, RUNNING, SPOT_REBUILD, WORKER_ID, reclaim_expired, run_next
+from app.models import Job
+
+
+def _running(session, worker: str, heartbeat_age: float, symbol: str = "BTC") -> Job:
+    now = datetime.utcnow()
+    job = Job(
+        kind=SPOT_REBUILD,
+        symbol=symbol,
+        status=RUNNING,
+        worker=worker,
+        started_at=now,
+        heartbeat_at=now - timedelta(seconds=heartbeat_age),
+        attempts=1,
+    )
+    session.add(job)
+    session.commit()
+    return job
+
+
+def test_live_lease_is_not_reclaimed(app_session):
+    job = _running(app_session, "other:1:abc", heartbeat_age=1)
+    assert reclaim_expired(app_session) == 0
+    app_session.refresh(job)
+    assert (job.status, job.worker) == (RUNNING, "other:1:abc")
+
+
+def test_expired_lease_is_reclaimed_and_rerun(app_session):
+    job = _running(app_session, "other:1:abc", heartbeat_age=jobs.LEASE_SECONDS + 5)
+    assert reclaim_expired(app_session) == 1
+    app_session.refresh(job)
+    assert (job.status, job.worker, job.heartbeat_at) == (PENDING, None, None)
+
+    done = run_next()
+    assert done.id == job.id and done.status == "done" and done.attempts == 2
+
+
+def test_symbol_with_live_running_job_is_skipped(app_session):
+    _running(app_session, "other:1:abc", heartbeat_age=1)
+    blocked = Job(kind=SPOT_REBUILD, symbol="BTC")
+    other = Job(kind=SPOT_REBUILD, symbol="ETH")
+    app_session.add_all([blocked, other])
+    app_session.commit()
+
+    assert run_next().id == other.id
+    assert run_next() is None
+    app_session.refresh(blocked)
+    assert blocked.status == PENDING
+
+
+def test_result_discarded_when_lease_lost(app_session, monkeypatch):
+    job = Job(kind=SPOT_REBUILD, symbol="BTC")
+    app_session.add(job)
+    app_session.commit()
+
+    def steal(session, claimed):
+        # 模拟执行期间租约过期并被其它进程领走
+        session.connection().exec_driver_sql(
+            "UPDATE job SET worker = 'other:2:def' WHERE id = ?", (claimed.id,)
+        )
+
+    monkeypatch.setattr(jobs, "_execute", steal)
+    run_next()
+    app_session.expire_all()
+    row = app_session.exec(select(Job).where(Job.id == job.id)).one()
+    assert (row.status, row.worker) == (RUNNING, WORKER_ID)
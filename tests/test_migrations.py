@@ -0,0 +1,19 @@
+"""启动时的派生数据校验按结构版本只执行一次"""
+from sqlmodel import Session, create_engine
+
+from app.migrations import mark_synced, migrate, sync_pending
+
+
+def test_sync_marker_follows_schema_version(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(engine)
+    assert sync_pending(engine)
+    with Session(engine) as session:
+        mark_synced(session)
+        session.commit()
+        assert not sync_pending(session)
+        # 重复标记只更新同一行
+        mark_synced(session)
+        session.commit()
+    assert not sync_pending(engine)
+    engine.dispose()
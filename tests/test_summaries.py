@@ -0,0 +1,138 @@
+"""机器人利润、投入总额的 SQL 聚合与逐行求和（原来的 Python 实现）一致"""
+import math
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+from app.models import ContractBot, Investment, InvestmentPair
+from app.services import bots_profit_summary, invested_totals, overall_totals
+
+START = datetime(2024, 1, 1)
+SYMBOLS = ["BTC", "ETH", "SOL"]
+BOT_NAMES = [None, "grid-a", "grid-b"]
+
+
+def close(a: float, b: float) -> bool:
+    return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+
+
+@pytest.fixture
+def seeded(session):
+    rng = random.Random(7)
+    for pid in (1, 2):
+        for _ in range(200):
+            session.add(
+                ContractBot(
+                    portfolio_id=pid,
+                    bot_name=rng.choice(BOT_NAMES),
+                    symbol=rng.choice(SYMBOLS),
+                    profit=rng.uniform(-50, 80),
+                    closed_at=START + timedelta(hours=rng.randrange(24 * 60)),
+                )
+            )
+        for _ in range(100):
+            session.add(
+                Investment(
+                    portfolio_id=pid,
+                    currency=rng.choice(["USDT", "usdt", "MYR"]),
+                    amount=rng.uniform(-100, 500),
+                    invested_at=START + timedelta(hours=rng.randrange(24 * 60)),
+                )
+            )
+            session.add(
+                InvestmentPair(
+                    portfolio_id=pid,
+                    amount_usdt=rng.uniform(0, 300),
+                    amount_myr=rng.uniform(0, 1200),
+                    invested_at=START + timedelta(hours=rng.randrange(24 * 60)),
+                )
+            )
+    session.commit()
+    return session
+
+
+def _in_range(at, since, until) -> bool:
+    return (since is None or at >= since) and (until is None or at < until)
+
+
+RANGES = [
+    (None, None),
+    (START + timedelta(days=10), None),
+    (None, START + timedelta(days=30)),
+    (START + timedelta(days=10), START + timedelta(days=30)),
+    (START + timedelta(days=100), None),
+]
+
+
+@pytest.mark.parametrize("since,until", RANGES)
+@pytest.mark.parametrize("pid", [1, 2])
+def test_bots_profit_summary_matches_python_sums(seeded, pid, since, until):
+    bots = [
+        b
+        for b in seeded.exec(select(ContractBot).where(ContractBot.portfolio_id == pid))
+        if _in_range(b.closed_at, since, until)
+    ]
+    by_symbol: dict = defaultdict(float)
+    by_name: dict = defaultdict(float)
+    for b in bots:
+        by_symbol[b.symbol] += b.profit
+        by_name[b.bot_name] += b.profit
+
+    got = bots_profit_summary(seeded, since, until, portfolio_id=pid)
+
+    assert close(got.total_profit, sum(b.profit for b in bots))
+    assert [s for s, _ in got.by_symbol] == sorted(by_symbol)
+    for symbol, profit in got.by_symbol:
+        assert close(profit, by_symbol[symbol])
+    assert {n for n, _ in got.by_bot_name} == set(by_name)
+    for name, profit in got.by_bot_name:
+        assert close(profit, by_name[name])
+
+
+@pytest.mark.parametrize("as_of", [None, START + timedelta(days=20), START - timedelta(days=1)])
+@pytest.mark.parametrize("pid", [1, 2])
+def test_invested_totals_match_python_sums(seeded, pid, as_of):
+    def included(at):
+        return as_of is None or at <= as_of
+
+    singles = [
+        i
+        for i in seeded.exec(select(Investment).where(Investment.portfolio_id == pid))
+        if included(i.invested_at)
+    ]
+    pairs = [
+        p
+        for p in seeded.exec(select(InvestmentPair).where(InvestmentPair.portfolio_id == pid))
+        if included(p.invested_at)
+    ]
+    usdt = sum(i.amount for i in singles if i.currency.upper() == "USDT")
+    usdt += sum(p.amount_usdt for p in pairs)
+    myr = sum(i.amount for i in singles if i.currency.upper() == "MYR")
+    myr += sum(p.amount_myr for p in pairs)
+
+    got_usdt, got_myr = invested_totals(seeded, as_of, portfolio_id=pid)
+
+    assert close(got_usdt, usdt)
+    assert close(got_myr, myr)
+
+
+@pytest.mark.parametrize("pid", [1, 2])
+def test_overall_totals_bots_and_investments(seeded, pid):
+    bots = seeded.exec(select(ContractBot).where(ContractBot.portfolio_id == pid)).all()
+    usdt, myr = invested_totals(seeded, portfolio_id=pid)
+
+    got = overall_totals(seeded, portfolio_id=pid)
+
+    assert close(got["bots_profit"], sum(b.profit for b in bots))
+    assert close(got["invest_usdt"], usdt)
+    assert close(got["invest_myr"], myr)
+
+
+def test_empty_portfolio_totals_are_zero(session):
+    got = bots_profit_summary(session, portfolio_id=1)
+    assert got.total_profit == 0.0
+    assert got.by_symbol == [] and got.by_bot_name == []
+    assert invested_totals(session, portfolio_id=1) == (0.0, 0.0)
@@ -0,0 +1,198 @@
+"""列式成交存储：与数据库一致，其它进程写入后增量追赶，只在必要时整组重新加载"""
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import Session, select
+
+from app import tradestore
+from app.cache import SPOT, SPOT_REWRITES, bump_versions
+from app.models import SpotTrade
+from app.services import SPOT_TRADE_COLUMNS
+from app.tradestore import TradeStore
+
+START = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """全新的存储（提交后的更新也写入它），记录整组加载和追赶的次数"""
+    s = TradeStore()
+    s.loads = s.catch_ups = 0
+    load, catch_up = s._load, s._catch_up
+
+    def counted_load(*a):
+        s.loads += 1
+        return load(*a)
+
+    def counted_catch_up(*a):
+        s.catch_ups += 1
+        return catch_up(*a)
+
+    monkeypatch.setattr(s, "_load", counted_load)
+    monkeypatch.setattr(s, "_catch_up", counted_catch_up)
+    monkeypatch.setattr(tradestore, "trade_store", s)
+    return s
+
+
+def _add(session, pid, symbol, minutes, stage=None, **kw):
+    """写入一笔成交；stage 为存储时按写接口的方式登记（本进程写入），否则相当于其它进程写入"""
+    trade = SpotTrade(
+        portfolio_id=pid,
+        symbol=symbol,
+        side=kw.get("side", "BUY"),
+        quantity=kw.get("quantity", 1.0),
+        price=kw.get("price", 10.0),
+        fee=kw.get("fee"),
+        fee_currency="quote",
+        traded_at=START + timedelta(minutes=minutes),
+        note=kw.get("note"),
+    )
+    session.add(trade)
+    session.flush()
+    bump_versions(session, SPOT, portfolio_id=pid)
+    if stage is not None:
+        stage.stage(session, pid, added=[trade])
+    session.commit()
+    return trade
+
+
+def _delete(session, trade, stage=None):
+    session.delete(trade)
+    session.flush()
+    bump_versions(session, SPOT, SPOT_REWRITES, portfolio_id=trade.portfolio_id)
+    if stage is not None:
+        stage.stage(session, trade.portfolio_id, removed=[trade])
+    session.commit()
+
+
+def _db_rows(session, pid):
+    rows = session.exec(
+        select(*SPOT_TRADE_COLUMNS)
+        .where(SpotTrade.portfolio_id == pid)
+        .order_by(SpotTrade.symbol, SpotTrade.traded_at, SpotTrade.id)
+    ).all()
+    return [tuple(r) for r in rows]
+
+
+def _store_rows(store, session, pid):
+    rows = store.trades(session, pid)
+    return sorted((tuple(r) for r in rows), key=lambda r: (r[0], r[6], r[7]))
+
+
+def test_matches_database(session, store):
+    for i in range(30):
+        _add(session, 1, ["BTC", "ETH"][i % 2], (i * 7) % 30, fee=None if i % 3 else 0.5, note="n" if i % 4 else None)
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)
+    assert store.trades(session, 1, "BTC", until=START + timedelta(minutes=10)) == [
+        r for r in store.trades(session, 1, "BTC") if r.traded_at <= START + timedelta(minutes=10)
+    ]
+
+
+def test_own_writes_apply_without_reading_the_database(session, store):
+    _add(session, 1, "BTC", 0)
+    store.trades(session, 1)
+    trade = _add(session, 1, "BTC", 5, stage=store)
+    _delete(session, _add(session, 1, "ETH", 1, stage=store), stage=store)
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)
+    assert (store.loads, store.catch_ups) == (1, 0)
+    assert trade.id in {r.id for r in store.trades(session, 1)}
+
+
+def test_other_process_inserts_are_caught_up_incrementally(session, store):
+    for i in range(5):
+        _add(session, 1, "BTC", i)
+    store.trades(session, 1)
+    # 其它进程写入：没有登记，只改了版本号；包括早于已有成交的乱序插入
+    _add(session, 1, "BTC", 100)
+    _add(session, 1, "SOL", -5)
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)
+    assert (store.loads, store.catch_ups) == (1, 1)
+
+
+def test_other_process_delete_forces_reload(session, store):
+    trades = [_add(session, 1, "BTC", i) for i in range(5)]
+    store.trades(session, 1)
+    _delete(session, trades[2])
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)
+    assert store.loads == 2
+
+
+def test_other_process_delete_and_reused_id_forces_reload(session, store):
+    trades = [_add(session, 1, "BTC", i) for i in range(3)]
+    store.trades(session, 1)
+    # 删除最大 id 后 SQLite 把同一个 id 分给新成交：水位以下的 count / sum(id) 都不变
+    _delete(session, trades[-1])
+    reused = _add(session, 1, "ETH", 50, price=99.0)
+    assert reused.id == trades[-1].id
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)
+    assert store.loads == 2
+
+
+def test_other_process_update_forces_reload(session, store):
+    trade = _add(session, 1, "BTC", 0)
+    store.trades(session, 1)
+    trade.price = 12.5
+    bump_versions(session, SPOT, SPOT_REWRITES, portfolio_id=1)
+    session.commit()
+    assert [r.price for r in store.trades(session, 1)] == [12.5]
+
+
+def test_own_write_after_missed_write_still_catches_up(session, store):
+    _add(session, 1, "BTC", 0)
+    store.trades(session, 1)
+    missed = _add(session, 1, "BTC", 1)  # 其它进程
+    _delete(session, _add(session, 1, "BTC", 2, stage=store), stage=store)
+    _add(session, 1, "ETH", 3, stage=store)
+    rows = _store_rows(store, session, 1)
+    assert rows == _db_rows(session, 1)
+    assert missed.id in {r[7] for r in rows}
+    assert store.loads == 1
+
+
+def test_loading_one_portfolio_does_not_block_others(session, store):
+    _add(session, 1, "BTC", 0)
+    _add(session, 2, "ETH", 0)
+    store.trades(session, 2)
+    store.trades(session, 1)
+    book = store._books[1]
+    done = threading.Event()
+    with book.lock:  # 组合 1 正在加载
+        t = threading.Thread(target=lambda: (store.trades(session, 2), done.set()))
+        t.start()
+        assert done.wait(5)
+    t.join()
+
+
+def test_database_reads_do_not_hold_the_portfolio_lock(session, store, monkeypatch):
+    _add(session, 1, "BTC", 0)
+    store.trades(session, 1)
+    _add(session, 1, "BTC", 1)  # 其它进程写入，下次读取需要追赶
+    reading, release = threading.Event(), threading.Event()
+    catch_up = store._catch_up
+
+    def slow_catch_up(*a):
+        reading.set()
+        assert release.wait(5)
+        return catch_up(*a)
+
+    monkeypatch.setattr(store, "_catch_up", slow_catch_up)
+
+    def read():
+        with Session(session.get_bind()) as other:
+            store.trades(other, 1)
+
+    t = threading.Thread(target=read)
+    t.start()
+    try:
+        assert reading.wait(5)
+        # 追赶正在读数据库：组合锁空闲，本进程的写入提交后照常应用
+        book = store._books[1]
+        assert book.lock.acquire(timeout=1)
+        book.lock.release()
+        _add(session, 1, "ETH", 2, stage=store)
+    finally:
+        release.set()
+        t.join(5)
+    assert not t.is_alive()
+    assert _store_rows(store, session, 1) == _db_rows(session, 1)